@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Daraja.settings')
 
 application = get_asgi_application()
+
+# Oldida nginx bo'lmasa statik fayllarni ham shu yerdan berish (`runserver --insecure` kabi)
+if os.getenv('SERVE_STATIC') == '1':
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
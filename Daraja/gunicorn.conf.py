@@ -0,0 +1,29 @@
+"""
+Production uchun ASGI server: gunicorn jarayonlarni boshqaradi, har bir worker uvicorn
+(asyncio) — SSE ulanishlari (stock_events) thread band qilmaydi. Sinxron view'lar
+(sotuv, qabul) Django thread pool'ida ishlaydi.
+
+    gunicorn -c Daraja/gunicorn.conf.py Daraja.asgi:application
+
+Bir nechta worker bo'lganda kesh umumiy bo'lishi kerak (REDIS_URL), aks holda qoldiq
+versiyasi har jarayonda alohida. Jonli yangilanishlar brokeri jarayon ichida: sotuv boshqa
+workerda bo'lsa, ochiq oqim uni keyingi ping'da umumiy keshdagi versiya orqali ko'radi
+va sahifani yangilaydi. REDIS_URL berilmasa WEB_CONCURRENCY=1 qo'ying.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# SSE ulanishlari uzoq yashaydi, shuning uchun timeout faqat osilib qolgan workerlar uchun
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Xotira sizib chiqsa ham workerlar vaqti-vaqti bilan yangilanadi
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = '-'
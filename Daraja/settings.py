@@ -1,6 +1,10 @@
 import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-7(7-25-3av_1s*_b9!6qlx7_fi@dn$i+v4m^j!=5h922lnbf#x'
@@ -18,10 +22,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'apps',
     'rangefilter',
-    'psycopg2',
 ]
 
 MIDDLEWARE = [
+    'apps.middleware.QueryTimingMiddleware',
+    'apps.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,12 +56,81 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'Daraja.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Baza sozlamalari muhit o'zgaruvchilaridan olinadi:
+#   DB_ENGINE=postgres DB_NAME=daraja DB_USER=... DB_PASSWORD=... DB_HOST=localhost DB_PORT=5432
+#   DB_CONN_MAX_AGE — ulanishni necha soniya qayta ishlatish (0 — har so'rovda yangi ulanish)
+#   DB_PGBOUNCER=1 — PgBouncer (transaction pooling) orqali ulanganda
+#   SQLITE_WAL=0 — SQLite'da WAL rejimini o'chirish (odatda yoqiq, pastdagi SQLITE_PRAGMAS ga qarang)
+#   DB_REPLICA_HOST (postgres) yoki DB_REPLICA_NAME (sqlite fayli) — ixtiyoriy o'qish replikasi
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'daraja'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # PgBouncer transaction rejimida server-side kursorlar ishlamaydi
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER') == '1',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.getenv('DB_REPLICA_HOST'),
+            'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # "database is locked" o'rniga qulf bo'shashini kutish (soniya)
+                'timeout': 20,
+            },
+            # Parallel sotuv testlari uchun faylli baza (in-memory baza jadvalni butunlay qulflaydi)
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
+    if os.getenv('DB_REPLICA_NAME'):
+        # Mahalliy sinov: replika — primary faylining nusxasi (`make replica`)
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.getenv('DB_REPLICA_NAME'),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Replika bo'lsa hisobot o'qishlari (admin tarix, jami, eksport) unga yo'naltiriladi (apps.db)
+DATABASE_REPLICA = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['apps.db.ReplicaRouter']
+# Yozuvdan keyin shu brauzer o'qishlari necha soniya primary'da qoladi (apps.middleware.PrimaryPinMiddleware)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Har bir yangi SQLite ulanishida bajariladi (apps.db.configure_sqlite)
+SQLITE_PRAGMAS = {
+    'busy_timeout': 20000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'journal_mode': 'WAL',  # o'quvchilar yozuvchini kutmaydi
+    'synchronous': 'NORMAL',  # WAL bilan xavfsiz, har commit'da fsync yo'q
 }
+# SQLITE_WAL=0 — WAL'siz: baza tarmoq fayl tizimida (NFS/SMB, WAL umumiy xotira talab qiladi) yoki
+# faylni bitta nusxada ko'chirish kerak bo'lsa. journal_mode fayl ichida saqlanib qoladi, shuning uchun
+# oldin WAL'da bo'lgan baza ham DELETE rejimiga qaytariladi
+if os.getenv('SQLITE_WAL') == '0':
+    SQLITE_PRAGMAS.update({'journal_mode': 'DELETE', 'synchronous': 'FULL'})
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -93,3 +167,67 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Kesh: standart holatda jarayon ichidagi LocMem (MAX_ENTRIES dan oshsa eskilari o'chiriladi).
+# Bir nechta worker jarayoni bo'lsa qoldiq versiyasi umumiy bo'lishi uchun REDIS_URL bering.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'TIMEOUT': 600,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'daraja',
+            'TIMEOUT': 600,
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1000)),
+                'CULL_FREQUENCY': 3,
+            },
+        }
+    }
+
+# Mahsulotlar jadvalida bir sahifadagi partiyalar soni (har sklad uchun)
+PRODUCT_LIST_PAGE_SIZE = int(os.getenv('PRODUCT_LIST_PAGE_SIZE', 100))
+
+# Admin tarix sahifalarida qatorlar soni shuncha soniya keshlanadi (PostgreSQL'da EXPLAIN bahosi)
+HISTORY_COUNT_CACHE_SECONDS = int(os.getenv('HISTORY_COUNT_CACHE_SECONDS', 60))
+
+# Telegram xabarlari (apps.notifications, `manage.py send_notifications`)
+TELEGRAM_TOKEN = os.getenv('TOKEN')
+TELEGRAM_CHAT_ID = os.getenv('ID')
+TELEGRAM_CLIENT = os.getenv('TELEGRAM_CLIENT', 'apps.notifications.TelegramClient')
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 100))
+NOTIFICATION_RATE = float(os.getenv('NOTIFICATION_RATE', 1))  # xabar / soniya
+NOTIFICATION_POLL_INTERVAL = float(os.getenv('NOTIFICATION_POLL_INTERVAL', 2))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 8))
+NOTIFICATION_RETRY_DELAY = 5  # soniya, har urinishda ikki barobar oshadi
+NOTIFICATION_MAX_RETRY_DELAY = 600
+NOTIFICATION_LEASE = 60
+
+# Qoldiq snapshotlari (apps.snapshots, `manage.py snapshot_stock`): necha kunda bir
+STOCK_SNAPSHOT_INTERVAL = int(os.getenv('STOCK_SNAPSHOT_INTERVAL', 7))
+
+# Shu kundan eski tarix oylik bo'laklarga arxivlanadi (apps.archive, `manage.py archive_history`)
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', 365))
+
+# So'rovlarni o'lchash (apps.middleware.QueryTimingMiddleware), o'chiq bo'lsa hech narsa qilmaydi
+PERF_INSTRUMENTATION = os.getenv('PERF_INSTRUMENTATION') == '1'
+PERF_SLOW_REQUEST_MS = float(os.getenv('PERF_SLOW_REQUEST_MS', 500))
+PERF_N_PLUS_ONE_THRESHOLD = int(os.getenv('PERF_N_PLUS_ONE_THRESHOLD', 5))  # bir xil SQL necha marta
+PERF_SLOWEST_QUERIES = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'apps.perf': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -1,13 +1,29 @@
+from datetime import date
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.admin.widgets import AdminTextInputWidget
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
 from django.db.models import Sum, F
 from django.template.response import TemplateResponse  # TemplateResponse import qilish
+from django.urls import path
+from django.utils import timezone
 from django.utils.html import format_html
 from rangefilter.filters import DateRangeFilter
 
-from .models import ProductHistory, FinishProductHistory, Category, FinishCategory
+from .exports import stream_history_csv
+from .archive import search_archive
+from .db import replica_reads
+from .form import ArchiveSearchForm, StockAtForm
+from .pagination import encode_cursor, estimated_count, older_than, parse_date_cursor
+from .models import ProductHistory, FinishProductHistory, Category, FinishCategory, HistoryRollup, CategoryValuation
+from .rollups import totals
+from .search import search_categories
+from .snapshots import archive_boundary, stock_at
+from .valuation import FIELDS, refresh_stale
 
 
 # ===================== Custom Admin Site =======================
@@ -34,17 +50,306 @@ def update_total_price(queryset):
         'total'] or 0
 
 
+def rollup_total_price(request, cl, warehouse):
+    """
+    Changelist filtrlari bo'yicha umumiy narxni kunlik yig'indidan (HistoryRollup) olish.
+    Ro'yxatdagidek faqat jonli tarix: arxivlangan oylar (apps.archive) yig'indiga kirmaydi.
+    """
+    filters = {}
+    if cl.query:
+        filters['category_id__in'] = search_categories(warehouse, request.user, cl.query).values('id')
+    for spec in cl.filter_specs:
+        if isinstance(spec, DateRangeFilter):
+            if spec.form.is_valid():
+                if spec.form.cleaned_data.get(spec.lookup_kwarg_gte):
+                    filters['day__gte'] = spec.form.cleaned_data[spec.lookup_kwarg_gte]
+                if spec.form.cleaned_data.get(spec.lookup_kwarg_lte):
+                    filters['day__lte'] = spec.form.cleaned_data[spec.lookup_kwarg_lte]
+        elif spec.field_path == 'status':
+            if spec.lookup_val:
+                filters['status'] = spec.lookup_val
+        elif spec.field_path == 'nomi':
+            if spec.lookup_val:
+                filters['category_id'] = spec.lookup_val
+            elif spec.lookup_val_isnull:
+                filters['category_id__isnull'] = True
+
+    boundary = archive_boundary(warehouse)
+    if boundary and filters.get('day__gte', boundary) <= boundary:
+        filters['day__gte'] = boundary
+    return totals(request.user, warehouse, **filters)['summa'] or 0
+
+
+# ===================== Tarixni CSV ga eksport qilish =======================
+class HistoryExportMixin:
+    """Changelist filtrlari (sana, holat, nomi, qidiruv) bilan tarixni CSV qilib yuklab olish"""
+    change_list_template = 'admin/history_change_list.html'
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='%s_%s_export' % info),
+        ] + super().get_urls()
+
+    def get_export_queryset(self, request):
+        """
+        Changelist filtrlari va qidiruvi qo'llangan tarix. ChangeList'ning ``get_results``i chaqirilmaydi:
+        sahifa va COUNT so'rovlarisiz, eksport faqat oqimdagi SELECT'ni bajaradi
+        """
+        changelist = type('ExportChangeList', (self.get_changelist(request),),
+                          {'get_results': lambda cl, request: None})
+        list_display = self.get_list_display(request)
+        cl = changelist(
+            request, self.model, list_display, self.get_list_display_links(request, list_display),
+            self.get_list_filter(request), self.date_hierarchy, self.get_search_fields(request),
+            self.get_list_select_related(request), self.list_per_page, self.list_max_show_all,
+            self.list_editable, self, self.get_sortable_by(request), self.search_help_text,
+        )
+        return cl.queryset
+
+    def export_view(self, request):
+        queryset = self.get_export_queryset(request)
+        filename = f"{self.model._meta.model_name}_{timezone.localdate():%Y-%m-%d}.csv"
+        # Oqim view qaytgandan keyin o'qiladi, shuning uchun baza hozir tanlanadi (replika yoki primary)
+        return stream_history_csv(queryset.using(queryset.db), filename)
+
+
+# ===================== Sanadagi qoldiq =======================
+class StockAtMixin:
+    """Tanlangan kun oxiridagi qoldiq: eng yaqin snapshot + undan keyingi tarix"""
+    warehouse = None
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('stock-at/', self.admin_site.admin_view(self.stock_at_view), name='%s_%s_stock_at' % info),
+        ] + super().get_urls()
+
+    def stock_at_view(self, request):
+        form = StockAtForm(request.GET or {'sana': date.today()})
+        day = form.cleaned_data['sana'] if form.is_valid() else date.today()
+        snapshot_day, stock = stock_at(self.warehouse, day, user=request.user)
+
+        category_model = self.model._meta.get_field('nomi').related_model
+        names = dict(category_model.objects.filter(id__in={category_id for category_id, _ in stock})
+                     .values_list('id', 'nomi'))
+        rows = sorted(
+            ({'nomi': names.get(category_id, '—'), 'narxi': narxi, 'soni': soni, 'summa': narxi * soni}
+             for (category_id, narxi), soni in stock.items()),
+            key=lambda row: (row['nomi'], row['narxi']),
+        )
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"{day:%Y-%m-%d} kuni oxiridagi qoldiq",
+            'form': form,
+            'rows': rows,
+            'snapshot_day': snapshot_day,
+            'total_soni': sum(row['soni'] for row in rows),
+            'total_summa': sum(row['summa'] for row in rows),
+        }
+        return TemplateResponse(request, 'admin/stock_at.html', context)
+
+
+class ArchiveSearchMixin:
+    """Arxivlangan (issiq jadvaldan ko'chirilgan) tarix qatorlari bo'yicha qidiruv"""
+    warehouse = None
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('archive/', self.admin_site.admin_view(self.archive_view), name='%s_%s_archive' % info),
+        ] + super().get_urls()
+
+    def archive_view(self, request):
+        form = ArchiveSearchForm(request.GET)
+        rows, count, soni, summa = [], 0, 0, 0
+        if form.is_valid():
+            data = form.cleaned_data
+            rows, count, soni, summa = search_archive(
+                self.warehouse, request.user, data['month_from'], data['month_to'], data['q'], data['status'])
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Tarix arxivi",
+            'form': form,
+            'rows': rows,
+            'count': count,
+            'total_soni': soni,
+            'total_summa': summa,
+        }
+        return TemplateResponse(request, 'admin/history_archive.html', context)
+
+
+class ValuationMixin:
+    """
+    Kategoriyalarning joriy qiymati va sotilgan tovar tannarxi (o'rtacha tortilgan va FIFO).
+    Qiymatlar tarix yozilganda yig'iladi (apps.valuation), sahifa faqat ularni o'qiydi.
+    """
+    warehouse = None
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('valuation/', self.admin_site.admin_view(self.valuation_view), name='%s_%s_valuation' % info),
+        ] + super().get_urls()
+
+    def valuation_view(self, request):
+        # Tahrirlangan yoki o'chirilgan tarixi bor kategoriyalar avval qayta hisoblanadi
+        refresh_stale(self.warehouse, request.user)
+        valuations = list(CategoryValuation.objects.filter(warehouse=self.warehouse, user=request.user))
+
+        category_model = self.model._meta.get_field('nomi').related_model
+        names = dict(category_model.objects.filter(id__in={valuation.category_id for valuation in valuations})
+                     .values_list('id', 'nomi'))
+        rows = sorted(({'nomi': names.get(valuation.category_id, '—'),
+                        **{field: getattr(valuation, field) for field in FIELDS}} for valuation in valuations),
+                      key=lambda row: row['nomi'])
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Qoldiq qiymati va tannarx",
+            'rows': rows,
+            'totals': {field: sum(row[field] for row in rows) for field in FIELDS},
+        }
+        return TemplateResponse(request, 'admin/valuation.html', context)
+
+
+class ReplicaReadsMixin:
+    """Tarix sahifalari, jami, eksport va hisobotlarning GET so'rovlari replikadan o'qiladi"""
+    replica_views = ('changelist', 'export', 'stock_at', 'archive')
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        names = {'%s_%s_%s' % (*info, view) for view in self.replica_views}
+        urls = super().get_urls()
+        for url in urls:
+            if getattr(url, 'name', None) in names:
+                url.callback = replica_reads(url.callback)
+        return urls
+
+
+class KeysetChangeList(ChangeList):
+    """
+    OFFSET o'rniga (created_at, id) bo'yicha keyset sahifalar (``?after=sana_id``): chuqur sahifa
+    birinchisi kabi bitta indeksli so'rov. Soni taxminiy (apps.pagination.estimated_count),
+    ``?count=exact`` bo'lsa aniq. Tartib doim eng yangisidan.
+    """
+    keyset_params = ('after', 'count')
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for param in self.keyset_params:
+            lookup_params.pop(param, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        return ['-created_at', '-pk']
+
+    def get_results(self, request):
+        cursor = parse_date_cursor(self.params.get('after'))
+        page = older_than(self.queryset, *cursor) if cursor else self.queryset
+        self.result_list = page[:self.list_per_page]
+        rows = list(self.result_list)
+
+        self.next_cursor = None
+        if len(rows) == self.list_per_page and older_than(page, rows[-1].created_at, rows[-1].pk).exists():
+            self.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+        if cursor is None and self.next_cursor is None:
+            # Bitta sahifa: soni aniq va bepul
+            self.result_count, self.count_exact = len(rows), True
+        else:
+            self.result_count, self.count_exact = estimated_count(
+                self.queryset, exact=self.params.get('count') == 'exact')
+
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = cursor is not None or self.next_cursor is not None
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.has_previous = cursor is not None
+
+    def next_page_url(self):
+        return self.get_query_string({'after': self.next_cursor}, ['count']) if self.next_cursor else ''
+
+    def first_page_url(self):
+        return self.get_query_string(remove=list(self.keyset_params))
+
+    def exact_count_url(self):
+        return self.get_query_string({'count': 'exact'})
+
+
+class KeysetPaginationMixin:
+    """Katta tarix jadvali uchun: ikki COUNT va OFFSET'siz changelist (KeysetChangeList)"""
+    ordering = ('-created_at', '-id')
+    sortable_by = ()
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+# ===================== Kategoriya qidiruvi =======================
+class CategoryAutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    ``nomi`` filtri: yon panelga barcha kategoriyalar o'rniga autocomplete qidiruv chiqadi
+    (apps.search), bazadan faqat tanlangan kategoriya o'qiladi
+    """
+    template = 'admin/category_autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.warehouse = model_admin.warehouse
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def has_output(self):
+        return True
+
+    def field_choices(self, field, request, model_admin):
+        if not str(self.lookup_val or '').isdigit():
+            return []
+        return list(field.related_model.objects.filter(pk=self.lookup_val, user=request.user)
+                    .values_list('pk', 'nomi'))
+
+
+class CategorySearchMixin:
+    """
+    Changelist qidiruvi kategoriya nomi boshlanishi bo'yicha: ``LIKE '%x%'`` JOIN o'rniga
+    (user, nomi_norm) indeksidan olingan kategoriyalar subquery'si. CategoryAutocompleteFilter
+    uchun select2 fayllari ham shu yerda ulanadi.
+    """
+    warehouse = None
+
+    @property
+    def media(self):
+        extra = '' if settings.DEBUG else '.min'
+        return super().media + forms.Media(
+            js=[f'admin/js/vendor/jquery/jquery{extra}.js', f'admin/js/vendor/select2/select2.full{extra}.js',
+                'admin/js/jquery.init.js'],
+            css={'screen': ['admin/css/vendor/select2/select2.min.css', 'admin/css/autocomplete.css']},
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        categories = search_categories(self.warehouse, request.user, search_term)
+        return queryset.filter(nomi__in=categories.values('id')), False
+
+
 # ===================== 1 - Product History =======================
 @admin.register(ProductHistory, site=custom_admin_site)
-class ProductHistoryAdmin(admin.ModelAdmin):
+class ProductHistoryAdmin(ReplicaReadsMixin, KeysetPaginationMixin, CategorySearchMixin, ValuationMixin,
+                          ArchiveSearchMixin, StockAtMixin, HistoryExportMixin, admin.ModelAdmin):
+    warehouse = HistoryRollup.Warehouse.SKLAD_1
     list_display = ('get_nomi', 'soni', 'status_button', 'narxi', 'status',)
     list_filter = [
         ("created_at", DateRangeFilter),
         'status',
-        'nomi',
+        ('nomi', CategoryAutocompleteFilter),
     ]
     list_editable = ('status',)
-    search_fields = ('nomi__nomi',)
+    list_select_related = ('nomi',)  # get_nomi har qator uchun alohida so'rov qilmasin
+    search_fields = ('nomi__nomi',)  # qidiruv oynasi uchun, qidiruvning o'zi CategorySearchMixin'da
 
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
@@ -57,8 +362,7 @@ class ProductHistoryAdmin(admin.ModelAdmin):
         # 🔹 `cl` obyekt mavjudligini tekshiramiz
         cl = response.context_data.get('cl', None)
         if cl is not None:
-            queryset = cl.queryset
-            total_price = update_total_price(queryset)
+            total_price = rollup_total_price(request, cl, HistoryRollup.Warehouse.SKLAD_1)
             extra_context['title'] = f"Umumiy mahsulotlar narxi: {total_price:,} so'm"
 
             # 🔹 `context_data` ni yangilaymiz
@@ -90,19 +394,22 @@ class ProductHistoryAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.filter(nomi__user=request.user)
+        return queryset.filter(user=request.user)
 
 
 # ===================== 2 - Finish Product History =======================
 @admin.register(FinishProductHistory, site=custom_admin_site)
-class FinishProductHistoryAdmin(admin.ModelAdmin):
+class FinishProductHistoryAdmin(ReplicaReadsMixin, KeysetPaginationMixin, CategorySearchMixin, ValuationMixin,
+                                ArchiveSearchMixin, StockAtMixin, HistoryExportMixin, admin.ModelAdmin):
+    warehouse = HistoryRollup.Warehouse.SKLAD_2
     list_display = ('get_nomi', 'soni', 'status_button', 'formatted_date', 'narxi')
     list_filter = (
         ('created_at', DateRangeFilter),
         'status',
-        'nomi',
+        ('nomi', CategoryAutocompleteFilter),
     )
-    search_fields = ('nomi__nomi',)
+    list_select_related = ('nomi',)  # get_nomi har qator uchun alohida so'rov qilmasin
+    search_fields = ('nomi__nomi',)  # qidiruv oynasi uchun, qidiruvning o'zi CategorySearchMixin'da
 
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
@@ -117,8 +424,7 @@ class FinishProductHistoryAdmin(admin.ModelAdmin):
         # 🔹 `cl` obyekt mavjudligini tekshiramiz
         cl = response.context_data.get('cl', None)
         if cl is not None:
-            queryset = cl.queryset
-            total_price = update_total_price(queryset)
+            total_price = rollup_total_price(request, cl, HistoryRollup.Warehouse.SKLAD_2)
             extra_context['title'] = f"Umumiy mahsulotlar narxi: {total_price:,} so'm"
 
             # 🔹 `context_data` ni yangilaymiz
@@ -155,7 +461,7 @@ class FinishProductHistoryAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.filter(nomi__user=request.user)
+        return queryset.filter(user=request.user)
 
 
 # ===================== 3 - Category va FinishCategory =======================
@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from .models import CategoryValuation
+from .notifications import enqueue
+from .services import WAREHOUSES
+
+
+def is_low(valuation):
+    return bool(valuation.threshold) and valuation.soni <= valuation.threshold
+
+
+def update_alerts(warehouse, valuations):
+    """
+    Yangilangan kategoriyalar qoldig'ini chegarasi bilan solishtirish (so'rovsiz). Qoldiq chegaradan
+    pastga tushganda bir marta xabar navbatga qo'yiladi, qayta to'ldirilgach ``alerted`` tushadi.
+    ``alerted`` ni chaqiruvchi saqlaydi. Qaytaradi: chegarani endi kesib o'tganlar
+    """
+    crossed = []
+    for valuation in valuations:
+        low = is_low(valuation)
+        if low and not valuation.alerted:
+            crossed.append(valuation)
+        valuation.alerted = low
+    if crossed:
+        notify(warehouse, crossed)
+    return crossed
+
+
+def category_names(warehouse, category_ids):
+    _, history_model = WAREHOUSES[warehouse]
+    category_model = history_model._meta.get_field('nomi').related_model
+    return dict(category_model.objects.filter(id__in=category_ids).values_list('id', 'nomi'))
+
+
+def low_line(valuation, names):
+    return f"{names.get(valuation.category_id, '—')}: {valuation.soni} ta (minimal {valuation.threshold})"
+
+
+def notify(warehouse, crossed):
+    names = category_names(warehouse, {valuation.category_id for valuation in crossed})
+    lines = defaultdict(list)
+    for valuation in crossed:
+        lines[valuation.user_id].append(low_line(valuation, names))
+    for user_id, user_lines in lines.items():
+        enqueue(f"⚠️ {warehouse}-Sklad: qoldiq kam qoldi\n" + "\n".join(user_lines), user_id=user_id)
+
+
+def threshold_changed(warehouse, category):
+    """Kategoriya chegarasi o'zgardi: valuation nusxasi yangilanadi va qoldiq shu zahoti tekshiriladi"""
+    valuation = CategoryValuation.objects.filter(warehouse=warehouse, category_id=category.pk).first()
+    if valuation is None or valuation.threshold == category.min_soni:
+        return
+    valuation.threshold = category.min_soni
+    update_alerts(warehouse, [valuation])
+    valuation.save(update_fields=['threshold', 'alerted'])
+
+
+def daily_summary():
+    """
+    Hozir chegaradan past bo'lgan barcha kategoriyalar, har foydalanuvchiga bitta xabar.
+    Faqat ``alerted`` qatorlar o'qiladi (qisman indeks). Qaytaradi: navbatga qo'yilgan xabarlar soni
+    """
+    low = list(CategoryValuation.objects.filter(alerted=True).order_by('user_id', 'warehouse', 'category_id'))
+    names = {warehouse: category_names(warehouse, {valuation.category_id for valuation in low
+                                                   if valuation.warehouse == warehouse})
+             for warehouse in {valuation.warehouse for valuation in low}}
+    lines = defaultdict(list)
+    for valuation in low:
+        line = low_line(valuation, names[valuation.warehouse])
+        lines[valuation.user_id].append(f"{valuation.warehouse}-Sklad {line}")
+    for user_id, user_lines in lines.items():
+        enqueue("📋 Kam qolgan mahsulotlar\n" + "\n".join(user_lines), user_id=user_id)
+    return len(lines)
@@ -0,0 +1,119 @@
+import csv
+import gzip
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+
+from .models import HistoryArchive
+from .services import WAREHOUSES
+from .snapshots import next_month, take_snapshot
+
+COLUMNS = ('id', 'created_at', 'nomi_id', 'nomi', 'status', 'soni', 'narxi')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def pack(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return gzip.compress(buffer.getvalue().encode('utf-8'))
+
+
+def unpack(data):
+    for row in csv.reader(io.StringIO(gzip.decompress(bytes(data)).decode('utf-8'))):
+        record = dict(zip(COLUMNS, row))
+        record['created_at'] = date.fromisoformat(record['created_at'])
+        record['soni'] = int(record['soni'])
+        record['narxi'] = Decimal(record['narxi'])
+        yield record
+
+
+def raw_delete(model, ids, chunk_size):
+    """
+    Signal'larsiz o'chirish: arxivlangan qatorlar kunlik yig'indidan (HistoryRollup) ayirilmasin
+    va snapshotlar eskirmasin.
+    """
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def write_partition(warehouse, user_id, month, rows, chunk_size):
+    """Bitta (foydalanuvchi, oy) bo'lagini arxivga qo'shish va qatorlarni issiq jadvaldan o'chirish"""
+    _, history_model = WAREHOUSES[warehouse]
+    with transaction.atomic():
+        archive = (HistoryArchive.objects.select_for_update()
+                   .filter(warehouse=warehouse, user_id=user_id, month=month).first())
+        if archive is None:
+            archive = HistoryArchive(warehouse=warehouse, user_id=user_id, month=month)
+            existing = []
+        else:
+            existing = [[record[column] for column in COLUMNS] for record in unpack(archive.data)]
+
+        all_rows = existing + rows
+        archive.data = pack(all_rows)
+        archive.rows = len(all_rows)
+        archive.soni = sum(int(row[5]) for row in all_rows)
+        archive.summa = sum(int(row[5]) * Decimal(row[6]) for row in all_rows)
+        archive.save()
+        raw_delete(history_model, [row[0] for row in rows], chunk_size)
+
+
+def archive_history(warehouse, before, chunk_size=2000):
+    """
+    ``before`` dan (oy boshiga yaxlitlanadi) oldingi tarix qatorlarini oylik siqilgan bo'laklarga
+    ko'chirish. Avval chegarada snapshot olinadi, shunda ``stock_at`` keyingi sanalar uchun
+    to'g'ri qoladi. Qaytaradi: arxivlangan qatorlar soni
+    """
+    before = month_start(before)
+    _, history_model = WAREHOUSES[warehouse]
+    with transaction.atomic():
+        take_snapshot(warehouse, before - timedelta(days=1))
+
+    old = history_model.objects.filter(created_at__lt=before)
+    partitions = sorted({(user_id, month_start(day)) for user_id, day in
+                         old.values_list('user_id', 'created_at').distinct().order_by()},
+                        key=lambda key: (key[0] is None, key[0] or 0, key[1]))
+    archived = 0
+    for user_id, month in partitions:
+        rows = [list(row) for row in
+                old.filter(user_id=user_id, created_at__gte=month, created_at__lt=next_month(month))
+                .order_by('created_at', 'id')
+                .values_list('id', 'created_at', 'nomi_id', 'nomi__nomi', 'status', 'soni', 'narxi')]
+        write_partition(warehouse, user_id, month, rows, chunk_size)
+        archived += len(rows)
+    return archived
+
+
+def search_archive(warehouse, user, month_from=None, month_to=None, query='', status=None, limit=500):
+    """
+    Arxivdan qidirish: kerakli oylar bo'laklari ochiladi va filtrlanadi.
+    Qaytaradi: (qatorlar [limit gacha], jami topilganlar soni, jami soni, jami summa)
+    """
+    archives = HistoryArchive.objects.filter(warehouse=warehouse, user=user).order_by('month')
+    if month_from:
+        archives = archives.filter(month__gte=month_start(month_from))
+    if month_to:
+        archives = archives.filter(month__lte=month_start(month_to))
+
+    query = query.lower()
+    found, count, soni, summa = [], 0, 0, Decimal(0)
+    for archive in archives.iterator():
+        for record in unpack(archive.data):
+            if query and query not in record['nomi'].lower():
+                continue
+            if status and record['status'] != status:
+                continue
+            count += 1
+            soni += record['soni']
+            summa += record['soni'] * record['narxi']
+            if len(found) < limit:
+                found.append(record)
+    return found, count, soni, summa
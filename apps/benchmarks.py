@@ -0,0 +1,206 @@
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from .models import Category, FinishCategory, Product, FinishProduct, ProductHistory, FinishProductHistory
+from .notifications import FakeTelegramClient, RateLimiter, process_batch
+
+# Sklad raqami -> (kategoriya, mahsulot, tarix modellari)
+MODELS = {
+    1: (Category, Product, ProductHistory),
+    2: (FinishCategory, FinishProduct, FinishProductHistory),
+}
+
+
+def seed(users=5, categories=50, lots=4, history=100_000, chunk_size=5000, days=365):
+    """
+    Benchmark uchun ma'lumot: har foydalanuvchiga har skladda ``categories`` ta
+    kategoriya, har kategoriyaga ``lots`` ta partiya va jami ``history`` ta tarix qatori.
+    Qaytaradi: {username: {warehouse: [(product_id, category_id, narxi), ...]}}
+    """
+    rng = random.Random(0)
+    today = date.today()
+    data = {}
+    for u in range(users):
+        user = User.objects.create_superuser(f"bench_{u}", password='bench')
+        for warehouse, (category_model, model, _) in MODELS.items():
+            created = category_model.objects.bulk_create(
+                [category_model(nomi=f"Kategoriya {warehouse}-{i}", user=user) for i in range(categories)])
+            model.objects.bulk_create([
+                model(nomi=category, soni=10 ** 6, narxi=1000 * (j + 1))
+                for category in created for j in range(lots)
+            ], batch_size=chunk_size)
+        data[user.username] = lots_of(user)
+
+    lots_all = [(warehouse, lot) for user_lots in data.values() for warehouse, items in user_lots.items()
+                for lot in items]
+    for i in range(0, history, chunk_size):
+        batch = {1: [], 2: []}
+        for _ in range(min(chunk_size, history - i)):
+            warehouse, (_, category_id, narxi) = rng.choice(lots_all)
+            history_model = MODELS[warehouse][2]
+            batch[warehouse].append(history_model(
+                nomi_id=category_id, soni=rng.randint(1, 20), narxi=narxi,
+                status=rng.choice(history_model.StatusType.values),
+                created_at=today - timedelta(days=rng.randrange(days)),
+            ))
+        for warehouse, rows in batch.items():
+            MODELS[warehouse][2].objects.bulk_create(rows)
+    return data
+
+
+def lots_of(user):
+    return {warehouse: list(model.objects.filter(user=user).values_list('id', 'nomi_id', 'narxi'))
+            for warehouse, (_, model, _) in MODELS.items()}
+
+
+def load():
+    """Oldin tayyorlangan (``--keepdb``) ma'lumotni o'qish"""
+    return {user.username: lots_of(user) for user in User.objects.filter(username__startswith='bench_')}
+
+
+# Joriy so'rov SQL hisoblagichi: har klient thread'i o'z hisobini yuritadi
+query_counter = ContextVar('bench_query_counter', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def measure(call):
+    """Sinxron so'rov: (soniya, SQL soni, natija)"""
+    counter = [0]
+    token = query_counter.set(counter)
+    try:
+        started = time.perf_counter()
+        result = call()
+        return time.perf_counter() - started, counter[0], result
+    finally:
+        query_counter.reset(token)
+
+
+def percentile(values, p):
+    """Eng yaqin rang (nearest-rank) bo'yicha foizli qiymat"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def ok_json(response):
+    return response.status_code == 200 and response.json().get('success') is True
+
+
+def sell(url_name, warehouse):
+    def request(client, lots, rng):
+        product_id, _, _ = rng.choice(lots[warehouse])
+        response = client.post(reverse(url_name), data={'product_id': product_id, 'decrease_amount': 1},
+                               content_type='application/json')
+        return ok_json(response)
+    return request
+
+
+def receipt(url_name, warehouse):
+    def request(client, lots, rng):
+        _, category_id, narxi = rng.choice(lots[warehouse])
+        response = client.post(reverse(url_name), {'nomi': category_id, 'soni': rng.randint(1, 20), 'narxi': narxi})
+        return response.status_code == 302
+    return request
+
+
+def page(url_name):
+    def request(client, lots, rng):
+        return client.get(reverse(url_name)).status_code == 200
+    return request
+
+
+# Nomi -> so'rov funksiyasi(client, partiyalar, rng) -> muvaffaqiyatli yoki yo'q
+ENDPOINTS = {
+    'product_list': page('product_list'),
+    'sell_product': sell('sell_product', 1),
+    'sell_finish_product': sell('sell_finish_product', 2),
+    'product_create': receipt('product_create', 1),
+    'finish_product_create': receipt('finish_product_create', 2),
+    'admin_product_history': page('custom_admin:apps_producthistory_changelist'),
+    'admin_finish_history': page('custom_admin:apps_finishproducthistory_changelist'),
+}
+
+
+def run(name, data, clients=8, requests=200):
+    """
+    Bitta endpointga ``clients`` ta parallel klient bilan jami ``requests`` ta so'rov yuborish.
+    Har bir klient o'z foydalanuvchisi va o'z DB ulanishida ishlaydi.
+    """
+    endpoint = ENDPOINTS[name]
+    usernames = sorted(data)
+
+    def worker(number):
+        rng = random.Random(number)
+        username = usernames[number % len(usernames)]
+        client = Client()
+        client.force_login(User.objects.get(username=username))
+        timings, queries, errors = [], [], 0
+        try:
+            for _ in range(requests // clients + (number < requests % clients)):
+                elapsed, count, success = measure(lambda: endpoint(client, data[username], rng))
+                timings.append(elapsed)
+                queries.append(count)
+                errors += not success
+        finally:
+            connection.close()
+        return timings, queries, errors
+
+    connection_created.connect(install_query_counter)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(worker, range(clients)))
+    return summarize(name, results, time.perf_counter() - started)
+
+
+def drain_notifications(batch_size=100):
+    """Navbatdagi xabarlarni soxta Telegram klienti bilan yuborish (partiya = so'rov)"""
+    client, limiter = FakeTelegramClient(), RateLimiter(0)
+    timings, queries = [], []
+    started = time.perf_counter()
+    install_query_counter(None, connection)
+    while True:
+        elapsed, count, sent = measure(lambda: process_batch(client=client, batch_size=batch_size, limiter=limiter))
+        if not sent:
+            break
+        timings.append(elapsed)
+        queries.append(count)
+    return summarize('send_notifications', [(timings, queries, 0)], time.perf_counter() - started)
+
+
+def summarize(name, results, elapsed):
+    timings = [t for result in results for t in result[0]]
+    queries = [q for result in results for q in result[1]]
+    count = len(timings)
+    return {
+        'endpoint': name,
+        'requests': count,
+        'errors': sum(result[2] for result in results),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'rps': round(count / elapsed, 1) if elapsed else 0,
+        'queries_avg': round(sum(queries) / count, 1) if count else 0,
+        'queries_max': max(queries, default=0),
+    }
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Yangi SQLite ulanishiga ``SQLITE_PRAGMAS`` ni qo'llash (connection_created signali)"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+# Joriy so'rov o'qishlari qayerdan: None — primary, REPLICA — replika, PRIMARY — primary'ga
+# mahkamlangan (replika yoqilgan view ichida ham)
+REPLICA, PRIMARY = 'replica', 'primary'
+reads = ContextVar('db_reads', default=None)
+
+
+@contextmanager
+def use_replica():
+    """Blok ichidagi o'qishlar replikaga (``DATABASE_REPLICA`` bo'lsa va pin bo'lmasa)"""
+    if reads.get() == PRIMARY:
+        yield
+        return
+    token = reads.set(REPLICA)
+    try:
+        yield
+    finally:
+        reads.reset(token)
+
+
+@contextmanager
+def pin_to_primary():
+    """Blok (yoki dekoratsiya qilingan funksiya) ichida hamma o'qishlar primary'dan"""
+    token = reads.set(PRIMARY)
+    try:
+        yield
+    finally:
+        reads.reset(token)
+
+
+def replica_reads(view):
+    """
+    GET/HEAD so'rovlarini replikadan o'qish. TemplateResponse shu yerda render qilinadi,
+    aks holda shablondagi so'rovlar blokdan tashqarida (primary'da) bajariladi.
+    Boshqa metodlar (yozuv va undan keyingi o'qish) primary'da qoladi.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        if hasattr(request, 'user'):
+            # Sessiya va foydalanuvchi (lazy) shu yerda primary'dan yuklanadi: replika kechiksa
+            # yangi login yo'qolmasin
+            request.user.is_authenticated
+        with use_replica():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Yozuvlar doim primary'ga. O'qishlar faqat ``use_replica`` bloki ichida replikaga,
+    qolganlari (sotuv, qabul, ularning read-after-write o'qishlari) primary'da.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reads.get() == REPLICA and settings.DATABASE_REPLICA:
+            return settings.DATABASE_REPLICA
+        # None — Django bog'liq obyektni o'zi o'qilgan bazadan oladi, bo'lmasa default
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, settings.DATABASE_REPLICA}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.DATABASE_REPLICA
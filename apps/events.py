@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .stock_cache import stock_version
+
+# Brauzer uzilgan ulanishni qancha vaqtda qayta ochishi (ms) va jim ulanishga ping oralig'i (s)
+RETRY_MS = 3000
+KEEPALIVE = 15
+
+
+class Subscriber:
+    """Bitta ochiq sahifa: o'z event loop'idagi cheklangan navbat"""
+
+    def __init__(self, maxsize=100):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        # Faqat subscriber loop'i ichida chaqiriladi
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Sekin mijoz: hodisalarni yig'ib o'tirmaymiz, sahifa to'liq yangilansin
+            self.overflowed = True
+
+
+class Broker:
+    """
+    Jarayon ichidagi pub/sub: sinxron view'lar (worker thread'lar) ``publish`` qiladi,
+    ASGI loop'idagi SSE ulanishlari ``subscribe`` qiladi. Har mijoz uchun thread yo'q —
+    faqat navbat. Boshqa worker jarayonidagi o'zgarishlar bu yerga kelmaydi — ularni
+    ``stream`` umumiy keshdagi versiya orqali ushlaydi.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # user_id -> {Subscriber, ...}
+
+    def subscribe(self, user_id):
+        subscriber = Subscriber()
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(user_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.put, event)
+            except RuntimeError:
+                # Loop yopilgan — ulanish allaqachon tugagan
+                self.unsubscribe(user_id, subscriber)
+
+
+broker = Broker()
+
+
+def publish_stock(user_id, items):
+    """
+    Qoldiq o'zgarishini tranzaksiya commit bo'lgandan keyin ochiq sahifalarga yuborish.
+    items: [{'warehouse', 'product_id', 'soni', 'nomi', 'narxi'}, ...]
+    """
+    def send():
+        broker.publish(user_id, {'version': str(stock_version(user_id)), 'items': items})
+    transaction.on_commit(send)
+
+
+def lot_item(warehouse, product_id, soni, nomi, narxi):
+    return {'warehouse': warehouse, 'product_id': product_id, 'soni': soni, 'nomi': nomi, 'narxi': str(narxi)}
+
+
+def format_event(data, event=None):
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(user_id, version, keepalive=KEEPALIVE):
+    """
+    SSE oqimi: avval joriy versiya (``hello``), keyin har commitdan keyingi o'zgarishlar.
+    Navbat to'lib qolsa ``reload`` yuboriladi va oqim tugaydi. Jim paytda versiya keshdan
+    tekshiriladi: u boshqa worker'da o'zgargan bo'lsa ham ``reload`` yuboriladi.
+    """
+    subscriber = broker.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MS}\n" + format_event({'version': str(version)}, 'hello')
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                if str(await sync_to_async(stock_version)(user_id)) != str(version):
+                    yield format_event({}, 'reload')
+                    return
+                yield ": ping\n\n"
+                continue
+            if subscriber.overflowed:
+                yield format_event({}, 'reload')
+                return
+            version = event['version']
+            yield format_event(event, 'stock')
+    finally:
+        broker.unsubscribe(user_id, subscriber)
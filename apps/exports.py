@@ -0,0 +1,33 @@
+import csv
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+HEADER = ('Sana', 'Nomi', 'Holat', 'Soni', 'Narxi', 'Summa')
+
+
+class Echo:
+    """csv.writer uchun fayl o'rnida: yozilgan qatorni o'zini qaytaradi"""
+
+    def write(self, value):
+        return value
+
+
+def history_rows(queryset, chunk_size=2000):
+    """
+    Tarix qatorlarini bazadan bo'laklab o'qish. Butun queryset xotiraga
+    yuklanmaydi, shuning uchun eksport hajmi xotiraga ta'sir qilmaydi.
+    """
+    statuses = dict(queryset.model.StatusType.choices)
+    rows = queryset.order_by('created_at', 'id').values_list('created_at', 'nomi__nomi', 'status', 'soni', 'narxi')
+    for created_at, nomi, status, soni, narxi in rows.iterator(chunk_size=chunk_size):
+        yield created_at, nomi or '', statuses.get(status, status), soni, narxi, soni * narxi
+
+
+def stream_history_csv(queryset, filename, chunk_size=2000):
+    writer = csv.writer(Echo())
+    # BOM — Excel faylni UTF-8 sifatida ochishi uchun
+    lines = chain(['\ufeff'], (writer.writerow(row) for row in chain([HEADER], history_rows(queryset, chunk_size))))
+    response = StreamingHttpResponse(lines, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
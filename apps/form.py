@@ -1,18 +1,39 @@
 from django import forms
 
-from apps.models import FinishProduct, Product
+from apps.models import Category, FinishCategory, ProductHistory
 
 
-class FinishProductModelForm(forms.ModelForm):
-    class Meta:
-        model = FinishProduct
-        fields = '__all__'
+class ReceiptForm(forms.Form):
+    # ModelForm emas: mavjud (nomi, narxi) partiyaga qo'shiladi, unique cheklovi xato bermasligi kerak
+    soni = forms.IntegerField(min_value=1)
+    narxi = forms.DecimalField(max_digits=9, decimal_places=2, min_value=0)
 
 
-class ProductForm(forms.ModelForm):
-    class Meta:
-        model = Product
-        fields = '__all__'
+class FinishProductForm(ReceiptForm):
+    nomi = forms.ModelChoiceField(queryset=FinishCategory.objects.all())
+
+
+class ProductForm(ReceiptForm):
+    nomi = forms.ModelChoiceField(queryset=Category.objects.all())
+
+
+class StockAtForm(forms.Form):
+    sana = forms.DateField(label='Sana', widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+class MonthInput(forms.DateInput):
+    input_type = 'month'
+
+    def __init__(self, attrs=None):
+        super().__init__(attrs, format='%Y-%m')
+
+
+class ArchiveSearchForm(forms.Form):
+    month_from = forms.DateField(label='Oydan', required=False, widget=MonthInput, input_formats=['%Y-%m'])
+    month_to = forms.DateField(label='Oygacha', required=False, widget=MonthInput, input_formats=['%Y-%m'])
+    q = forms.CharField(label='Nomi', required=False)
+    status = forms.ChoiceField(label='Holat', required=False,
+                               choices=[('', 'Hammasi')] + ProductHistory.StatusType.choices)
 
 
 class AdminLoginForm(forms.Form):
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.archive import archive_history, month_start
+from apps.services import WAREHOUSES
+
+
+class Command(BaseCommand):
+    help = ("--days kundan eski tarix qatorlarini oylik siqilgan bo'laklarga (HistoryArchive) ko'chirish. "
+            "Kunlik yig'indilar saqlanadi. Cron orqali oyiga bir marta ishga tushiring.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Issiq jadvalda qoladigan kunlar (standart: HISTORY_RETENTION_DAYS)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        days = settings.HISTORY_RETENTION_DAYS if options['days'] is None else options['days']
+        if days < 1:
+            raise CommandError("--days musbat bo'lishi kerak")
+
+        before = month_start(date.today() - timedelta(days=days))
+        for warehouse in WAREHOUSES:
+            archived = archive_history(warehouse, before, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{warehouse}-Sklad: {before} dan oldingi {archived} ta tarix qatori arxivlandi"))
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from apps.benchmarks import ENDPOINTS, drain_notifications, load, run, seed
+
+
+class Command(BaseCommand):
+    help = ("Asosiy sahifa va endpointlar uchun yuklama testi: alohida test bazasini ma'lumot bilan to'ldirib, "
+            "har bir endpointga parallel klientlar bilan so'rov yuboradi va p50/p95/p99, so'rov/s hamda "
+            "SQL so'rovlar sonini chiqaradi. Telegram o'rniga soxta klient ishlatiladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=50, help="Har foydalanuvchi va sklad uchun")
+        parser.add_argument('--lots', type=int, default=4, help="Har kategoriya uchun partiyalar")
+        parser.add_argument('--history', type=int, default=1_000_000, help="Jami tarix qatorlari")
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help="Har endpoint uchun")
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS),
+                            default=list(ENDPOINTS))
+        parser.add_argument('--json', help="Natijani JSON faylga yozish (CI uchun)")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Test bazasini saqlab qolish va keyingi safar qayta to'ldirmaslik")
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError("--clients va --requests musbat bo'lishi kerak")
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(TELEGRAM_CLIENT='apps.notifications.FakeTelegramClient',
+                                   TELEGRAM_CHAT_ID='bench'):
+                data = self.prepare(options)
+                results = [run(name, data, options['clients'], options['requests'])
+                           for name in options['endpoints']]
+                results.append(drain_notifications())
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.report(results)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {key: options[key] for key in (
+                    'users', 'categories', 'lots', 'history', 'clients', 'requests')}, 'results': results}, f, indent=2)
+        if any(r['errors'] for r in results):
+            raise CommandError("Ba'zi so'rovlar xato bilan tugadi")
+
+    def prepare(self, options):
+        if options['keepdb'] and User.objects.filter(username__startswith='bench_').exists():
+            return load()
+        started = time.perf_counter()
+        data = seed(options['users'], options['categories'], options['lots'], options['history'])
+        self.stdout.write(f"Ma'lumot tayyorlandi: {time.perf_counter() - started:.1f} s")
+        return data
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<26} {'so`rov':>7} {'xato':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'so`rov/s':>9} {'SQL o`rt.':>9} {'SQL max':>8}")
+        for r in results:
+            line = (f"{r['endpoint']:<26} {r['requests']:>7} {r['errors']:>5} {r['p50_ms']:>8.1f} "
+                    f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['rps']:>9.1f} {r['queries_avg']:>9.1f} "
+                    f"{r['queries_max']:>8}")
+            self.stdout.write(self.style.ERROR(line) if r['errors'] else line)
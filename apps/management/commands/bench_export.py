@@ -0,0 +1,91 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apps.exports import stream_history_csv
+from apps.models import Category, ProductHistory
+
+
+def peak_rss():
+    """Jarayon rezident xotirasining eng yuqori qiymati, baytda (Linux'da ru_maxrss KB, macOS'da bayt)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Command(BaseCommand):
+    help = ("CSV eksportining xotira sarfini o'lchash: har xil hajmdagi tarix uchun eksport qilib, "
+            "har biri uchun jarayonning eng yuqori RSS'ini (ru_maxrss) chiqaradi. Har o'lcham alohida "
+            "jarayonda eksport qilinadi, chunki ru_maxrss faqat o'sadi. Ma'lumotlar alohida test bazasiga "
+            "yoziladi va oxirida baza o'chiriladi — ishchi bazaga tegilmaydi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        # Ichki: bitta o'lchamni yangi jarayonda eksport qilish
+        parser.add_argument('--worker-database', help=argparse.SUPPRESS)
+        parser.add_argument('--worker-user', type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker_database']:
+            return self.worker(options['worker_database'], options['worker_user'], options['chunk_size'])
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # Xotiradagi test bazasini boshqa jarayon ko'rmaydi
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(),
+                                                                  f'bench_export_{os.getpid()}.sqlite3')
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = User.objects.create(username='bench_export')
+            categories = Category.objects.bulk_create([Category(nomi=f"Kategoriya {i}", user=user)
+                                                       for i in range(50)])
+            seeded = 0
+            self.stdout.write(f"{'qatorlar':>10} {'soniya':>8} {'MB':>8} {'RSS oldin MB':>13} {'peak RSS MB':>12}")
+            for size in sorted(options['sizes']):
+                seeded += self.seed(categories, size - seeded, options['chunk_size'])
+                self.report(test_name, user, size, options['chunk_size'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self, categories, count, chunk_size):
+        created = 0
+        while created < count:
+            batch = min(chunk_size * 5, count - created)
+            ProductHistory.objects.bulk_create([
+                ProductHistory(nomi=categories[(created + i) % len(categories)], soni=i % 7 + 1, narxi=1000 + i % 100)
+                for i in range(batch)
+            ])
+            created += batch
+        return created
+
+    def report(self, test_name, user, size, chunk_size):
+        output = subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_export', '--chunk-size', str(chunk_size),
+             '--worker-database', test_name, '--worker-user', str(user.pk)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        elapsed, written, baseline, peak = output.split()
+        self.stdout.write(f"{size:>10} {float(elapsed):>8.2f} {int(written) / 2 ** 20:>8.1f} "
+                          f"{int(baseline) / 2 ** 20:>13.1f} {int(peak) / 2 ** 20:>12.1f}")
+
+    def worker(self, database, user_id, chunk_size):
+        connection.close()
+        connection.settings_dict['NAME'] = database
+        queryset = ProductHistory.objects.filter(user_id=user_id)
+        baseline = peak_rss()
+        started = time.perf_counter()
+        written = sum(len(chunk) for chunk in stream_history_csv(queryset, 'bench.csv', chunk_size))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{elapsed} {written} {baseline} {peak_rss()}")
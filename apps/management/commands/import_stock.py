@@ -0,0 +1,40 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.stock_import import StockImportError, import_history, import_stock, read_rows
+
+
+class Command(BaseCommand):
+    help = ("CSV/JSON fayldan kategoriya, qoldiq va tarixni yuklash. Ustunlar: sklad (1 yoki 2), nomi, soni, narxi; "
+            "--history bilan qo'shimcha status (qabul/chiqdi) va sana (YYYY-MM-DD)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Ma'lumotlar egasi (username)")
+        parser.add_argument('--history', action='store_true',
+                            help="Eski harakatlarni yuklash (partiyalarga ham qo'llanadi)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Foydalanuvchi topilmadi: {options['user']}")
+
+        started = time.perf_counter()
+        rows = read_rows(options['path'])
+        try:
+            if options['history']:
+                import_history(rows, user, options['chunk_size'])
+                result = f"{len(rows)} ta tarix qatori yuklandi"
+            else:
+                created, updated = import_stock(rows, user, options['chunk_size'])
+                result = f"{created} ta yangi partiya, {updated} ta partiya to'ldirildi"
+        except StockImportError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{result}: {len(rows)} qator, {elapsed:.2f} s, {len(rows) / elapsed:,.0f} qator/s"))
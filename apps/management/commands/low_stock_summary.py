@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.alerts import daily_summary
+
+
+class Command(BaseCommand):
+    help = "Chegaradan kam qolgan kategoriyalar ro'yxatini har foydalanuvchiga navbatga qo'yish (kuniga bir marta)"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            sent = daily_summary()
+        self.stdout.write(self.style.SUCCESS(f"{sent} ta foydalanuvchiga xabar navbatga qo'yildi"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Kunlik hisobot jadvalini (HistoryRollup) butun tarixdan qaytadan qurish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{created} ta yig'indi qatori yaratildi"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.services import WAREHOUSES
+from apps.valuation import check
+
+
+class Command(BaseCommand):
+    help = "Kategoriyalar qiymatini (o'rtacha tortilgan va FIFO) butun tarixdan qayta hisoblab tekshirish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Faqat tekshirish: farq bo'lsa xato bilan tugaydi, hech narsa yozilmaydi")
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for warehouse in WAREHOUSES:
+            mismatches = check(warehouse, fix=not options['check'])
+            for category_id, actual, expected in mismatches:
+                self.stdout.write(f"Sklad {warehouse}, kategoriya {category_id}: {actual} != {expected}")
+            mismatched += len(mismatches)
+
+        if options['check'] and mismatched:
+            raise CommandError(f"{mismatched} ta kategoriya qiymati tarixga mos emas")
+        if mismatched:
+            self.stdout.write(self.style.SUCCESS(f"{mismatched} ta kategoriya qayta hisoblandi"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Barcha qiymatlar tarixga mos"))
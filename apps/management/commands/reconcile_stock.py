@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.reconcile import reconcile
+from apps.services import WAREHOUSES
+
+
+class Command(BaseCommand):
+    help = ("Partiyalar qoldig'ini tarix bilan solishtirish (har sklad uchun bitta guruhlangan so'rov). "
+            "Standart holatda faqat hisobot (dry-run), --fix bilan farqlar tarix bo'yicha tuzatiladi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Farqlarni tuzatish")
+        parser.add_argument('--warehouse', type=int, choices=sorted(WAREHOUSES))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--json', help="Hisobotni JSON faylga yozish")
+
+    def handle(self, *args, **options):
+        warehouses = [options['warehouse']] if options['warehouse'] else list(WAREHOUSES)
+        report = []
+        for warehouse in warehouses:
+            report += reconcile(warehouse, fix=options['fix'], chunk_size=options['chunk_size'])
+
+        for row in report:
+            narxi = row['narxi'] or 'hisoblagich'
+            self.stdout.write(f"{row['warehouse']}-Sklad, kategoriya {row['category_id']} ({narxi}): "
+                              f"{row['soni']} -> {row['expected']} [{row['action']}]")
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump({'fixed': options['fix'], 'discrepancies': report}, f, indent=2)
+
+        if not report:
+            self.stdout.write(self.style.SUCCESS("Qoldiq tarix bilan mos"))
+        elif options['fix']:
+            fixed = sum(row['action'] != 'negative' for row in report)
+            self.stdout.write(self.style.SUCCESS(f"{fixed} ta partiya tuzatildi, {len(report) - fixed} ta "
+                                                 f"manfiy qoldiq qo'lda tekshirilsin"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(report)} ta farq topildi (--fix bilan tuzating)"))
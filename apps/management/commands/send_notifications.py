@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.notifications import RateLimiter, get_client, process_batch
+
+
+class Command(BaseCommand):
+    help = "Telegram xabarlar navbatini partiyalab yuborish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Navbatni bir marta bo'shatib to'xtash")
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE)
+        parser.add_argument('--rate', type=float, default=settings.NOTIFICATION_RATE,
+                            help="Soniyasiga yuboriladigan xabarlar soni")
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATION_POLL_INTERVAL,
+                            help="Navbat bo'sh bo'lganda kutish (soniya)")
+
+    def handle(self, *args, **options):
+        client = get_client()
+        limiter = RateLimiter(options['rate'])
+
+        while True:
+            sent = process_batch(client=client, batch_size=options['batch_size'], limiter=limiter)
+            if sent:
+                self.stdout.write(f"{sent} ta xabar yuborildi")
+            if options['once']:
+                if not sent:
+                    break
+                continue
+            if not sent:
+                time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.models import StockSnapshot
+from apps.services import WAREHOUSES
+from apps.snapshots import archive_boundary, build_snapshots, compact
+
+
+class Command(BaseCommand):
+    help = ("Qoldiq snapshotlarini yaratish: oxirgi snapshotdan kechagacha har --interval kunda bittadan. "
+            "--compact-after bilan eski snapshotlar siyraklashtiriladi. Cron orqali har kuni ishga tushiring.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, help="Kunlar (standart: STOCK_SNAPSHOT_INTERVAL)")
+        parser.add_argument('--until', type=date.fromisoformat, help="Oxirgi snapshot sanasi (YYYY-MM-DD)")
+        parser.add_argument('--rebuild', action='store_true', help="Barcha snapshotlarni o'chirib qaytadan qurish")
+        parser.add_argument('--compact-after', type=int, metavar='DAYS',
+                            help="Shu kundan eski snapshotlarni siyraklashtirish")
+        parser.add_argument('--compact-interval', type=int, default=30, metavar='DAYS',
+                            help="Siyraklashtirilgan qismda snapshotlar oralig'i")
+
+    def handle(self, *args, **options):
+        if options['interval'] is not None and options['interval'] < 1:
+            raise CommandError("--interval musbat bo'lishi kerak")
+
+        if options['rebuild']:
+            deleted = 0
+            with transaction.atomic():
+                for warehouse in WAREHOUSES:
+                    snapshots = StockSnapshot.objects.filter(warehouse=warehouse)
+                    boundary = archive_boundary(warehouse)
+                    if boundary:
+                        # Arxiv chegarasidagi snapshot — arxivlangan tarixning yagona izi
+                        snapshots = snapshots.filter(day__gte=boundary)
+                    deleted += snapshots.delete()[0]
+            self.stdout.write(f"{deleted} ta snapshot qatori o'chirildi")
+
+        created = build_snapshots(options['interval'], options['until'])
+        for warehouse, count in created.items():
+            self.stdout.write(self.style.SUCCESS(f"{warehouse}-Sklad: {count} ta snapshot kuni yaratildi"))
+
+        if options['compact_after'] is not None:
+            removed = compact(options['compact_after'], options['compact_interval'])
+            self.stdout.write(self.style.SUCCESS(f"{removed} ta eski snapshot kuni o'chirildi"))
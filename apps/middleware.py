@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import ExitStack, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .db import pin_to_primary
+
+logger = logging.getLogger('apps.perf')
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` — so'rov vaqtini va takrorlangan SQL ni yig'adi"""
+
+    def __init__(self):
+        self.queries = []  # (vaqt soniyada, sql, alias)
+        self.seen = {}  # sql -> necha marta
+        self.call_sites = {}  # takrorlangan sql -> birinchi takrorlangan joy
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, sql, context['connection'].alias))
+            count = self.seen[sql] = self.seen.get(sql, 0) + 1
+            if count == 2:
+                # Stack faqat takrorlanganda olinadi, oddiy so'rovlarga qo'shimcha xarajat yo'q
+                self.call_sites[sql] = call_site()
+
+
+def call_site():
+    """
+    So'rovni chaqirgan joy: shablon tugunining qatori yoki loyiha kodidagi eng ichki
+    qator (Django va kutubxonalar o'tkazib yuboriladi).
+    """
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        node = frame.f_locals.get('self') if code.co_name == 'render_annotated' else None
+        if getattr(node, 'origin', None) and getattr(node, 'token', None):
+            return f"{os.path.relpath(node.origin.name, base_dir)}:{node.token.lineno}"
+        if code.co_filename.startswith(base_dir) and 'site-packages' not in code.co_filename \
+                and code.co_filename != __file__:
+            return f"{os.path.relpath(code.co_filename, base_dir)}:{frame.f_lineno} {code.co_name}"
+        frame = frame.f_back
+    return ''
+
+
+class QueryTimingMiddleware:
+    """
+    So'rov ichidagi SQL soni, DB vaqti, eng sekin so'rovlar va view vaqtini o'lchash.
+    ``Server-Timing`` sarlavhasiga yoziladi, ``PERF_SLOW_REQUEST_MS`` dan sekin so'rovlar
+    ``apps.perf`` loggeriga JSON qatori bo'lib tushadi. ``PERF_INSTRUMENTATION`` o'chiq
+    bo'lsa middleware umuman yuklanmaydi.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        db_time = sum(duration for duration, _, _ in recorder.queries)
+        response['Server-Timing'] = ", ".join([
+            f'db;dur={db_time * 1000:.1f};desc="{len(recorder.queries)} queries"',
+            f'view;dur={total * 1000:.1f}',
+        ])
+
+        repeated = [
+            {'sql': sql, 'count': count, 'call_site': recorder.call_sites[sql]}
+            for sql, count in recorder.seen.items() if count >= settings.PERF_N_PLUS_ONE_THRESHOLD
+        ]
+        if total * 1000 >= settings.PERF_SLOW_REQUEST_MS or repeated:
+            slowest = sorted(recorder.queries, key=lambda query: query[0], reverse=True)
+            logger.warning(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'view_ms': round(total * 1000, 1),
+                'db_ms': round(db_time * 1000, 1),
+                'queries': len(recorder.queries),
+                'slowest': [{'ms': round(duration * 1000, 2), 'sql': sql, 'db': alias}
+                            for duration, sql, alias in slowest[:settings.PERF_SLOWEST_QUERIES]],
+                'n_plus_one': repeated,
+            }, ensure_ascii=False))
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Read-after-write: yozuv so'rovi (POST va h.k.) butunlay primary'da ishlaydi, muvaffaqiyatli
+    yozuvdan keyin ``REPLICA_PIN_SECONDS`` davomida shu brauzerning so'rovlari ham (cookie
+    bo'yicha) primary'dan o'qiydi — replika kechikishi foydalanuvchiga ko'rinmaydi.
+    ``DATABASE_REPLICA`` bo'lmasa middleware yuklanmaydi.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie = 'pin_primary'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICA:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def pinned(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') or self.cookie in request.COOKIES
+
+    def remember(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(self.cookie, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pin_to_primary() if self.pinned(request) else nullcontext():
+            response = self.get_response(request)
+        return self.remember(request, response)
+
+    async def __acall__(self, request):
+        with pin_to_primary() if self.pinned(request) else nullcontext():
+            response = await self.get_response(request)
+        return self.remember(request, response)
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0003_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warehouse', models.PositiveSmallIntegerField(choices=[(1, '1 - Sklad'), (2, '2 - Sklad')], verbose_name='Sklad')),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('day', models.DateField(verbose_name='Sana')),
+                ('status', models.CharField(choices=[('chiqdi', 'Chiqdi'), ('qabul', 'Qabul')], max_length=100, verbose_name='Holat')),
+                ('soni', models.BigIntegerField(default=0)),
+                ('summa', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Kunlik hisobot',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='historyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'warehouse', 'category_id', 'day', 'status'), name='unique_history_rollup'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0004_historyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='finishproducthistory',
+            index=models.Index(fields=['nomi', 'created_at'], name='finishhistory_nomi_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finishproducthistory',
+            index=models.Index(fields=['nomi', 'status', 'created_at'], name='finishhistory_nomi_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producthistory',
+            index=models.Index(fields=['nomi', 'created_at'], name='producthistory_nomi_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producthistory',
+            index=models.Index(fields=['nomi', 'status', 'created_at'], name='producthistory_nomi_status_idx'),
+        ),
+    ]
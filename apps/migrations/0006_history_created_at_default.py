@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:40
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0005_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='finishproducthistory',
+            name='created_at',
+            field=models.DateField(default=datetime.date.today, editable=False, verbose_name='Sana'),
+        ),
+        migrations.AlterField(
+            model_name='producthistory',
+            name='created_at',
+            field=models.DateField(default=datetime.date.today, editable=False, verbose_name='Sana'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lots(apps, schema_editor):
+    """Bir xil (nomi, narxi) partiyalarni eng kichik id'li qatorga qo'shib, qolganlarini o'chirish"""
+    for model_name in ('Product', 'FinishProduct'):
+        model = apps.get_model('apps', model_name)
+        duplicates = (model.objects.filter(nomi__isnull=False)
+                      .values('nomi_id', 'narxi')
+                      .annotate(count=Count('id'), keep_id=Min('id'), total=Sum('soni'))
+                      .filter(count__gt=1))
+        for lot in duplicates:
+            model.objects.filter(id=lot['keep_id']).update(soni=lot['total'])
+            model.objects.filter(nomi_id=lot['nomi_id'], narxi=lot['narxi']).exclude(id=lot['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_history_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='finishproduct',
+            constraint=models.UniqueConstraint(fields=('nomi', 'narxi'), name='unique_finishproduct_lot'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('nomi', 'narxi'), name='unique_product_lot'),
+        ),
+    ]
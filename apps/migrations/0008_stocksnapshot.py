@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0007_unique_product_lot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warehouse', models.PositiveSmallIntegerField(choices=[(1, '1 - Sklad'), (2, '2 - Sklad')], verbose_name='Sklad')),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('narxi', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('day', models.DateField(verbose_name='Sana')),
+                ('soni', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Qoldiq snapshotlari',
+                'indexes': [models.Index(fields=['warehouse', 'day'], name='stocksnapshot_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'category_id', 'narxi', 'day'), name='unique_stock_snapshot'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0008_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warehouse', models.PositiveSmallIntegerField(choices=[(1, '1 - Sklad'), (2, '2 - Sklad')], verbose_name='Sklad')),
+                ('month', models.DateField(verbose_name='Oy')),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('soni', models.BigIntegerField(default=0)),
+                ('summa', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Tarix arxivi',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='historyarchive',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'user', 'month'), name='unique_history_archive'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_users(apps, schema_editor):
+    """Mavjud qatorlarga kategoriya egasini bitta UPDATE ... (SELECT ...) bilan yozish"""
+    for model_name, category_name in (('Product', 'Category'), ('ProductHistory', 'Category'),
+                                      ('FinishProduct', 'FinishCategory'),
+                                      ('FinishProductHistory', 'FinishCategory')):
+        model = apps.get_model('apps', model_name)
+        category_model = apps.get_model('apps', category_name)
+        owner = category_model.objects.filter(pk=OuterRef('nomi_id')).values('user_id')[:1]
+        model.objects.filter(nomi__isnull=False).update(user_id=Subquery(owner))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0009_historyarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishproduct',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='finishproducthistory',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='producthistory',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_users, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='finishproduct',
+            index=models.Index(fields=['user', 'id'], name='finishproduct_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finishproducthistory',
+            index=models.Index(fields=['user', 'created_at'], name='finishhistory_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finishproducthistory',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='finishhistory_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producthistory',
+            index=models.Index(fields=['user', 'created_at'], name='producthistory_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producthistory',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='producthistory_user_status_idx'),
+        ),
+    ]
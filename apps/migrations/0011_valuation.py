@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0010_denormalize_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FifoLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warehouse', models.PositiveSmallIntegerField(choices=[(1, '1 - Sklad'), (2, '2 - Sklad')], verbose_name='Sklad')),
+                ('category_id', models.BigIntegerField()),
+                ('history_id', models.BigIntegerField()),
+                ('narxi', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('soni', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['warehouse', 'category_id', 'history_id'], name='fifolayer_order_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('warehouse', models.PositiveSmallIntegerField(choices=[(1, '1 - Sklad'), (2, '2 - Sklad')], verbose_name='Sklad')),
+                ('category_id', models.BigIntegerField()),
+                ('soni', models.BigIntegerField(default=0)),
+                ('average_value', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('average_cogs', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('fifo_value', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('fifo_cogs', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('stale', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Qoldiq qiymati',
+                'indexes': [models.Index(fields=['user', 'warehouse'], name='valuation_user_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='categoryvaluation',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'category_id'), name='unique_category_valuation'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0011_valuation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='min_soni',
+            field=models.PositiveIntegerField(default=0, help_text="Qoldiq shundan kam yoki teng bo'lsa ogohlantiriladi (0 — o'chiq)", verbose_name='Minimal qoldiq'),
+        ),
+        migrations.AddField(
+            model_name='categoryvaluation',
+            name='alerted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='categoryvaluation',
+            name='threshold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='finishcategory',
+            name='min_soni',
+            field=models.PositiveIntegerField(default=0, help_text="Qoldiq shundan kam yoki teng bo'lsa ogohlantiriladi (0 — o'chiq)", verbose_name='Minimal qoldiq'),
+        ),
+        migrations.AddIndex(
+            model_name='categoryvaluation',
+            index=models.Index(condition=models.Q(('alerted', True)), fields=['user'], name='valuation_low_stock_idx'),
+        ),
+    ]
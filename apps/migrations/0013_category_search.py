@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:20
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# apps.models.normalize_name nusxasi: migratsiya keyinchalik o'zgaradigan ilova kodiga bog'lanmasin
+APOSTROPHES = str.maketrans({'ʻ': "'", 'ʼ': "'", '‘': "'", '’': "'", '`': "'"})
+
+
+def normalize_name(text):
+    text = unicodedata.normalize('NFKC', text or '').translate(APOSTROPHES).casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def backfill_names(apps, schema_editor):
+    """Mavjud kategoriyalarning qidiruv nomini to'ldirish"""
+    for model_name in ('Category', 'FinishCategory'):
+        model = apps.get_model('apps', model_name)
+        categories = list(model.objects.only('id', 'nomi'))
+        for category in categories:
+            category.nomi_norm = normalize_name(category.nomi)
+        model.objects.bulk_update(categories, ['nomi_norm'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0012_low_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='nomi_norm',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='finishcategory',
+            name='nomi_norm',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['user', 'nomi_norm', 'id'], name='category_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finishcategory',
+            index=models.Index(fields=['user', 'nomi_norm', 'id'], name='finishcategory_search_idx'),
+        ),
+    ]
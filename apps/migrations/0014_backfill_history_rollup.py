@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:10
+
+from datetime import date
+
+from django.db import migrations
+from django.db.models import F, Max, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Yig'indi jadvali (0004) qo'shilishidan oldingi tarix uchun HistoryRollup'ni to'ldirish:
+    arxiv chegarasidan keyingi kunlar tarixdan qaytadan quriladi (apps.rollups.rebuild bilan bir xil).
+    """
+    HistoryRollup = apps.get_model('apps', 'HistoryRollup')
+    HistoryArchive = apps.get_model('apps', 'HistoryArchive')
+    for warehouse, model_name in ((1, 'ProductHistory'), (2, 'FinishProductHistory')):
+        rollups = HistoryRollup.objects.filter(warehouse=warehouse)
+        rows = apps.get_model('apps', model_name).objects.all()
+        month = HistoryArchive.objects.filter(warehouse=warehouse).aggregate(month=Max('month'))['month']
+        if month:
+            boundary = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            rollups, rows = rollups.filter(day__gte=boundary), rows.filter(created_at__gte=boundary)
+        rollups.delete()
+        rows = (rows
+                .values('user_id', 'nomi_id', 'created_at', 'status')
+                .annotate(total_soni=Sum('soni'), total_summa=Sum(F('soni') * F('narxi')))
+                .order_by())
+        HistoryRollup.objects.bulk_create([
+            HistoryRollup(user_id=row['user_id'], warehouse=warehouse, category_id=row['nomi_id'],
+                          day=row['created_at'], status=row['status'],
+                          soni=row['total_soni'], summa=row['total_summa'] or 0)
+            for row in rows.iterator(chunk_size=1000)
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0013_category_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
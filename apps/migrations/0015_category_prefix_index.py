@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0014_backfill_history_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['user', 'nomi_norm'], name='category_prefix_idx',
+                               opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='finishcategory',
+            index=models.Index(fields=['user', 'nomi_norm'], name='finishcategory_prefix_idx',
+                               opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ),
+    ]
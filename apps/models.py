@@ -1,13 +1,85 @@
+import re
+import unicodedata
+from datetime import date
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Tarix qatorlari yozilganda yoki o'chirilganda yuboriladi: sender=tarix modeli, rows=[...], sign=1 | -1
+history_changed = Signal()
+
+
+def fill_users(model, objs):
+    """
+    Kategoriya egasini (``nomi.user``) qatorning o'ziga yozish: mahsulot va tarix so'rovlari
+    foydalanuvchi bo'yicha kategoriya jadvalini JOIN qilmasdan filtrlanadi.
+    Kategoriyasi yuklanmagan qatorlar uchun bitta so'rov.
+    """
+    nomi = model._meta.get_field('nomi')
+    missing = {obj.nomi_id for obj in objs if obj.nomi_id and not nomi.is_cached(obj)}
+    users = dict(nomi.related_model.objects.filter(id__in=missing).values_list('id', 'user_id')) if missing else {}
+    for obj in objs:
+        if obj.nomi_id is None:
+            obj.user_id = None
+        else:
+            obj.user_id = obj.nomi.user_id if nomi.is_cached(obj) else users.get(obj.nomi_id)
+
+
+# O'zbekcha tutuq belgisining turli yozilishlari (oʻ, o‘, o’, o`) bitta ko'rinishga keltiriladi
+APOSTROPHES = str.maketrans({'ʻ': "'", 'ʼ': "'", '‘': "'", '’': "'", '`': "'"})
+
+
+def normalize_name(text):
+    """Qidiruv uchun kategoriya nomi: kichik harf, bitta tutuq belgisi, ortiqcha bo'shliqsiz"""
+    text = unicodedata.normalize('NFKC', text or '').translate(APOSTROPHES).casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class CategoryQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.nomi_norm = normalize_name(obj.nomi)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class TenantQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # save() uchun pre_save (apps.signals) to'ldiradi, bulk_create uchun shu yerda
+        objs = list(objs)
+        fill_users(self.model, objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class HistoryQuerySet(TenantQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create post_save yubormaydi, shuning uchun hisobotlar uchun alohida signal
+        objs = super().bulk_create(objs, *args, **kwargs)
+        history_changed.send(sender=self.model, rows=objs, sign=1)
+        return objs
 
 
 class Category(models.Model):
     nomi = models.CharField(max_length=100)
+    # Qidiruv va autocomplete uchun (apps.search): (user, nomi_norm) indeksi bo'yicha prefiks
+    nomi_norm = models.CharField(max_length=100, editable=False, default='')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    min_soni = models.PositiveIntegerField(
+        default=0, verbose_name="Minimal qoldiq",
+        help_text="Qoldiq shundan kam yoki teng bo'lsa ogohlantiriladi (0 — o'chiq)")
+
+    objects = CategoryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = '1 - Sklad Kategoriyasi'
+        indexes = [
+            models.Index(fields=['user', 'nomi_norm', 'id'], name='category_search_idx'),
+            # PostgreSQL'da LIKE 'term%' prefiksi uchun (apps.search.prefix_filter), collation'dan qat'i nazar
+            models.Index(fields=['user', 'nomi_norm'], name='category_prefix_idx',
+                         opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.nomi
@@ -18,9 +90,22 @@ class Product(models.Model):
     nomi = models.ForeignKey('apps.Category', on_delete=models.CASCADE, null=True, blank=True,
                              related_name='products')
     narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # Kategoriya egasining nusxasi (fill_users), ``nomi__user`` JOIN'siz filtr uchun
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                             db_index=False)
+
+    objects = TenantQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "Sklad 1"
+        # Bir kategoriya + narx = bitta partiya (qabul INSERT ... ON CONFLICT bilan qo'shiladi)
+        constraints = [
+            models.UniqueConstraint(fields=['nomi', 'narxi'], name='unique_product_lot'),
+        ]
+        # Mahsulotlar sahifasi: foydalanuvchi, keyin id bo'yicha keyset
+        indexes = [
+            models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+        ]
 
     def __str__(self):
         return self.nomi.nomi
@@ -30,10 +115,23 @@ class Product(models.Model):
 
 class FinishCategory(models.Model):
     nomi = models.CharField(max_length=100)
+    # Qidiruv va autocomplete uchun (apps.search): (user, nomi_norm) indeksi bo'yicha prefiks
+    nomi_norm = models.CharField(max_length=100, editable=False, default='')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    min_soni = models.PositiveIntegerField(
+        default=0, verbose_name="Minimal qoldiq",
+        help_text="Qoldiq shundan kam yoki teng bo'lsa ogohlantiriladi (0 — o'chiq)")
+
+    objects = CategoryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = '2 - Sklad Kategoriasi'
+        indexes = [
+            models.Index(fields=['user', 'nomi_norm', 'id'], name='finishcategory_search_idx'),
+            # PostgreSQL'da LIKE 'term%' prefiksi uchun (apps.search.prefix_filter), collation'dan qat'i nazar
+            models.Index(fields=['user', 'nomi_norm'], name='finishcategory_prefix_idx',
+                         opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.nomi
@@ -43,9 +141,20 @@ class FinishProduct(models.Model):
     soni = models.IntegerField()
     nomi = models.ForeignKey('apps.FinishCategory', on_delete=models.CASCADE, null=True, blank=True, )
     narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # Kategoriya egasining nusxasi (fill_users), ``nomi__user`` JOIN'siz filtr uchun
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                             db_index=False)
+
+    objects = TenantQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Sklad 2'
+        constraints = [
+            models.UniqueConstraint(fields=['nomi', 'narxi'], name='unique_finishproduct_lot'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'id'], name='finishproduct_user_id_idx'),
+        ]
 
     def __str__(self):
         return self.nomi
@@ -60,11 +169,24 @@ class ProductHistory(models.Model):
     soni = models.IntegerField()
     status = models.CharField(choices=StatusType.choices, default=StatusType.CHIQDI, max_length=100,
                               verbose_name="Holat")
-    created_at = models.DateField(auto_now_add=True, verbose_name="Sana")
+    # auto_now_add emas: import paytida eski sanalarni yozish mumkin bo'lishi uchun
+    created_at = models.DateField(default=date.today, editable=False, verbose_name="Sana")
     narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # Kategoriya egasining nusxasi (fill_users), ``nomi__user`` JOIN'siz filtr uchun
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                             db_index=False)
+
+    objects = HistoryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = '1 - Sklad'
+        # Admin: foydalanuvchi, keyin sana oralig'i va holat; kategoriya filtri uchun nomi bo'yicha
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='producthistory_user_date_idx'),
+            models.Index(fields=['user', 'status', 'created_at'], name='producthistory_user_status_idx'),
+            models.Index(fields=['nomi', 'created_at'], name='producthistory_nomi_date_idx'),
+            models.Index(fields=['nomi', 'status', 'created_at'], name='producthistory_nomi_status_idx'),
+        ]
 
 
 class FinishProductHistory(models.Model):
@@ -76,8 +198,165 @@ class FinishProductHistory(models.Model):
     soni = models.IntegerField()
     status = models.CharField(choices=StatusType.choices, default=StatusType.CHIQDI, max_length=100,
                               verbose_name="Holat")
-    created_at = models.DateField(auto_now_add=True, verbose_name="Sana")
+    # auto_now_add emas: import paytida eski sanalarni yozish mumkin bo'lishi uchun
+    created_at = models.DateField(default=date.today, editable=False, verbose_name="Sana")
     narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # Kategoriya egasining nusxasi (fill_users), ``nomi__user`` JOIN'siz filtr uchun
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                             db_index=False)
+
+    objects = HistoryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = '2 - Sklad'
+        # Admin: foydalanuvchi, keyin sana oralig'i va holat; kategoriya filtri uchun nomi bo'yicha
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='finishhistory_user_date_idx'),
+            models.Index(fields=['user', 'status', 'created_at'], name='finishhistory_user_status_idx'),
+            models.Index(fields=['nomi', 'created_at'], name='finishhistory_nomi_date_idx'),
+            models.Index(fields=['nomi', 'status', 'created_at'], name='finishhistory_nomi_status_idx'),
+        ]
+
+
+# ================= Telegram xabarlar navbati ===================================================================
+
+class Notification(models.Model):
+    class StatusType(models.TextChoices):
+        PENDING = 'pending', 'Kutilmoqda'
+        SENT = 'sent', 'Yuborildi'
+        FAILED = 'failed', 'Xatolik'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    chat_id = models.CharField(max_length=64)
+    text = models.TextField()
+    parse_mode = models.CharField(max_length=20, blank=True, default='')
+    status = models.CharField(choices=StatusType.choices, default=StatusType.PENDING, max_length=20,
+                              verbose_name="Holat")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Sana")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Telegram xabarlari'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_queue_idx'),
+        ]
+
+    def __str__(self):
+        return self.text[:50]
+
+
+# ================= Hisobotlar ==================================================================================
+
+class HistoryRollup(models.Model):
+    """Tarixning (foydalanuvchi, sklad, kategoriya, kun, holat) bo'yicha kunlik yig'indisi"""
+
+    class Warehouse(models.IntegerChoices):
+        SKLAD_1 = 1, '1 - Sklad'
+        SKLAD_2 = 2, '2 - Sklad'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    warehouse = models.PositiveSmallIntegerField(choices=Warehouse.choices, verbose_name="Sklad")
+    category_id = models.BigIntegerField(null=True, blank=True)
+    day = models.DateField(verbose_name="Sana")
+    status = models.CharField(choices=ProductHistory.StatusType.choices, max_length=100, verbose_name="Holat")
+    soni = models.BigIntegerField(default=0)
+    summa = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Kunlik hisobot'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'warehouse', 'category_id', 'day', 'status'],
+                                    name='unique_history_rollup'),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """
+    Partiyalar (kategoriya, narx) qoldig'i ``day`` kuni oxiridagi holatda. Ixtiyoriy sanadagi
+    qoldiq eng yaqin snapshot + undan keyingi tarix bilan tiklanadi (apps.snapshots).
+    Nol qoldiqli partiyalar saqlanmaydi.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    warehouse = models.PositiveSmallIntegerField(choices=HistoryRollup.Warehouse.choices, verbose_name="Sklad")
+    category_id = models.BigIntegerField(null=True, blank=True)
+    narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    day = models.DateField(verbose_name="Sana")
+    soni = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Qoldiq snapshotlari'
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'category_id', 'narxi', 'day'], name='unique_stock_snapshot'),
+        ]
+        indexes = [
+            models.Index(fields=['warehouse', 'day'], name='stocksnapshot_day_idx'),
+        ]
+
+
+class HistoryArchive(models.Model):
+    """
+    Eski tarix qatorlarining oylik bo'lagi (foydalanuvchi, sklad, oy): gzip bilan siqilgan CSV.
+    Kunlik yig'indilar HistoryRollup'da qoladi, bu yerda faqat qatorlarning o'zi (apps.archive).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    warehouse = models.PositiveSmallIntegerField(choices=HistoryRollup.Warehouse.choices, verbose_name="Sklad")
+    month = models.DateField(verbose_name="Oy")
+    rows = models.PositiveIntegerField(default=0)
+    soni = models.BigIntegerField(default=0)
+    summa = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Tarix arxivi'
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'user', 'month'], name='unique_history_archive'),
+        ]
+
+
+class CategoryValuation(models.Model):
+    """
+    Kategoriya qoldig'ining qiymati va sotilgan tovar tannarxi ikki usulda: o'rtacha tortilgan
+    va FIFO. Har tarix qatori yozilganda yangilanadi (apps.valuation), butun tarix qayta o'qilmaydi.
+    ``stale`` — o'tgan qator tahrirlangan yoki o'chirilgan, kategoriya qaytadan hisoblanadi.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    warehouse = models.PositiveSmallIntegerField(choices=HistoryRollup.Warehouse.choices, verbose_name="Sklad")
+    category_id = models.BigIntegerField()
+    soni = models.BigIntegerField(default=0)
+    average_value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    average_cogs = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    fifo_cogs = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    stale = models.BooleanField(default=False)
+    # Kategoriyaning min_soni nusxasi (sotuvda kategoriya jadvali o'qilmasin) va qoldiq
+    # chegaradan pastga tushgani haqida xabar yuborilganmi (apps.alerts)
+    threshold = models.PositiveIntegerField(default=0)
+    alerted = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name_plural = 'Qoldiq qiymati'
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'category_id'], name='unique_category_valuation'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'warehouse'], name='valuation_user_idx'),
+            models.Index(fields=['user'], condition=models.Q(alerted=True), name='valuation_low_stock_idx'),
+        ]
+
+
+class FifoLayer(models.Model):
+    """FIFO qatlami: qabul qatori (``history_id``) dan hali sotilmagan qism"""
+    warehouse = models.PositiveSmallIntegerField(choices=HistoryRollup.Warehouse.choices, verbose_name="Sklad")
+    category_id = models.BigIntegerField()
+    history_id = models.BigIntegerField()
+    narxi = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    soni = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['warehouse', 'category_id', 'history_id'], name='fifolayer_order_idx'),
+        ]
@@ -0,0 +1,199 @@
+import re
+import time
+from datetime import timedelta
+
+import telebot
+from telebot.apihelper import ApiTelegramException
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification
+
+# Telegram bitta xabar uchun ruxsat bergan eng katta uzunlik
+MAX_MESSAGE_LENGTH = 4096
+# Eski (``Markdown``) parse_mode'da belgi sifatida o'qiladigan, ekranlanmagan belgilar
+MARKDOWN_SPECIAL = re.compile(r'(?<!\\)([_*`\[])')
+
+
+def escape_markdown(text):
+    """Foydalanuvchi kiritgan matnni (kategoriya nomi) ``Markdown`` xabarga qo'yish uchun"""
+    return MARKDOWN_SPECIAL.sub(r'\\\1', str(text))
+
+
+def enqueue(text, user_id=None, parse_mode=''):
+    """
+    Xabarni navbatga yozish. Chaqiruvchining tranzaksiyasi ichida ishlaydi,
+    shuning uchun ombor o'zgarishi bilan birga saqlanadi yoki birga bekor bo'ladi.
+    """
+    return Notification.objects.create(
+        chat_id=settings.TELEGRAM_CHAT_ID or '',
+        text=text,
+        user_id=user_id,
+        parse_mode=parse_mode,
+    )
+
+
+class MessageRejected(Exception):
+    """Telegram xabarning o'zini qabul qilmadi (400, masalan Markdown buzilgan) — qayta urinish yordam bermaydi"""
+
+
+class TelegramClient:
+    def __init__(self, token=None):
+        self.bot = telebot.TeleBot(token or settings.TELEGRAM_TOKEN)
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        try:
+            self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode or None)
+        except ApiTelegramException as e:
+            if e.error_code == 400:
+                raise MessageRejected(e.description) from e
+            raise
+
+
+class FakeTelegramClient:
+    """
+    Testlar uchun Telegram o'rnini bosuvchi klient: xabarlarni ``outbox`` ga yig'adi.
+    ``fail`` berilsa, shuncha marta xatolik qaytaradi. Juftlanmagan Markdown belgilari bo'lsa
+    Telegram kabi xabarni rad etadi.
+    """
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.outbox = []
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("Telegram javob bermadi")
+        if parse_mode == 'Markdown' and any(MARKDOWN_SPECIAL.findall(text).count(c) % 2 for c in '_*`'):
+            raise MessageRejected("Bad Request: can't parse entities")
+        self.outbox.append({'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode})
+
+
+def get_client():
+    return import_string(settings.TELEGRAM_CLIENT)()
+
+
+class RateLimiter:
+    """Soniyasiga ``rate`` tadan ko'p xabar yubormaslik uchun"""
+
+    def __init__(self, rate, sleep=time.sleep, clock=time.monotonic):
+        self.interval = 1 / rate if rate else 0
+        self.sleep = sleep
+        self.clock = clock
+        self.last = None
+
+    def wait(self):
+        now = self.clock()
+        if self.last is not None and self.interval:
+            delay = self.last + self.interval - now
+            if delay > 0:
+                self.sleep(delay)
+                now += delay
+        self.last = now
+
+
+def build_digests(notifications):
+    """
+    Bir chatga ketadigan xabarlarni bitta digest xabarga birlashtirish.
+    Qaytaradi: [(chat_id, parse_mode, text, [notification_id, ...]), ...]
+    """
+    groups = {}
+    for notification in notifications:
+        groups.setdefault((notification.chat_id, notification.parse_mode), []).append(notification)
+
+    digests = []
+    for (chat_id, parse_mode), items in groups.items():
+        text, ids = '', []
+        for item in items:
+            part = item.text[:MAX_MESSAGE_LENGTH]
+            candidate = f"{text}\n\n{part}" if text else part
+            if ids and len(candidate) > MAX_MESSAGE_LENGTH:
+                digests.append((chat_id, parse_mode, text, ids))
+                text, ids = part, []
+            else:
+                text = candidate
+            ids.append(item.id)
+        digests.append((chat_id, parse_mode, text, ids))
+    return digests
+
+
+def retry_delay(attempts):
+    """Eksponensial kutish: 5s, 10s, 20s ... NOTIFICATION_MAX_RETRY_DELAY gacha"""
+    delay = settings.NOTIFICATION_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.NOTIFICATION_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    """
+    Navbatdagi xabarlarni olish. Olingan qatorlar ``NOTIFICATION_LEASE`` soniyaga
+    band qilinadi, shunda bir nechta worker bir xabarni ikki marta yubormaydi.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status=Notification.StatusType.PENDING, next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        if notifications:
+            Notification.objects.filter(id__in=[n.id for n in notifications]).update(
+                next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE)
+            )
+    return notifications
+
+
+def process_batch(client=None, batch_size=None, limiter=None):
+    """Bitta partiyani yuborish. Yuborilgan xabarlar sonini qaytaradi."""
+    client = client or get_client()
+    limiter = limiter or RateLimiter(settings.NOTIFICATION_RATE)
+    notifications = claim_batch(batch_size or settings.NOTIFICATION_BATCH_SIZE)
+    attempts = {n.id: n.attempts for n in notifications}
+    texts = {n.id: n.text[:MAX_MESSAGE_LENGTH] for n in notifications}
+
+    sent = 0
+    for chat_id, parse_mode, text, ids in build_digests(notifications):
+        try:
+            sent += send(client, limiter, chat_id, parse_mode, text, ids, attempts)
+        except MessageRejected:
+            # Bitta buzilgan xabar butun digestni yiqitmasin: har biri alohida yuboriladi
+            for i in ids:
+                sent += send(client, limiter, chat_id, parse_mode, texts[i], [i], attempts)
+    return sent
+
+
+def send(client, limiter, chat_id, parse_mode, text, ids, attempts):
+    """
+    Bitta xabar yoki digestni yuborib natijani yozish. Qaytaradi: yuborilgan xabarlar soni.
+    Bir nechta xabarli digest rad etilsa ``MessageRejected`` chaqiruvchiga qaytadi.
+    """
+    limiter.wait()
+    try:
+        client.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+    except MessageRejected as e:
+        if len(ids) > 1:
+            raise
+        mark_failed(ids, attempts[ids[0]] + 1, str(e))
+        return 0
+    except Exception as e:
+        mark_failed(ids, max(attempts[i] for i in ids) + 1, str(e))
+        return 0
+    Notification.objects.filter(id__in=ids).update(
+        status=Notification.StatusType.SENT,
+        sent_at=timezone.now(),
+        attempts=F('attempts') + 1,
+        last_error='',
+    )
+    return len(ids)
+
+
+def mark_failed(ids, attempts, error):
+    queryset = Notification.objects.filter(id__in=ids)
+    if attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+        queryset.update(status=Notification.StatusType.FAILED, attempts=attempts, last_error=error)
+    else:
+        queryset.update(attempts=attempts, last_error=error,
+                        next_attempt_at=timezone.now() + retry_delay(attempts))
@@ -0,0 +1,74 @@
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+
+
+def parse_cursor(value):
+    """``?after=`` qiymati: oxirgi ko'rsatilgan qatorning id si (yaroqsiz bo'lsa boshidan)"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, after=None, size=100):
+    """
+    OFFSET'siz sahifa: ``WHERE id > after ORDER BY id LIMIT size + 1``.
+    Sahifa qanchalik uzoqda bo'lmasin indeks bo'yicha bir xil tez ishlaydi.
+    Qaytaradi: (qatorlar, keyingi sahifa kursori yoki None)
+    """
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    items = list(queryset.order_by('pk')[:size + 1])
+    if len(items) > size:
+        return items[:size], items[size - 1].pk
+    return items, None
+
+
+def encode_cursor(created_at, pk):
+    return f"{created_at:%Y-%m-%d}_{pk}"
+
+
+def parse_date_cursor(value):
+    """``?after=2025-01-31_123`` qiymati: (sana, id) yoki None (yaroqsiz bo'lsa boshidan)"""
+    try:
+        day, pk = value.split('_')
+        return date.fromisoformat(day), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def older_than(queryset, day, pk):
+    """(created_at, id) kamayish tartibida shu qatordan keyingilar"""
+    return queryset.filter(Q(created_at__lt=day) | Q(created_at=day, pk__lt=pk))
+
+
+def estimated_count(queryset, exact=False):
+    """
+    Sahifa ostidagi qatorlar soni. PostgreSQL'da rejalashtiruvchi bahosi (EXPLAIN, COUNT'siz),
+    boshqa bazalarda ``HISTORY_COUNT_CACHE_SECONDS`` ga keshlangan COUNT.
+    ``exact`` bo'lsa COUNT bajariladi va kesh yangilanadi. Qaytaradi: (soni, aniqmi)
+    """
+    queryset = queryset.order_by()
+    key = 'count:' + hashlib.md5(str(queryset.query).encode()).hexdigest()
+    if not exact:
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows']), False
+        count = cache.get(key)
+        if count is not None:
+            return count, False
+    count = queryset.count()
+    cache.set(key, count, settings.HISTORY_COUNT_CACHE_SECONDS)
+    return count, True
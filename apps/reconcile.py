@@ -0,0 +1,90 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import CategoryValuation
+from .services import WAREHOUSES
+from .snapshots import stock_at
+from .stock_cache import bump_stock_version
+from .valuation import recompute
+
+
+def expected_stock(warehouse):
+    """
+    Tarix bo'yicha hozirgi qoldiq: eng so'nggi snapshot + undan keyingi tarixning bitta guruhlangan
+    yig'indisi (arxivlangan tarix snapshot ichida). Qaytaradi: {(category_id, narxi): soni}
+    """
+    _, stock = stock_at(warehouse, None)
+    return stock
+
+
+def reconcile(warehouse, fix=False, chunk_size=1000):
+    """
+    Partiyalar qoldig'ini (``soni``) tarix bilan solishtirish. ``fix`` bo'lsa farqlar tarix
+    bo'yicha tuzatiladi: partiyalar ``bulk_update`` bilan, tarixi bor lekin partiyasi yo'qlari
+    ``bulk_create`` bilan. Kategoriya hisoblagichi (``CategoryValuation.soni`` — kam qoldiq chegarasi
+    shu bilan solishtiriladi) partiyalar yig'indisidan farq qilsa ``counter`` sifatida xabar qilinadi
+    va ``fix`` da tarixdan qayta hisoblanadi. Tarix manfiy qoldiq bersa faqat xabar qilinadi.
+    Qaytaradi: [{'warehouse', 'product_id', 'category_id', 'narxi', 'soni', 'expected', 'action'}, ...]
+    """
+    model, _ = WAREHOUSES[warehouse]
+    with transaction.atomic():
+        lots = model.objects.filter(nomi__isnull=False)
+        if fix:
+            # Partiyalar tarixdan oldin qulflanadi: parallel sotuv yoki ikkalasini yozib bo'lgan,
+            # yoki bizdan keyin yozadi
+            lots = lots.select_for_update()
+        rows = list(lots.values_list('id', 'nomi_id', 'narxi', 'soni', 'user_id').order_by('id'))
+        expected = expected_stock(warehouse)
+
+        report, changed, users, touched = [], [], set(), set()
+        totals = defaultdict(int)  # kategoriyaning tarix bo'yicha qoldig'i — tuzatilgan partiyalar yig'indisi
+        for product_id, category_id, narxi, soni, user_id in rows:
+            target = expected.pop((category_id, narxi), 0)
+            totals[category_id] += target
+            if target == soni:
+                continue
+            action = 'negative' if target < 0 else 'update'
+            report.append(drift(warehouse, product_id, category_id, narxi, soni, target, action))
+            if action == 'update':
+                changed.append(model(id=product_id, soni=target))
+                users.add(user_id)
+                touched.add(category_id)
+
+        # O'chirilgan kategoriyalarning snapshotdagi izlari drift emas
+        category_model = model._meta.get_field('nomi').related_model
+        categories = set(category_model.objects.filter(id__in={category_id for category_id, _ in expected})
+                         .values_list('id', flat=True))
+        missing = []
+        for (category_id, narxi), target in sorted(item for item in expected.items() if item[0][0] in categories):
+            action = 'negative' if target < 0 else 'create'
+            report.append(drift(warehouse, None, category_id, narxi, None, target, action))
+            totals[category_id] += target
+            if action == 'create':
+                missing.append(model(nomi_id=category_id, narxi=narxi, soni=target))
+                touched.add(category_id)
+
+        # Hisoblagich manfiyga tushmaydi (apps.valuation.average_sell)
+        counters = CategoryValuation.objects.filter(warehouse=warehouse, stale=False)
+        for category_id, soni in counters.values_list('category_id', 'soni').order_by('category_id'):
+            target = max(totals.get(category_id, 0), 0)
+            if category_id in totals and target != soni:
+                report.append(drift(warehouse, None, category_id, None, soni, target, 'counter'))
+                touched.add(category_id)
+
+        if fix:
+            model.objects.bulk_update(changed, ['soni'], batch_size=chunk_size)
+            for lot in model.objects.bulk_create(missing, batch_size=chunk_size):
+                users.add(lot.user_id)
+            if users:
+                bump_stock_version(*users)
+            if touched:
+                # Hisoblagich partiyalar bilan birga tuzatiladi, chegaradan o'tganlar xabar beradi
+                recompute(warehouse, touched)
+    return report
+
+
+def drift(warehouse, product_id, category_id, narxi, soni, expected, action):
+    return {'warehouse': warehouse, 'product_id': product_id, 'category_id': category_id,
+            'narxi': str(narxi) if narxi is not None else None,
+            'soni': soni, 'expected': expected, 'action': action}
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Sum
+
+from .models import HistoryRollup
+from .services import WAREHOUSES
+from .snapshots import archive_boundary
+
+# Tarix modeli -> sklad raqami
+HISTORY_WAREHOUSE = {history_model: warehouse for warehouse, (_, history_model) in WAREHOUSES.items()}
+
+
+def apply_history(history_model, rows, sign=1):
+    """
+    Tarix qatorlarini kunlik yig'indiga qo'shish (sign=-1 bo'lsa ayirish).
+    Qo'shish barcha (user, sklad, kategoriya, kun, holat) kalitlari uchun bitta
+    ``INSERT ... ON CONFLICT DO UPDATE`` bilan, ayirish har kalitga bitta UPDATE bilan.
+    """
+    warehouse = HISTORY_WAREHOUSE[history_model]
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for row in rows:
+        total = totals[(row.user_id, warehouse, row.nomi_id, row.created_at, row.status)]
+        total[0] += sign * row.soni
+        total[1] += sign * row.soni * Decimal(row.narxi)
+
+    # NULL qiymatli kalitlar unique cheklovga tushmaydi, ular alohida yangilanadi
+    upserts = [(key, soni, summa) for key, (soni, summa) in totals.items() if sign > 0 and None not in key]
+    upsert(upserts)
+    for key, (soni, summa) in totals.items():
+        if sign < 0 or None in key:
+            bump(key, soni, summa)
+
+
+def upsert(items):
+    """Yig'indilarni bitta executemany bilan qo'shish (SQLite 3.24+ va PostgreSQL)"""
+    if not items:
+        return
+    connection = connections[router.db_for_write(HistoryRollup)]
+    table = connection.ops.quote_name(HistoryRollup._meta.db_table)
+    sql = (f"INSERT INTO {table} (user_id, warehouse, category_id, day, status, soni, summa) "
+           f"VALUES (%s, %s, %s, %s, %s, %s, %s) "
+           f"ON CONFLICT (user_id, warehouse, category_id, day, status) "
+           f"DO UPDATE SET soni = {table}.soni + excluded.soni, summa = {table}.summa + excluded.summa")
+    params = [
+        (user_id, warehouse, category_id, connection.ops.adapt_datefield_value(day), status, soni,
+         connection.ops.adapt_decimalfield_value(summa))
+        for (user_id, warehouse, category_id, day, status), soni, summa in items
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def bump(key, soni, summa):
+    filters = dict(zip(('user_id', 'warehouse', 'category_id', 'day', 'status'), key))
+    rollup = HistoryRollup.objects.filter(**filters)
+    if rollup.update(soni=F('soni') + soni, summa=F('summa') + summa):
+        return
+    if soni < 0:
+        # Ayiriladigan yig'indi yo'q (masalan, foydalanuvchi bilan birga o'chirilgan)
+        return
+    try:
+        with transaction.atomic():
+            HistoryRollup.objects.create(soni=soni, summa=summa, **filters)
+    except IntegrityError:
+        # Parallel so'rov qatorni birinchi yaratib qo'ydi
+        rollup.update(soni=F('soni') + soni, summa=F('summa') + summa)
+
+
+def totals(user, warehouse, **filters):
+    """
+    Yig'indidan hisoblash: ``day__gte``, ``day__lte``, ``status``, ``category_id``
+    kabi filtrlarni qabul qiladi. Narxi kunlar soniga bog'liq, tarix qatorlariga emas.
+    """
+    return HistoryRollup.objects.filter(user=user, warehouse=warehouse, **filters).aggregate(
+        soni=Sum('soni'), summa=Sum('summa'))
+
+
+def rebuild(chunk_size=1000):
+    """
+    Yig'indini butun tarixdan qaytadan qurish. Arxivlangan oylar (apps.archive) yig'indisi
+    saqlanadi, faqat arxiv chegarasidan keyingi kunlar qayta quriladi.
+    Yaratilgan qatorlar sonini qaytaradi.
+    """
+    created = 0
+    with transaction.atomic():
+        for history_model, warehouse in HISTORY_WAREHOUSE.items():
+            rollups, rows = HistoryRollup.objects.filter(warehouse=warehouse), history_model.objects.all()
+            boundary = archive_boundary(warehouse)
+            if boundary:
+                rollups, rows = rollups.filter(day__gte=boundary), rows.filter(created_at__gte=boundary)
+            rollups.delete()
+            rows = (rows
+                    .values('user_id', 'nomi_id', 'created_at', 'status')
+                    .annotate(total_soni=Sum('soni'), total_summa=Sum(F('soni') * F('narxi')))
+                    .order_by())
+            batch = []
+            for row in rows.iterator(chunk_size=chunk_size):
+                batch.append(HistoryRollup(
+                    user_id=row['user_id'], warehouse=warehouse, category_id=row['nomi_id'],
+                    day=row['created_at'], status=row['status'],
+                    soni=row['total_soni'], summa=row['total_summa'] or 0,
+                ))
+                if len(batch) >= chunk_size:
+                    created += len(HistoryRollup.objects.bulk_create(batch))
+                    batch = []
+            created += len(HistoryRollup.objects.bulk_create(batch))
+    return created
@@ -0,0 +1,53 @@
+from django.db import connections, router
+from django.db.models import Q, Subquery
+
+from .models import normalize_name
+from .services import WAREHOUSES
+
+# Autocomplete sahifasi hajmi
+PAGE_SIZE = 20
+
+
+def category_model(warehouse):
+    _, history_model = WAREHOUSES[warehouse]
+    return history_model._meta.get_field('nomi').related_model
+
+
+def prefix_filter(model, term):
+    """
+    ``nomi_norm`` bo'yicha prefiks sharti. PostgreSQL'da ``LIKE 'term%'`` — varchar_pattern_ops
+    indeksidan foydalanadi va har qanday collation'da (ICU, en_US) to'g'ri. SQLite'da oraliq
+    (``>= term AND < term + max``): uning LIKE'i registrga befarq va indeksdan foydalanmaydi,
+    oraliq esa BINARY collation'da aniq ishlaydi
+    """
+    if connections[router.db_for_read(model)].vendor == 'postgresql':
+        return {'nomi_norm__startswith': term}
+    return {'nomi_norm__gte': term, 'nomi_norm__lt': term + '\U0010ffff'}
+
+
+def search_categories(warehouse, user, term=''):
+    """Foydalanuvchi kategoriyalari, nomi ``term`` bilan boshlanadiganlar, nom bo'yicha tartibda"""
+    categories = category_model(warehouse).objects.filter(user=user)
+    term = normalize_name(term)
+    if term:
+        categories = categories.filter(**prefix_filter(categories.model, term))
+    return categories.order_by('nomi_norm', 'id')
+
+
+def autocomplete(warehouse, user, term='', after=None, page_size=PAGE_SIZE):
+    """
+    select2 formatidagi sahifa: {'results': [{'id', 'text'}, ...], 'pagination': {'more', 'after'}}.
+    OFFSET'siz: ``after`` — oldingi sahifadagi oxirgi kategoriya id si, keyingi sahifa
+    (nomi_norm, id) tartibida undan keyin boshlanadi
+    """
+    categories = search_categories(warehouse, user, term)
+    if after is not None:
+        last = Subquery(categories.filter(pk=after).values('nomi_norm'))
+        categories = categories.filter(Q(nomi_norm__gt=last) | Q(nomi_norm=last, pk__gt=after))
+    rows = list(categories.values_list('id', 'nomi')[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        'results': [{'id': pk, 'text': nomi} for pk, nomi in rows],
+        'pagination': {'more': more, 'after': rows[-1][0] if more else None},
+    }
@@ -0,0 +1,248 @@
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Product, ProductHistory, FinishProduct, FinishProductHistory, normalize_name
+
+# Sklad raqami -> (mahsulot modeli, tarix modeli)
+WAREHOUSES = {
+    1: (Product, ProductHistory),
+    2: (FinishProduct, FinishProductHistory),
+}
+
+
+class OutOfStock(Exception):
+    """Kiritilgan miqdor ombordagidan ko'p"""
+
+
+def sell_lot(model, history_model, product_id, amount):
+    """
+    Mahsulotni bitta shartli UPDATE bilan kamaytirish va tarixga yozish:
+    ``UPDATE ... SET soni = soni - n WHERE id = ? AND soni >= n``.
+    Qatorni o'qib-yozish yo'q, shuning uchun parallel sotuvlarda soni yo'qolmaydi
+    va manfiyga tushmaydi. Yangilangan mahsulotni qaytaradi.
+
+    Chaqiruvchining tranzaksiyasi bo'lsa, o'sha tranzaksiyada (savepoint'siz) ishlaydi.
+    """
+    if amount <= 0:
+        raise ValueError("Iltimos, musbat son kiriting!")
+
+    with transaction.atomic(savepoint=False):
+        updated = model.objects.filter(id=product_id, soni__gte=amount).update(soni=F('soni') - amount)
+        if not updated:
+            if model.objects.filter(id=product_id).exists():
+                raise OutOfStock
+            raise model.DoesNotExist
+
+        product = model.objects.select_related('nomi').get(id=product_id)
+        history_model.objects.create(
+            nomi=product.nomi,
+            soni=amount,
+            status=history_model.StatusType.CHIQDI,
+            narxi=product.narxi,
+        )
+    return product
+
+
+class BatchError(Exception):
+    """Partiyadagi bir yoki bir nechta qator xato; ``errors`` — qatorlar bo'yicha xatolar"""
+
+    def __init__(self, errors):
+        super().__init__(errors[0]['error'])
+        self.errors = errors
+
+
+def parse_lines(lines):
+    """
+    ``[{warehouse, product_id, amount}, ...]`` ni tekshirish va bir xil mahsulot
+    qatorlarini qo'shish. Qaytaradi: {warehouse: {product_id: amount}}
+    """
+    if not isinstance(lines, list) or not lines:
+        raise BatchError([{'error': "Mahsulotlar ro'yxati bo'sh!"}])
+
+    result, errors = {}, []
+    for line in lines:
+        try:
+            warehouse = int(line['warehouse'])
+            product_id = int(line['product_id'])
+            amount = int(line['amount'])
+        except (KeyError, TypeError, ValueError):
+            errors.append({'line': line, 'error': "Yaroqsiz qator!"})
+            continue
+        if warehouse not in WAREHOUSES:
+            errors.append({'line': line, 'error': "Bunday sklad yo'q!"})
+        elif amount <= 0:
+            errors.append({'line': line, 'error': "Iltimos, musbat son kiriting!"})
+        else:
+            amounts = result.setdefault(warehouse, {})
+            amounts[product_id] = amounts.get(product_id, 0) + amount
+    if errors:
+        raise BatchError(errors)
+    return result
+
+
+def sell_lines(lines, user):
+    """
+    Ikkala skladdan ``user`` ning bir nechta mahsulotini bitta tranzaksiyada chiqarish.
+    Har bir sklad uchun bitta shartli ``UPDATE ... CASE``, bitta SELECT va
+    bitta ``bulk_create`` ishlaydi. Birorta qator o'tmasa hammasi bekor qilinadi.
+    Qaytaradi: [(warehouse, product, amount), ...]
+    """
+    parsed = parse_lines(lines)
+    try:
+        with transaction.atomic():
+            return _sell_lines(parsed, user)
+    except OutOfStock:
+        raise BatchError(batch_errors(parsed, user)) from None
+
+
+def take_lots(model, amounts, user):
+    """
+    ``user`` partiyalarini bitta shartli ``UPDATE ... CASE`` bilan kamaytirish, birortasida yetmasa
+    (yoki partiya boshqa foydalanuvchiniki bo'lsa) OutOfStock.
+    Qaytaradi: {product_id: yangilangan mahsulot (kategoriyasi bilan)}
+    """
+    amount_case = Case(*[When(id=pk, then=Value(n)) for pk, n in amounts.items()],
+                       output_field=IntegerField())
+    updated = (model.objects.filter(user=user, id__in=amounts, soni__gte=amount_case)
+               .update(soni=F('soni') - amount_case))
+    if updated != len(amounts):
+        raise OutOfStock
+    return model.objects.select_related('nomi').in_bulk(amounts)
+
+
+def _sell_lines(parsed, user):
+    sold = []
+    for warehouse, amounts in parsed.items():
+        model, history_model = WAREHOUSES[warehouse]
+        products = take_lots(model, amounts, user)
+        history_model.objects.bulk_create([
+            history_model(nomi=products[pk].nomi, soni=n, status=history_model.StatusType.CHIQDI,
+                          narxi=products[pk].narxi)
+            for pk, n in amounts.items()
+        ])
+        sold.extend((warehouse, products[pk], n) for pk, n in amounts.items())
+    return sold
+
+
+def batch_errors(parsed, user):
+    """
+    O'tmagan qatorlarni aniqlash (tranzaksiya bekor qilingandan keyin).
+    Boshqa foydalanuvchining partiyasi "topilmadi" deb qaytadi.
+    """
+    errors = []
+    for warehouse, amounts in parsed.items():
+        model, _ = WAREHOUSES[warehouse]
+        stock = dict(model.objects.filter(user=user, id__in=amounts).values_list('id', 'soni'))
+        for pk, n in amounts.items():
+            if pk not in stock:
+                errors.append({'warehouse': warehouse, 'product_id': pk, 'error': 'Mahsulot topilmadi!'})
+            elif stock[pk] < n:
+                errors.append({'warehouse': warehouse, 'product_id': pk,
+                               'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'})
+    return errors or [{'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'}]
+
+
+def upsert_sql(model, connection, returning=False):
+    table = connection.ops.quote_name(model._meta.db_table)
+    # user_id kategoriyadan olinadi (fill_users bilan bir xil). Parametrlar: (narxi, soni, nomi_id)
+    categories = connection.ops.quote_name(model._meta.get_field('nomi').related_model._meta.db_table)
+    return (f"INSERT INTO {table} (nomi_id, user_id, narxi, soni) "
+            f"SELECT c.id, c.user_id, %s, %s FROM {categories} c WHERE c.id = %s "
+            f"ON CONFLICT (nomi_id, narxi) DO UPDATE SET soni = {table}.soni + excluded.soni"
+            + (" RETURNING id, soni" if returning else ""))
+
+
+def receive_lot(model, nomi_id, narxi, soni):
+    """
+    Qabul: (kategoriya, narx) partiyasiga qo'shish yoki yangisini yaratish — bitta
+    ``INSERT ... ON CONFLICT DO UPDATE SET soni = soni + excluded.soni`` (SQLite 3.35+, PostgreSQL).
+    Qaytaradi: (partiya id, yangi soni). Kategoriya topilmasa kategoriya modelining DoesNotExist xatosi
+    """
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        cursor.execute(upsert_sql(model, connection, returning=True),
+                       [connection.ops.adapt_decimalfield_value(narxi), soni, nomi_id])
+        row = cursor.fetchone()
+    if row is None:
+        raise model._meta.get_field('nomi').related_model.DoesNotExist('Kategoriya topilmadi!')
+    return row
+
+
+def receive_lots(model, lots, chunk_size=2000):
+    """
+    Ko'p partiyani executemany bilan qabul qilish: lots = [(nomi_id, narxi, soni), ...].
+    Kategoriya topilmasa ``INSERT ... SELECT`` qator yozmaydi — yozilganlar soni kam bo'lsa
+    kategoriya modelining DoesNotExist xatosi (tarix yozilmasligi uchun chaqiruvchi tranzaksiyasi bekor qilinadi)
+    """
+    connection = connections[router.db_for_write(model)]
+    params = [(connection.ops.adapt_decimalfield_value(narxi), soni, nomi_id) for nomi_id, narxi, soni in lots]
+    with connection.cursor() as cursor:
+        for i in range(0, len(params), chunk_size):
+            chunk = params[i:i + chunk_size]
+            cursor.executemany(upsert_sql(model, connection), chunk)
+            if cursor.rowcount != len(chunk):
+                raise model._meta.get_field('nomi').related_model.DoesNotExist('Kategoriya topilmadi!')
+
+
+def transfer_lines(lines, user, source=1, target=2):
+    """
+    Partiyalarni bir skladdan ikkinchisiga bitta tranzaksiyada o'tkazish: ``[{product_id, amount}, ...]``.
+    Manba partiyalari bitta shartli UPDATE bilan kamayadi, qabul qiluvchi skladda shu nomli
+    (``nomi_norm``) kategoriya topiladi yoki yaratiladi va (kategoriya, narx) partiyalari upsert
+    qilinadi, ikkala tarix ``bulk_create`` bilan yoziladi. So'rovlar soni qatorlar soniga bog'liq emas.
+    Qaytaradi: [(manba mahsuloti, qabul qilgan partiya, miqdor), ...]
+    """
+    if source == target or source not in WAREHOUSES or target not in WAREHOUSES:
+        raise BatchError([{'error': "Bunday sklad yo'q!"}])
+    if not isinstance(lines, list):
+        lines = []
+    parsed = parse_lines([dict(line, warehouse=source) if isinstance(line, dict) else line for line in lines])
+    try:
+        with transaction.atomic():
+            return _transfer_lines(source, target, parsed[source], user)
+    except OutOfStock:
+        raise BatchError(batch_errors(parsed, user)) from None
+
+
+def _transfer_lines(source, target, amounts, user):
+    model, history_model = WAREHOUSES[source]
+    target_model, target_history = WAREHOUSES[target]
+    products = take_lots(model, amounts, user)
+    history_model.objects.bulk_create([
+        history_model(nomi=products[pk].nomi, soni=n, status=history_model.StatusType.CHIQDI,
+                      narxi=products[pk].narxi)
+        for pk, n in amounts.items()
+    ])
+
+    categories = target_categories(target_model, [products[pk].nomi for pk in amounts])
+    lots = {}
+    for pk, n in amounts.items():
+        key = (categories[products[pk].nomi_id], products[pk].narxi)
+        lots[key] = lots.get(key, 0) + n
+    receive_lots(target_model, [(nomi_id, narxi, soni) for (nomi_id, narxi), soni in lots.items()])
+    target_history.objects.bulk_create([
+        target_history(nomi_id=nomi_id, soni=soni, status=target_history.StatusType.QABUL, narxi=narxi)
+        for (nomi_id, narxi), soni in lots.items()
+    ])
+
+    received = {(lot.nomi_id, lot.narxi): lot for lot in target_model.objects.select_related('nomi')
+                .filter(nomi_id__in={nomi_id for nomi_id, _ in lots})}
+    return [(products[pk], received[(categories[products[pk].nomi_id], products[pk].narxi)], n)
+            for pk, n in amounts.items()]
+
+
+def target_categories(target_model, source_categories):
+    """
+    Manba kategoriyalariga mos (egasi va ``nomi_norm`` bir xil) qabul qiluvchi sklad kategoriyalari,
+    yo'qlari ``bulk_create`` bilan yaratiladi. Qaytaradi: {manba kategoriya id: qabul qiluvchi kategoriya id}
+    """
+    category_model = target_model._meta.get_field('nomi').related_model
+    wanted = {(category.user_id, normalize_name(category.nomi)): category for category in source_categories}
+    found = {(user_id, nomi_norm): pk for pk, user_id, nomi_norm in category_model.objects.filter(
+        user__in={user_id for user_id, _ in wanted}, nomi_norm__in={nomi_norm for _, nomi_norm in wanted},
+    ).values_list('id', 'user_id', 'nomi_norm')}
+    missing = [category_model(nomi=category.nomi, user_id=category.user_id)
+               for key, category in wanted.items() if key not in found]
+    for category in category_model.objects.bulk_create(missing):
+        found[(category.user_id, category.nomi_norm)] = category.pk
+    return {category.pk: found[(category.user_id, normalize_name(category.nomi))] for category in source_categories}
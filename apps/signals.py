@@ -0,0 +1,96 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Category, FinishCategory, Product, FinishProduct, ProductHistory, FinishProductHistory, \
+    fill_users, history_changed, normalize_name
+from .alerts import threshold_changed
+from .rollups import apply_history
+from .snapshots import invalidate
+from .stock_cache import bump_stock_version
+from . import valuation
+
+HISTORY_MODELS = (ProductHistory, FinishProductHistory)
+
+
+def fill_user(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fill_users(sender, [instance])
+
+
+for model in (Product, FinishProduct) + HISTORY_MODELS:
+    pre_save.connect(fill_user, sender=model)
+
+
+def fill_nomi_norm(sender, instance, **kwargs):
+    # bulk_create uchun CategoryQuerySet to'ldiradi
+    instance.nomi_norm = normalize_name(instance.nomi)
+
+
+for model in (Category, FinishCategory):
+    pre_save.connect(fill_nomi_norm, sender=model)
+
+
+@receiver(history_changed)
+def history_bulk_created(sender, rows, sign, **kwargs):
+    apply_history(sender, rows, sign)
+    invalidate(sender, rows)
+    valuation.apply(sender, rows)
+
+
+def history_pre_save(sender, instance, raw=False, **kwargs):
+    # Tahrirlashda eski qiymatni yig'indidan ayirish uchun saqlab qo'yamiz
+    instance._rollup_old = None
+    if instance.pk and not raw:
+        instance._rollup_old = sender.objects.select_related('nomi').filter(pk=instance.pk).first()
+
+
+def history_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_rollup_old', None)
+    if old is not None:
+        apply_history(sender, [old], sign=-1)
+    apply_history(sender, [instance])
+    invalidate(sender, [instance] + ([old] if old is not None else []))
+    if old is None:
+        valuation.apply(sender, [instance])
+    else:
+        valuation.mark_stale(sender, [old, instance])
+
+
+def history_post_delete(sender, instance, **kwargs):
+    apply_history(sender, [instance], sign=-1)
+    invalidate(sender, [instance])
+    valuation.mark_stale(sender, [instance])
+
+
+for model in HISTORY_MODELS:
+    pre_save.connect(history_pre_save, sender=model)
+    post_save.connect(history_post_save, sender=model)
+    post_delete.connect(history_post_delete, sender=model)
+
+
+def category_changed(sender, instance, raw=False, **kwargs):
+    # Admin orqali nom o'zgarsa yoki o'chirilsa mahsulotlar jadvali keshi eskiradi
+    if not raw:
+        bump_stock_version(instance.user_id)
+
+
+def category_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        threshold_changed(1 if sender is Category else 2, instance)
+
+
+def product_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_stock_version(instance.user_id)
+
+
+for model in (Category, FinishCategory):
+    post_save.connect(category_changed, sender=model)
+    post_save.connect(category_saved, sender=model)
+    post_delete.connect(category_changed, sender=model)
+
+for model in (Product, FinishProduct):
+    post_save.connect(product_changed, sender=model)
+    post_delete.connect(product_changed, sender=model)
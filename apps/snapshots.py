@@ -0,0 +1,183 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+
+from .models import HistoryArchive, StockSnapshot
+from .services import WAREHOUSES
+
+
+def history_delta(history_model, after=None, until=None, **filters):
+    """
+    ``after < created_at <= until`` oralig'idagi harakatlar partiyalar bo'yicha:
+    {(category_id, narxi): qabul - chiqdi}
+    """
+    queryset = history_model.objects.filter(**filters)
+    if after is not None:
+        queryset = queryset.filter(created_at__gt=after)
+    if until is not None:
+        queryset = queryset.filter(created_at__lte=until)
+
+    delta = defaultdict(int)
+    rows = queryset.values_list('nomi_id', 'narxi', 'status').annotate(total=Sum('soni')).order_by()
+    for category_id, narxi, status, total in rows:
+        delta[(category_id, narxi)] += total if status == history_model.StatusType.QABUL else -total
+    return delta
+
+
+def archived_delta(warehouse, after=None, until=None, user=None, category_id=None):
+    """
+    Arxivga ko'chirilgan (apps.archive) ``after < created_at <= until`` harakatlari, ``history_delta``
+    bilan bir xil ko'rinishda. Faqat oraliqqa tushadigan oylar ochiladi.
+    """
+    from .archive import unpack  # apps.archive shu moduldan import qiladi
+
+    archives = HistoryArchive.objects.filter(warehouse=warehouse)
+    if user is not None:
+        archives = archives.filter(user=user)
+    if after is not None:
+        archives = archives.filter(month__gte=after.replace(day=1))
+    if until is not None:
+        archives = archives.filter(month__lte=until)
+
+    _, history_model = WAREHOUSES[warehouse]
+    delta = defaultdict(int)
+    for archive in archives.iterator():
+        for record in unpack(archive.data):
+            day = record['created_at']
+            if not record['nomi_id'] or (after is not None and day <= after) or (until is not None and day > until):
+                continue
+            nomi_id = int(record['nomi_id'])
+            if category_id is not None and nomi_id != category_id:
+                continue
+            soni = record['soni'] if record['status'] == history_model.StatusType.QABUL else -record['soni']
+            delta[(nomi_id, record['narxi'])] += soni
+    return delta
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def archive_boundary(warehouse):
+    """
+    Shu kundan oldingi tarix arxivga ko'chirilgan (apps.archive), None — arxiv yo'q.
+    Chegaradan bir kun oldingi snapshot tiklash uchun asos, u o'chirilmaydi.
+    """
+    month = HistoryArchive.objects.filter(warehouse=warehouse).aggregate(month=Max('month'))['month']
+    return next_month(month) if month else None
+
+
+def nearest_snapshot(warehouse, day=None):
+    snapshots = StockSnapshot.objects.filter(warehouse=warehouse)
+    if day is not None:
+        snapshots = snapshots.filter(day__lte=day)
+    return snapshots.aggregate(day=Max('day'))['day']
+
+
+def stock_at(warehouse, day, user=None, category_id=None):
+    """
+    ``day`` kuni oxiridagi qoldiq (None — hozirgi): eng yaqin snapshot + undan keyingi tarix. O'qiladigan
+    tarix snapshotlar oralig'i bilan cheklangan. Snapshot arxiv chegarasidan oldin qolsa (yoki yo'q bo'lsa),
+    oradagi arxivlangan harakatlar arxivdan o'qiladi.
+    Qaytaradi: (snapshot kuni yoki None, {(category_id, narxi): soni})
+    """
+    _, history_model = WAREHOUSES[warehouse]
+    snapshot_filters, history_filters = {}, {}
+    if user is not None:
+        snapshot_filters['user'] = user
+        history_filters['user'] = user
+    if category_id is not None:
+        snapshot_filters['category_id'] = category_id
+        history_filters['nomi_id'] = category_id
+
+    base_day = nearest_snapshot(warehouse, day)
+    stock = defaultdict(int)
+    if base_day is not None:
+        rows = StockSnapshot.objects.filter(warehouse=warehouse, day=base_day, **snapshot_filters)
+        for snapshot_category, narxi, soni in rows.values_list('category_id', 'narxi', 'soni'):
+            stock[(snapshot_category, narxi)] += soni
+    for key, soni in history_delta(history_model, base_day, day, **history_filters).items():
+        stock[key] += soni
+    boundary = archive_boundary(warehouse)
+    if boundary and (base_day is None or base_day < boundary - timedelta(days=1)):
+        for key, soni in archived_delta(warehouse, base_day, day, user, category_id).items():
+            stock[key] += soni
+    return base_day, {key: soni for key, soni in stock.items() if soni}
+
+
+def take_snapshot(warehouse, day, chunk_size=2000):
+    """``day`` uchun snapshot yaratish (bor bo'lsa hech narsa qilmaydi). Yaratilgan qatorlar soni."""
+    if StockSnapshot.objects.filter(warehouse=warehouse, day=day).exists():
+        return 0
+    _, history_model = WAREHOUSES[warehouse]
+    _, stock = stock_at(warehouse, day)
+    category_model = history_model._meta.get_field('nomi').related_model
+    users = dict(category_model.objects.filter(id__in={category_id for category_id, _ in stock})
+                 .values_list('id', 'user_id'))
+    return len(StockSnapshot.objects.bulk_create([
+        StockSnapshot(user_id=users.get(category_id), warehouse=warehouse, category_id=category_id,
+                      narxi=narxi, day=day, soni=soni)
+        for (category_id, narxi), soni in stock.items()
+    ], batch_size=chunk_size))
+
+
+def build_snapshots(interval=None, until=None):
+    """
+    Oxirgi snapshotdan (bo'lmasa tarixning birinchi kunidan) ``until`` gacha (standart: kecha)
+    har ``interval`` kunda snapshot olish. Har biri oldingisidan quriladi.
+    Qaytaradi: {warehouse: yaratilgan snapshot kunlari soni}
+    """
+    interval = timedelta(days=interval or settings.STOCK_SNAPSHOT_INTERVAL)
+    until = until or date.today() - timedelta(days=1)
+    created = {}
+    for warehouse, (_, history_model) in WAREHOUSES.items():
+        last = StockSnapshot.objects.filter(warehouse=warehouse).aggregate(day=Max('day'))['day']
+        day = last + interval if last else history_model.objects.aggregate(day=Min('created_at'))['day']
+        created[warehouse] = 0
+        while day is not None and day <= until:
+            with transaction.atomic():
+                take_snapshot(warehouse, day)
+            created[warehouse] += 1
+            day += interval
+    return created
+
+
+def compact(keep_days, interval):
+    """
+    ``keep_days`` kundan eski snapshotlarni siyraklashtirish: ular orasida har ``interval``
+    kunda bittasi qoladi. Qolgan snapshotlar mustaqil, shuning uchun tiklash to'g'riligicha qoladi.
+    Qaytaradi: o'chirilgan snapshot kunlari soni
+    """
+    cutoff = date.today() - timedelta(days=keep_days)
+    removed = 0
+    for warehouse in WAREHOUSES:
+        days = (StockSnapshot.objects.filter(warehouse=warehouse, day__lt=cutoff)
+                .values_list('day', flat=True).distinct().order_by('day'))
+        boundary = archive_boundary(warehouse)
+        base = boundary - timedelta(days=1) if boundary else None
+        kept, drop = None, []
+        for day in days:
+            if kept is None or (day - kept).days >= interval or day == base:
+                kept = day
+            else:
+                drop.append(day)
+        StockSnapshot.objects.filter(warehouse=warehouse, day__in=drop).delete()
+        removed += len(drop)
+    return removed
+
+
+def invalidate(history_model, rows):
+    """
+    O'tgan kunga tarix yozilsa (import, admin tahriri yoki o'chirish) o'sha kundan keyingi
+    snapshotlar eskiradi. Bugungi sotuv va qabullar uchun so'rov yuborilmaydi.
+    """
+    days = [row.created_at for row in rows if row.created_at]
+    if not days or min(days) >= date.today():
+        return
+    warehouse = next(w for w, (_, model) in WAREHOUSES.items() if model is history_model)
+    boundary = archive_boundary(warehouse)
+    day = max(min(days), boundary) if boundary else min(days)
+    StockSnapshot.objects.filter(warehouse=warehouse, day__gte=day).delete()
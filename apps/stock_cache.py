@@ -0,0 +1,50 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'stock-version:{}'
+
+
+def stock_version(user_id):
+    """
+    Foydalanuvchi qoldig'ining versiyasi. Boshlang'ich qiymat vaqtdan olinadi, shuning
+    uchun kalit keshdan chiqib ketsa ham eski versiya (va eski ETag) qaytib kelmaydi.
+    """
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def _bump(user_id):
+    key = VERSION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_stock_version(*user_ids):
+    """
+    Qoldiq o'zgarganda chaqiriladi. Versiya darhol va tranzaksiya commit bo'lgandan keyin
+    yana oshiriladi: oradagi o'qish eski ma'lumotni yangi versiya ostida keshlab qo'ysa ham,
+    commitdan keyingi oshirish uni eskirtiradi.
+    """
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        _bump(user_id)
+        transaction.on_commit(lambda user_id=user_id: _bump(user_id))
+
+
+def cached_stock(user_id, key, build):
+    """``build()`` natijasini joriy versiya ostida keshlash"""
+    cache_key = f"stock:{user_id}:{stock_version(user_id)}:{key}"
+    value = cache.get(cache_key)
+    if value is None:
+        value = build()
+        cache.set(cache_key, value)
+    return value
@@ -0,0 +1,159 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.db import transaction
+
+from .models import Category, FinishCategory, normalize_name
+from .services import WAREHOUSES, OutOfStock, receive_lots, take_lots
+from .stock_cache import bump_stock_version
+
+# Sklad raqami -> kategoriya modeli
+CATEGORY_MODELS = {1: Category, 2: FinishCategory}
+
+
+class StockImportError(ValueError):
+    pass
+
+
+def read_rows(path):
+    """CSV yoki JSON fayldan qatorlarni o'qish: sklad, nomi, soni, narxi, [status, sana]"""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        with path.open(encoding='utf-8') as f:
+            return json.load(f)
+    with path.open(encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def parse_row(number, row, history=False):
+    try:
+        warehouse = int(row['sklad'])
+        nomi = str(row['nomi']).strip()
+        soni = int(row['soni'])
+        narxi = Decimal(str(row.get('narxi') or 0)).quantize(Decimal('0.01'))
+        if warehouse not in WAREHOUSES or not nomi or soni < 0:
+            raise ValueError
+        if not history:
+            return warehouse, nomi, soni, narxi
+        status = row.get('status') or WAREHOUSES[warehouse][1].StatusType.QABUL
+        if status not in WAREHOUSES[warehouse][1].StatusType.values:
+            raise ValueError
+        sana = date.fromisoformat(str(row['sana'])) if row.get('sana') else date.today()
+        return warehouse, nomi, soni, narxi, status, sana
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise StockImportError(f"{number}-qator yaroqsiz: {row}") from None
+
+
+def resolve_categories(user, names_by_warehouse, chunk_size):
+    """
+    Kategoriyalarni bitta o'tishda ``nomi_norm`` bo'yicha topish (katta-kichik harf, tutuq belgisi va
+    bo'shliqlar farqi yangi kategoriya yaratmaydi), yo'qlarini bulk_create bilan yaratish.
+    Qaytaradi: {warehouse: {nomi: category_id}}
+    """
+    result = {}
+    for warehouse, names in names_by_warehouse.items():
+        category_model = CATEGORY_MODELS[warehouse]
+        wanted = {}
+        for nomi in sorted(names):
+            wanted.setdefault(normalize_name(nomi), nomi)
+        # Bir xil nomli bir nechta kategoriya bo'lsa eng birinchisi
+        ids = dict(category_model.objects.filter(user=user, nomi_norm__in=wanted).order_by('-id')
+                   .values_list('nomi_norm', 'id'))
+        missing = [category_model(nomi=nomi, user=user) for nomi_norm, nomi in wanted.items() if nomi_norm not in ids]
+        for category in category_model.objects.bulk_create(missing, batch_size=chunk_size):
+            ids[category.nomi_norm] = category.id
+        result[warehouse] = {nomi: ids[normalize_name(nomi)] for nomi in names}
+    return result
+
+
+def import_stock(rows, user, chunk_size=2000):
+    """
+    Boshlang'ich qoldiqni yuklash. Bir xil (kategoriya, narx) qatorlar ``form_valid``
+    dagidek bitta partiyaga qo'shiladi va har biri uchun "qabul" tarixi yoziladi.
+    Telegram xabari yuborilmaydi. Qaytaradi: (yaratilgan, yangilangan) partiyalar soni.
+    """
+    lots = {}
+    for number, row in enumerate(rows, start=1):
+        warehouse, nomi, soni, narxi = parse_row(number, row)
+        key = (warehouse, nomi, narxi)
+        lots[key] = lots.get(key, 0) + soni
+
+    names = {}
+    for warehouse, nomi, _ in lots:
+        names.setdefault(warehouse, set()).add(nomi)
+
+    created = updated = 0
+    with transaction.atomic():
+        categories = resolve_categories(user, names, chunk_size)
+        for warehouse, (model, history_model) in WAREHOUSES.items():
+            existing = set(model.objects.filter(user=user).values_list('nomi_id', 'narxi'))
+            # Yozilishi farq qiladigan nomlar bitta kategoriyaga tushishi mumkin — partiyalar qayta birlashtiriladi
+            merged_lots = {}
+            for (lot_warehouse, nomi, narxi), soni in lots.items():
+                if lot_warehouse == warehouse and soni:
+                    key = (categories[warehouse][nomi], narxi)
+                    merged_lots[key] = merged_lots.get(key, 0) + soni
+            receipts = [(nomi_id, narxi, soni) for (nomi_id, narxi), soni in merged_lots.items()]
+            receive_lots(model, receipts, chunk_size)
+            history = [history_model(nomi_id=nomi_id, soni=soni, narxi=narxi, status=history_model.StatusType.QABUL)
+                       for nomi_id, narxi, soni in receipts]
+            for i in range(0, len(history), chunk_size):
+                history_model.objects.bulk_create(history[i:i + chunk_size])
+            merged = sum((nomi_id, narxi) in existing for nomi_id, narxi, _ in receipts)
+            updated += merged
+            created += len(receipts) - merged
+        bump_stock_version(user.pk)
+    return created, updated
+
+
+def import_history(rows, user, chunk_size=2000):
+    """
+    Eski harakatlarni (sana va holati bilan) tarixga yuklash. Harakatlar qoldiqqa ham qo'llanadi:
+    har (kategoriya, narx) partiyasiga qabul va chiqimlar farqi qo'shiladi yoki ayiriladi, shunda
+    partiyalar tarixga mos qoladi (reconcile_stock). Partiyada yetmasa StockImportError.
+    """
+    parsed = [parse_row(number, row, history=True) for number, row in enumerate(rows, start=1)]
+    names = {}
+    for warehouse, nomi, *_ in parsed:
+        names.setdefault(warehouse, set()).add(nomi)
+
+    with transaction.atomic():
+        categories = resolve_categories(user, names, chunk_size)
+        for warehouse, (model, history_model) in WAREHOUSES.items():
+            history = [
+                history_model(nomi_id=categories[warehouse][nomi], soni=soni, narxi=narxi, status=status,
+                              created_at=sana)
+                for row_warehouse, nomi, soni, narxi, status, sana in parsed if row_warehouse == warehouse
+            ]
+            deltas = {}
+            for row in history:
+                key = (row.nomi_id, row.narxi)
+                deltas[key] = deltas.get(key, 0) + (row.soni if row.status == history_model.StatusType.QABUL
+                                                    else -row.soni)
+            apply_deltas(warehouse, model, user, deltas, chunk_size)
+            for i in range(0, len(history), chunk_size):
+                history_model.objects.bulk_create(history[i:i + chunk_size])
+        bump_stock_version(user.pk)
+    return len(parsed)
+
+
+def apply_deltas(warehouse, model, user, deltas, chunk_size):
+    """Partiyalarga {(nomi_id, narxi): farq}: musbati receive_lots bilan, manfiysi take_lots bilan"""
+    receive_lots(model, [(nomi_id, narxi, soni) for (nomi_id, narxi), soni in deltas.items() if soni > 0],
+                 chunk_size)
+    taken = {key: -soni for key, soni in deltas.items() if soni < 0}
+    lots = {(nomi_id, narxi): (pk, soni) for pk, nomi_id, narxi, soni in model.objects.filter(
+        user=user, nomi_id__in={nomi_id for nomi_id, _ in taken}).values_list('id', 'nomi_id', 'narxi', 'soni')}
+    for (nomi_id, narxi), soni in taken.items():
+        if lots.get((nomi_id, narxi), (None, 0))[1] < soni:
+            raise StockImportError(f"{warehouse}-sklad, kategoriya {nomi_id}, narxi {narxi}: "
+                                   f"chiqim uchun qoldiq yetmaydi ({soni} ta)")
+    amounts = [(lots[key][0], soni) for key, soni in taken.items()]
+    try:
+        for i in range(0, len(amounts), chunk_size):
+            take_lots(model, dict(amounts[i:i + chunk_size]), user)
+    except OutOfStock:
+        raise StockImportError(f"{warehouse}-sklad: chiqim uchun qoldiq yetmaydi") from None
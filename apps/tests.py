@@ -1,3 +1,1397 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import custom_admin_site, update_total_price
+from .archive import archive_history, month_start, search_archive
+from .benchmarks import ENDPOINTS, percentile, run, seed
+from .db import pin_to_primary, replica_reads, use_replica
+from .events import broker, format_event, stream
+from .middleware import PrimaryPinMiddleware, QueryTimingMiddleware
+from .models import Category, Product, ProductHistory, Notification, FinishCategory, FinishProduct, \
+    FinishProductHistory, CategoryValuation, FifoLayer, HistoryArchive, HistoryRollup, StockSnapshot, normalize_name
+from .notifications import FakeTelegramClient, RateLimiter, enqueue, process_batch
+from .reconcile import reconcile
+from .rollups import rebuild, totals
+from .search import autocomplete, search_categories
+from .services import OutOfStock, sell_lot, sell_lines, receive_lot, receive_lots
+from .snapshots import build_snapshots, compact, stock_at
+from .stock_cache import VERSION_KEY, stock_version
+from .stock_import import StockImportError, import_history, import_stock
+from . import valuation
+from .valuation import check
+
+
+@override_settings(TELEGRAM_CLIENT='apps.notifications.FakeTelegramClient', TELEGRAM_CHAT_ID='42')
+class SellProductTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kassir', password='parol')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.product = Product.objects.create(nomi=self.category, soni=10, narxi=5000)
+
+    def sell(self, amount):
+        return self.client.post(reverse('sell_product'),
+                                data=json.dumps({'product_id': self.product.pk, 'decrease_amount': amount}),
+                                content_type='application/json').json()
+
+    def test_sell_writes_history_and_queues_notification(self):
+        with mock.patch.object(FakeTelegramClient, 'send_message') as send_message:
+            data = self.sell(3)
+
+        self.assertEqual(data, {'success': True, 'new_quantity': 7})
+        self.assertEqual(ProductHistory.objects.get().soni, 3)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.user, self.user)
+        self.assertEqual(notification.chat_id, '42')
+        self.assertIn('Qoldi: 7', notification.text)
+        send_message.assert_not_called()
+
+    def test_category_name_is_escaped_for_markdown(self):
+        self.category.nomi = 'Un_oliy*nav'
+        self.category.save()
+        self.sell(1)
+
+        client = FakeTelegramClient()
+        self.assertEqual(process_batch(client=client, limiter=RateLimiter(0)), 1)
+        self.assertIn('Nomi: Un\\_oliy\\*nav', client.outbox[0]['text'])
+
+    def test_oversell_writes_nothing(self):
+        data = self.sell(11)
+
+        self.assertFalse(data['success'])
+        self.assertFalse(ProductHistory.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+
+    def test_non_positive_amount_is_rejected(self):
+        self.assertFalse(self.sell(-5)['success'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.soni, 10)
+
+
+@override_settings(TELEGRAM_CHAT_ID='42')
+class ReceiptTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kassir')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.client.force_login(self.user)
+
+    def test_receipts_with_same_price_merge_into_one_lot(self):
+        for soni in (3, 4):
+            response = self.client.post(reverse('product_create'),
+                                        {'nomi': self.category.pk, 'soni': soni, 'narxi': '1500'})
+            self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.client.post(reverse('product_create'), {'nomi': self.category.pk, 'soni': 1, 'narxi': '2000'})
+
+        self.assertEqual(sorted(Product.objects.values_list('narxi', 'soni')), [(1500, 7), (2000, 1)])
+        self.assertEqual(ProductHistory.objects.filter(status=ProductHistory.StatusType.QABUL).count(), 3)
+        self.assertIn('Jami : 7', Notification.objects.order_by('id')[1].text)
+
+    def test_receive_lot_is_a_single_upsert(self):
+        finish_category = FinishCategory.objects.create(nomi='Non', user=self.user)
+        with self.assertNumQueries(1):
+            lot_id, soni = receive_lot(FinishProduct, finish_category.pk, 3000, 5)
+        self.assertEqual(receive_lot(FinishProduct, finish_category.pk, 3000, 2), (lot_id, 7))
+
+    def test_category_deleted_after_validation(self):
+        def delete_then_receive(model, nomi_id, narxi, soni):
+            Category.objects.filter(pk=nomi_id).delete()
+            return receive_lot(model, nomi_id, narxi, soni)
+
+        with self.assertRaises(Category.DoesNotExist):
+            receive_lot(Product, self.category.pk + 100, 1500, 1)
+        with mock.patch('apps.views.receive_lot', side_effect=delete_then_receive):
+            response = self.client.post(reverse('product_create'),
+                                        {'nomi': self.category.pk, 'soni': 1, 'narxi': '1500'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.context_data['form'].errors['nomi'], ['Kategoriya topilmadi!'])
+        self.assertFalse(Product.objects.exists() or ProductHistory.objects.exists())
+
+
+class SellBatchTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('kassir')
+        self.client.force_login(user)
+        category = Category.objects.create(nomi='Un', user=user)
+        finish_category = FinishCategory.objects.create(nomi='Non', user=user)
+        self.products = [Product.objects.create(nomi=category, soni=10, narxi=i) for i in range(15)]
+        self.finish_products = [FinishProduct.objects.create(nomi=finish_category, soni=10, narxi=i)
+                                for i in range(15)]
+
+    def sell(self, items):
+        return self.client.post(reverse('sell_batch'), data=json.dumps({'items': items}),
+                                content_type='application/json').json()
+
+    def lines(self, count):
+        return ([{'warehouse': 1, 'product_id': p.pk, 'amount': 2} for p in self.products[:count]] +
+                [{'warehouse': 2, 'product_id': p.pk, 'amount': 3} for p in self.finish_products[:count]])
+
+    def test_batch_sells_both_warehouses(self):
+        data = self.sell(self.lines(2) + [{'warehouse': 1, 'product_id': self.products[0].pk, 'amount': 1}])
+
+        self.assertTrue(data['success'])
+        quantities = {(item['warehouse'], item['product_id']): item['new_quantity'] for item in data['items']}
+        self.assertEqual(quantities[(1, self.products[0].pk)], 7)
+        self.assertEqual(quantities[(2, self.finish_products[1].pk)], 7)
+        self.assertEqual(ProductHistory.objects.count(), 2)
+        self.assertEqual(FinishProductHistory.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.sell(self.lines(1))  # kunlik hisobot qatorlari yaratiladi
+        with CaptureQueriesContext(connection) as small:
+            self.sell(self.lines(2))
+        with CaptureQueriesContext(connection) as large:
+            self.sell(self.lines(15))
+        self.assertEqual(len(small), len(large))
+
+    def test_one_bad_line_rolls_back_everything(self):
+        data = self.sell(self.lines(3) + [{'warehouse': 2, 'product_id': self.finish_products[5].pk, 'amount': 11}])
+
+        self.assertFalse(data['success'])
+        self.assertEqual(data['errors'], [{'warehouse': 2, 'product_id': self.finish_products[5].pk,
+                                           'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'}])
+        self.assertFalse(Product.objects.exclude(soni=10).exists())
+        self.assertFalse(FinishProduct.objects.exclude(soni=10).exists())
+        self.assertFalse(ProductHistory.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.post(reverse('sell_batch'), data=json.dumps({'items': self.lines(1)}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Product.objects.exclude(soni=10).exists())
+
+    def test_other_users_lots_are_not_found(self):
+        self.client.force_login(User.objects.create_user('begona'))
+        data = self.sell(self.lines(1))
+
+        self.assertFalse(data['success'])
+        self.assertEqual([error['error'] for error in data['errors']], ['Mahsulot topilmadi!'] * 2)
+        self.assertFalse(Product.objects.exclude(soni=10).exists())
+        self.assertFalse(FinishProduct.objects.exclude(soni=10).exists())
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokon')
+        self.client.force_login(self.user)
+        un = Category.objects.create(nomi='Un', user=self.user)
+        self.lots = [Product.objects.create(nomi=un, soni=10, narxi=1000),
+                     Product.objects.create(nomi=un, soni=10, narxi=2000),
+                     Product.objects.create(nomi=Category.objects.create(nomi='Shakar', user=self.user),
+                                            soni=5, narxi=500)]
+        self.finish_un = FinishCategory.objects.create(nomi=' UN', user=self.user)
+
+    def transfer(self, items, **data):
+        return self.client.post(reverse('transfer'), data=json.dumps({'items': items, **data}),
+                                content_type='application/json').json()
+
+    def test_transfer_moves_lots_in_one_batch(self):
+        data = self.transfer([{'product_id': self.lots[0].pk, 'amount': 3},
+                              {'product_id': self.lots[1].pk, 'amount': 2},
+                              {'product_id': self.lots[2].pk, 'amount': 5},
+                              {'product_id': self.lots[0].pk, 'amount': 1}])
+
+        self.assertTrue(data['success'])
+        self.assertEqual([item['new_quantity'] for item in data['items']], [6, 8, 0])
+        self.assertEqual(sorted(FinishProduct.objects.values_list('nomi__nomi', 'narxi', 'soni')),
+                         [(' UN', 1000, 4), (' UN', 2000, 2), ('Shakar', 500, 5)])
+        self.assertEqual(FinishCategory.objects.get(nomi='Shakar').user, self.user)
+        self.assertEqual(sorted(ProductHistory.objects.values_list('status', 'soni')),
+                         [('chiqdi', 2), ('chiqdi', 4), ('chiqdi', 5)])
+        self.assertEqual(sorted(FinishProductHistory.objects.values_list('status', 'soni')),
+                         [('qabul', 2), ('qabul', 4), ('qabul', 5)])
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_shortage_rolls_back_everything(self):
+        data = self.transfer([{'product_id': self.lots[0].pk, 'amount': 3},
+                              {'product_id': self.lots[2].pk, 'amount': 6}])
+
+        self.assertFalse(data['success'])
+        self.assertEqual(data['errors'], [{'warehouse': 1, 'product_id': self.lots[2].pk,
+                                           'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'}])
+        self.assertFalse(Product.objects.exclude(soni__in=[10, 5]).exists())
+        self.assertFalse(FinishProduct.objects.exists())
+        self.assertFalse(ProductHistory.objects.exists())
+        self.assertEqual(self.transfer([], **{'from': 2, 'to': 2})['error'], "Bunday sklad yo'q!")
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.post(reverse('transfer'), content_type='application/json',
+                                    data=json.dumps({'items': [{'product_id': self.lots[0].pk, 'amount': 1}]}))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Product.objects.get(pk=self.lots[0].pk).soni, 10)
+
+    def test_other_users_lots_are_not_moved(self):
+        self.client.force_login(User.objects.create_user('begona'))
+        data = self.transfer([{'product_id': self.lots[2].pk, 'amount': 1}])
+
+        self.assertEqual(data['errors'], [{'warehouse': 1, 'product_id': self.lots[2].pk,
+                                           'error': 'Mahsulot topilmadi!'}])
+        self.assertEqual(Product.objects.get(pk=self.lots[2].pk).soni, 5)
+        self.assertFalse(FinishCategory.objects.filter(nomi='Shakar').exists())
+        self.assertFalse(FinishProduct.objects.exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        for i in range(10):
+            self.lots.append(Product.objects.create(nomi=Category.objects.create(nomi=f"Tuz {i}", user=self.user),
+                                                    soni=10, narxi=100))
+        lines = [{'product_id': lot.pk, 'amount': 1} for lot in self.lots]
+        self.transfer(lines)  # qabul qiluvchi kategoriyalar va partiyalar yaratiladi
+        with CaptureQueriesContext(connection) as small:
+            self.transfer(lines[:2])
+        with CaptureQueriesContext(connection) as large:
+            self.transfer(lines)
+        self.assertEqual(len(small), len(large))
+
+
+class HistoryRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='parol')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.product = Product.objects.create(nomi=self.category, soni=100, narxi=1500)
+        self.other = Product.objects.create(nomi=Category.objects.create(nomi='Guruch', user=self.user),
+                                            soni=100, narxi=2000)
+
+    def rollup(self):
+        return sorted(HistoryRollup.objects.values_list('warehouse', 'category_id', 'status', 'soni', 'summa'))
+
+    def test_rollup_follows_every_history_write(self):
+        sell_lot(Product, ProductHistory, self.product.pk, 3)
+        sell_lines([{'warehouse': 1, 'product_id': self.product.pk, 'amount': 2},
+                    {'warehouse': 1, 'product_id': self.other.pk, 'amount': 1}], self.user)
+        ProductHistory.objects.create(nomi=self.category, soni=10, narxi=1000,
+                                      status=ProductHistory.StatusType.QABUL)
+        self.assertEqual(self.rollup(), [
+            (1, self.category.pk, 'chiqdi', 5, 7500),
+            (1, self.category.pk, 'qabul', 10, 10000),
+            (1, self.other.nomi_id, 'chiqdi', 1, 2000),
+        ])
+
+        # admin'da holatni o'zgartirish va o'chirish
+        history = ProductHistory.objects.get(status=ProductHistory.StatusType.QABUL)
+        history.status = ProductHistory.StatusType.CHIQDI
+        history.save()
+        ProductHistory.objects.filter(nomi=self.other.nomi).delete()
+        self.assertEqual(self.rollup(), [
+            (1, self.category.pk, 'chiqdi', 15, 17500),
+            (1, self.category.pk, 'qabul', 0, 0),
+            (1, self.other.nomi_id, 'chiqdi', 0, 0),
+        ])
+
+        incremental = self.rollup()
+        rebuild()
+        self.assertEqual([row for row in self.rollup()], [row for row in incremental if row[3]])
+
+    def test_backfill_migration(self):
+        sell_lot(Product, ProductHistory, self.product.pk, 3)
+        ProductHistory.objects.create(nomi=self.category, soni=10, narxi=1000,
+                                      status=ProductHistory.StatusType.QABUL,
+                                      created_at=date.today() - timedelta(days=1))
+        incremental = self.rollup()
+        HistoryRollup.objects.all().delete()
+
+        migration = importlib.import_module('apps.migrations.0014_backfill_history_rollup')
+        migration.backfill_rollups(django_apps, None)
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_admin_total_reads_rollup(self):
+        sell_lot(Product, ProductHistory, self.product.pk, 3)
+        sell_lot(Product, ProductHistory, self.other.pk, 2)
+        self.client.force_login(self.user)
+        url = reverse('custom_admin:apps_producthistory_changelist')
+
+        response = self.client.get(url, {'nomi__id__exact': self.category.pk, 'status__exact': 'chiqdi'})
+        self.assertEqual(response.context_data['title'], "Umumiy mahsulotlar narxi: 4,500 so'm")
+
+        response = self.client.get(url)
+        expected = update_total_price(ProductHistory.objects.all())
+        self.assertEqual(response.context_data['title'], f"Umumiy mahsulotlar narxi: {expected:,} so'm")
+
+
+class HistoryExportTest(TestCase):
+    def test_export_streams_filtered_rows(self):
+        user = User.objects.create_superuser('admin')
+        category = Category.objects.create(nomi='Un', user=user)
+        ProductHistory.objects.create(nomi=category, soni=2, narxi=1500, status=ProductHistory.StatusType.CHIQDI)
+        ProductHistory.objects.create(nomi=category, soni=5, narxi=1000, status=ProductHistory.StatusType.QABUL)
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('custom_admin:apps_producthistory_export'), {'status__exact': 'qabul'})
+        # Oqimdan oldin tarixga na sahifa, na COUNT so'rovi
+        self.assertFalse([query['sql'] for query in queries if 'apps_producthistory' in query['sql']])
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'Sana,Nomi,Holat,Soni,Narxi,Summa')
+        self.assertEqual(lines[1:], [f"{timezone.localdate()},Un,Qabul,5,1000.00,5000.00"])
+
+
+class StockSnapshotTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.today = date.today()
+
+    def move(self, days_ago, soni, status, narxi=1000):
+        ProductHistory.objects.create(nomi=self.category, soni=soni, narxi=narxi, status=status,
+                                      created_at=self.today - timedelta(days=days_ago))
+
+    def seed(self):
+        qabul, chiqdi = ProductHistory.StatusType.QABUL, ProductHistory.StatusType.CHIQDI
+        self.move(10, 20, qabul)
+        self.move(8, 5, chiqdi)
+        self.move(6, 7, qabul, narxi=1200)
+        self.move(3, 4, chiqdi)
+        self.move(1, 2, chiqdi, narxi=1200)
+
+    def expected(self, days_ago):
+        return {
+            10: {(self.category.pk, 1000): 20},
+            8: {(self.category.pk, 1000): 15},
+            5: {(self.category.pk, 1000): 15, (self.category.pk, 1200): 7},
+            2: {(self.category.pk, 1000): 11, (self.category.pk, 1200): 7},
+            0: {(self.category.pk, 1000): 11, (self.category.pk, 1200): 5},
+        }[days_ago]
+
+    def test_snapshots_give_the_same_answer_as_full_replay(self):
+        self.seed()
+        for days_ago in (10, 8, 5, 2, 0):
+            self.assertEqual(stock_at(1, self.today - timedelta(days=days_ago))[1], self.expected(days_ago))
+
+        self.assertEqual(build_snapshots(interval=3), {1: 4, 2: 0})
+        for days_ago in (8, 5, 2, 0):
+            snapshot_day, stock = stock_at(1, self.today - timedelta(days=days_ago), user=self.user)
+            self.assertIsNotNone(snapshot_day)
+            self.assertEqual(stock, self.expected(days_ago))
+
+    def test_backdated_history_invalidates_later_snapshots(self):
+        self.seed()
+        build_snapshots(interval=1)
+        self.move(4, 1, ProductHistory.StatusType.CHIQDI)
+
+        self.assertFalse(StockSnapshot.objects.filter(day__gte=self.today - timedelta(days=4)).exists())
+        self.assertEqual(stock_at(1, self.today)[1][(self.category.pk, 1000)], 10)
+
+    def test_compact_keeps_one_snapshot_per_interval(self):
+        self.seed()
+        build_snapshots(interval=1)
+        compact(keep_days=2, interval=4)
+
+        days = sorted({(self.today - day).days for day in StockSnapshot.objects.values_list('day', flat=True)})
+        self.assertEqual(days, [1, 2, 6, 10])
+        self.assertEqual(stock_at(1, self.today - timedelta(days=5))[1], self.expected(5))
+
+    def test_admin_stock_at_view(self):
+        self.seed()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:apps_producthistory_stock_at'),
+                                   {'sana': self.today - timedelta(days=5)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['narxi'], row['soni']) for row in response.context['rows']], [(1000, 15), (1200, 7)])
+        self.assertEqual(response.context['total_summa'], 23400)
+
+
+class HistoryArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.months = [month_start(date.today())]
+        for _ in range(3):
+            self.months.append(month_start(self.months[-1] - timedelta(days=1)))
+        qabul, chiqdi = ProductHistory.StatusType.QABUL, ProductHistory.StatusType.CHIQDI
+        for month, offset, soni, status in ((3, 2, 20, qabul), (2, 5, 5, chiqdi), (1, 3, 2, chiqdi), (0, 0, 4, qabul)):
+            self.move(self.months[month] + timedelta(days=offset), soni, status)
+
+    def move(self, day, soni, status):
+        ProductHistory.objects.create(nomi=self.category, soni=soni, narxi=1000, status=status, created_at=day)
+
+    def test_archive_moves_old_rows_and_keeps_totals(self):
+        before = totals(self.user, 1)
+        self.assertEqual(archive_history(1, self.months[1] + timedelta(days=10)), 2)
+
+        self.assertEqual(ProductHistory.objects.count(), 2)
+        self.assertEqual(list(HistoryArchive.objects.order_by('month').values_list('month', 'rows', 'soni')),
+                         [(self.months[3], 1, 20), (self.months[2], 1, 5)])
+        self.assertEqual(totals(self.user, 1), before)
+        rebuild()
+        self.assertEqual(totals(self.user, 1), before)
+
+        key = (self.category.pk, 1000)
+        self.assertEqual(stock_at(1, self.months[1] - timedelta(days=1))[1], {key: 15})
+        self.assertEqual(stock_at(1, date.today())[1], {key: 17})
+
+    def test_stock_before_boundary_without_snapshot_replays_archive(self):
+        archive_history(1, self.months[1])
+        StockSnapshot.objects.all().delete()
+
+        key = (self.category.pk, 1000)
+        self.assertEqual(stock_at(1, self.months[3] + timedelta(days=3))[1], {key: 20})
+        self.assertEqual(stock_at(1, self.months[2] + timedelta(days=10), user=self.user)[1], {key: 15})
+        self.assertEqual(stock_at(1, self.months[2], category_id=self.category.pk + 1)[1], {})
+        self.assertEqual(stock_at(1, date.today())[1], {key: 17})
+
+    def test_second_run_merges_into_existing_partition(self):
+        archive_history(1, self.months[1])
+        self.move(self.months[2] + timedelta(days=1), 3, ProductHistory.StatusType.QABUL)
+        archive_history(1, self.months[1])
+
+        archive = HistoryArchive.objects.get(month=self.months[2])
+        self.assertEqual((archive.rows, archive.soni, archive.summa), (2, 8, 8000))
+
+    def test_admin_total_skips_archived_months(self):
+        archive_history(1, self.months[1])
+        Category.objects.create(nomi='Shakar', user=self.user)
+        self.client.force_login(self.user)
+        url = reverse('custom_admin:apps_producthistory_changelist')
+
+        live = f"Umumiy mahsulotlar narxi: {update_total_price(ProductHistory.objects.all()):,} so'm"
+        for params in ({}, {'q': 'un'}, {'created_at__range__gte': self.months[3]}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.context_data['title'], live)
+        response = self.client.get(url, {'q': 'shakar'})
+        self.assertEqual(response.context_data['title'], "Umumiy mahsulotlar narxi: 0 so'm")
+
+    def test_search_archive(self):
+        archive_history(1, self.months[1])
+
+        rows, count, soni, summa = search_archive(1, self.user, query='UN', status='chiqdi')
+        self.assertEqual((count, soni, summa), (1, 5, 5000))
+        self.assertEqual(rows[0]['created_at'], self.months[2] + timedelta(days=5))
+        self.assertEqual(search_archive(1, self.user, month_from=self.months[2])[1], 1)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:apps_producthistory_archive'),
+                                   {'month_to': self.months[3].strftime('%Y-%m'), 'q': 'un'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['count'], 1)
+        self.assertEqual(response.context['total_soni'], 20)
+
+
+class DenormalizedUserTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokon')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.finish_category = FinishCategory.objects.create(nomi='Non', user=self.user)
+
+    def test_user_is_filled_on_every_write_path(self):
+        product = Product.objects.create(nomi=self.category, soni=5, narxi=1000)
+        lot_id, _ = receive_lot(FinishProduct, self.finish_category.pk, 2000, 3)
+        sell_lot(Product, ProductHistory, product.pk, 1)
+        FinishProductHistory.objects.bulk_create([FinishProductHistory(nomi_id=self.finish_category.pk, soni=3)])
+
+        self.assertEqual(product.user, self.user)
+        self.assertEqual(FinishProduct.objects.get(pk=lot_id).user, self.user)
+        self.assertEqual(ProductHistory.objects.get().user, self.user)
+        self.assertEqual(FinishProductHistory.objects.get().user, self.user)
+        self.assertEqual(HistoryRollup.objects.filter(user=self.user).count(), 2)
+
+    def test_tenant_filter_does_not_join_categories(self):
+        for model in (ProductHistory, FinishProductHistory):
+            request = RequestFactory().get('/')
+            request.user = self.user
+            queryset = custom_admin_site._registry[model].get_queryset(request)
+            self.assertNotIn('JOIN', str(queryset.query))
+
+    def test_backfill_migration(self):
+        Product.objects.create(nomi=self.category, soni=5, narxi=1000)
+        ProductHistory.objects.create(nomi=self.category, soni=5, narxi=1000)
+        Product.objects.update(user=None)
+        ProductHistory.objects.update(user=None)
+
+        migration = importlib.import_module('apps.migrations.0010_denormalize_user')
+        migration.backfill_users(django_apps, None)
+        self.assertEqual(Product.objects.get().user_id, self.user.pk)
+        self.assertEqual(ProductHistory.objects.get().user_id, self.user.pk)
+
+
+class ValuationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+
+    def move(self, soni, narxi, status=ProductHistory.StatusType.QABUL, **kwargs):
+        return ProductHistory.objects.create(nomi=self.category, soni=soni, narxi=narxi, status=status, **kwargs)
+
+    def values(self):
+        valuation = CategoryValuation.objects.get(warehouse=1, category_id=self.category.pk)
+        return (valuation.soni, valuation.average_value, valuation.average_cogs, valuation.fifo_value,
+                valuation.fifo_cogs)
+
+    def test_weighted_average_and_fifo(self):
+        self.move(10, 100)
+        self.move(10, 200)
+        self.move(15, 300, ProductHistory.StatusType.CHIQDI)
+        self.assertEqual(self.values(), (5, 750, 2250, 1000, 2000))
+        self.assertEqual(list(FifoLayer.objects.values_list('narxi', 'soni')), [(200, 5)])
+
+        # Qoldiqdan ortiq sotuv sotuv narxida tannarxga yoziladi
+        self.move(10, 300, ProductHistory.StatusType.CHIQDI)
+        self.assertEqual(self.values(), (0, 0, 4500, 0, 4500))
+        self.assertFalse(FifoLayer.objects.exists())
+
+    def test_incremental_state_matches_replay(self):
+        product = Product.objects.create(nomi=self.category, soni=100, narxi=1000)
+        self.move(15, 900)
+        ProductHistory.objects.bulk_create([ProductHistory(nomi=self.category, soni=4, narxi=1100,
+                                                          status=ProductHistory.StatusType.QABUL)])
+        sell_lot(Product, ProductHistory, product.pk, 9)
+        sell_lines([{'warehouse': 1, 'product_id': product.pk, 'amount': 3}], self.user)
+        self.move(2, 700, created_at=date.today() - timedelta(days=60))
+        archive_history(1, date.today())
+
+        self.assertEqual(check(1), [])
+        self.assertEqual(self.values()[0], 15 + 4 - 9 - 3 + 2)
+
+    def test_first_write_upserts_instead_of_replacing_the_row(self):
+        # Parallel birinchi sotuv qatorni bizdan oldin yaratgan, lekin apply uni ko'rmagan
+        with mock.patch.object(valuation, 'recompute', wraps=valuation.recompute) as recompute:
+            CategoryValuation.objects.create(warehouse=1, category_id=self.category.pk, user=self.user)
+            CategoryValuation.objects.filter(category_id=self.category.pk).update(stale=True)
+            with CaptureQueriesContext(connection) as queries:
+                self.move(10, 100)
+        recompute.assert_called_once()
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('DELETE FROM "apps_categoryvaluation"')])
+        self.assertEqual(self.values(), (10, 1000, 0, 1000, 0))
+        self.assertFalse(CategoryValuation.objects.get().stale)
+
+    def test_edit_and_delete_mark_stale(self):
+        receipt = self.move(10, 100)
+        sale = self.move(4, 150, ProductHistory.StatusType.CHIQDI)
+        receipt.soni = 20
+        receipt.save()
+        self.assertTrue(CategoryValuation.objects.get().stale)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('custom_admin:apps_producthistory_valuation'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['totals']['average_value'], 1600)
+        self.assertFalse(CategoryValuation.objects.get().stale)
+
+        sale.delete()
+        self.move(5, 200)  # eskirgan kategoriya keyingi yozuvda qayta hisoblanadi
+        self.assertEqual(self.values(), (25, 3000, 0, 3000, 0))
+
+    def test_recompute_command(self):
+        self.move(10, 100)
+        CategoryValuation.objects.update(fifo_value=1)
+        with self.assertRaises(CommandError):
+            call_command('recompute_valuation', '--check', stdout=io.StringIO())
+        call_command('recompute_valuation', stdout=io.StringIO())
+        call_command('recompute_valuation', '--check', stdout=io.StringIO())
+        self.assertEqual(self.values(), (10, 1000, 0, 1000, 0))
+
+
+class LowStockAlertTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokon')
+        self.category = Category.objects.create(nomi='Un', user=self.user, min_soni=5)
+
+    def receive(self, soni, category=None, model=Product, history_model=ProductHistory, narxi=1000):
+        category = category or self.category
+        lot_id, _ = receive_lot(model, category.pk, narxi, soni)
+        history_model.objects.create(nomi=category, soni=soni, narxi=narxi, status=history_model.StatusType.QABUL)
+        return lot_id
+
+    def sell(self, soni, category=None):
+        lot = Product.objects.filter(nomi=category or self.category).first()
+        sell_lot(Product, ProductHistory, lot.pk, soni)
+
+    def alerts(self):
+        return list(Notification.objects.filter(text__contains='kam qoldi').values_list('text', flat=True))
+
+    def test_alert_fires_once_per_crossing(self):
+        self.receive(10)
+        self.sell(4)
+        self.assertEqual(self.alerts(), [])
+        self.sell(2)
+        self.sell(1)
+        self.assertEqual(self.alerts(), ["⚠️ 1-Sklad: qoldiq kam qoldi\nUn: 4 ta (minimal 5)"])
+
+        self.receive(10)
+        self.assertFalse(CategoryValuation.objects.get().alerted)
+        self.sell(9)
+        self.assertEqual(len(self.alerts()), 2)
+
+    def test_reconcile_repairs_counter_drift(self):
+        self.receive(10)
+        # Hisoblagich partiyalardan ajralib qolgan (masalan, qo'lda tuzatilgan) va partiya tarixdan farq qiladi
+        CategoryValuation.objects.update(soni=100)
+        Product.objects.update(soni=4)
+        ProductHistory.objects.create(nomi=self.category, soni=6, narxi=1000)
+        self.assertEqual(self.alerts(), [])
+
+        reconcile(1, fix=True)
+        valuation = CategoryValuation.objects.get()
+        self.assertEqual((valuation.soni, valuation.alerted), (Product.objects.get().soni, True))
+        self.assertEqual(self.alerts(), ["⚠️ 1-Sklad: qoldiq kam qoldi\nUn: 4 ta (minimal 5)"])
+
+    def test_check_adds_no_queries_to_sell(self):
+        quiet = Category.objects.create(nomi='Tuz', user=self.user)
+        for category in (self.category, quiet):
+            self.receive(100, category)
+        with CaptureQueriesContext(connection) as watched:
+            self.sell(1)
+        with CaptureQueriesContext(connection) as unwatched:
+            self.sell(1, category=quiet)
+        self.assertEqual(len(watched), len(unwatched))
+
+    def test_threshold_change_and_daily_summary(self):
+        self.receive(8)
+        self.category.min_soni = 10
+        self.category.save()
+        self.assertEqual(len(self.alerts()), 1)
+
+        finish_category = FinishCategory.objects.create(nomi='Non', user=self.user, min_soni=2)
+        self.receive(1, finish_category, FinishProduct, FinishProductHistory, narxi=500)
+        call_command('low_stock_summary', stdout=io.StringIO())
+        summary = Notification.objects.get(text__startswith='📋')
+        self.assertEqual(summary.text, "📋 Kam qolgan mahsulotlar\n1-Sklad Un: 8 ta (minimal 10)\n"
+                                       "2-Sklad Non: 1 ta (minimal 2)")
+        self.assertEqual(summary.user, self.user)
+
+
+class ReconcileStockTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokon')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.product = self.receive(1000, 10)
+        sell_lot(Product, ProductHistory, self.product.pk, 3)
+
+    def receive(self, narxi, soni, **kwargs):
+        lot_id, _ = receive_lot(Product, self.category.pk, narxi, soni)
+        ProductHistory.objects.create(nomi=self.category, soni=soni, narxi=narxi,
+                                      status=ProductHistory.StatusType.QABUL, **kwargs)
+        return Product.objects.get(pk=lot_id)
+
+    def test_clean_ledger_including_archive(self):
+        self.receive(1500, 4, created_at=date.today() - timedelta(days=60))
+        archive_history(1, date.today())
+        self.assertEqual(reconcile(1), [])
+
+    def test_reports_and_fixes_drift(self):
+        Product.objects.filter(pk=self.product.pk).update(soni=9)
+        ProductHistory.objects.create(nomi=self.category, soni=5, narxi=2000, status=ProductHistory.StatusType.QABUL)
+        negative = Product.objects.create(nomi=self.category, soni=0, narxi=3000)
+        ProductHistory.objects.create(nomi=self.category, soni=4, narxi=3000)
+
+        report = reconcile(1)
+        self.assertEqual([(row['product_id'], row['soni'], row['expected'], row['action']) for row in report],
+                         [(self.product.pk, 9, 7, 'update'), (negative.pk, 0, -4, 'negative'),
+                          (None, None, 5, 'create')])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).soni, 9)
+
+        reconcile(1, fix=True)
+        self.assertEqual(sorted(Product.objects.values_list('narxi', 'soni', 'user')),
+                         [(1000, 7, self.user.pk), (2000, 5, self.user.pk), (3000, 0, self.user.pk)])
+        self.assertEqual([row['action'] for row in reconcile(1)], ['negative'])
+
+    def test_query_count_does_not_grow_with_lots(self):
+        Product.objects.update(soni=100)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(reconcile(1, fix=True)), 1)
+        for narxi in range(1, 50):
+            self.receive(narxi, 1)
+        Product.objects.update(soni=100)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(len(reconcile(1, fix=True)), 50)
+        self.assertEqual(len(small), len(large))
+
+    def test_command_writes_json_report(self):
+        Product.objects.update(soni=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reconcile.json')
+            call_command('reconcile_stock', '--json', path, stdout=io.StringIO())
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        self.assertEqual(data['fixed'], False)
+        self.assertEqual(data['discrepancies'][0]['expected'], 7)
+
+
+class CategoryAutocompleteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.client.force_login(self.user)
+        Category.objects.bulk_create([Category(nomi=f"Un {i:02}", user=self.user) for i in range(25)])
+        self.rik = Category.objects.create(nomi="Oʻrik  QOQI", user=self.user)
+        Category.objects.create(nomi='Un begona', user=User.objects.create_user('begona'))
+
+    def search(self, warehouse=1, **params):
+        return self.client.get(reverse('category_autocomplete', args=[warehouse]), params)
+
+    def test_normalized_name(self):
+        self.assertEqual(normalize_name("  O‘g`it \t UN "), "o'g'it un")
+        self.assertEqual(self.rik.nomi_norm, "o'rik qoqi")
+        self.assertEqual(Category.objects.get(nomi='Un 00').nomi_norm, 'un 00')
+
+    def test_paginated_prefix_search(self):
+        first = self.search(q='UN').json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(first['results'][0]['text'], 'Un 00')
+        self.assertTrue(first['pagination']['more'])
+        self.assertEqual(first['pagination']['after'], first['results'][-1]['id'])
+        second = self.search(q='un', after=first['pagination']['after']).json()
+        self.assertEqual([row['text'] for row in second['results']], [f"Un {i}" for i in range(20, 25)])
+        self.assertEqual(second['pagination'], {'more': False, 'after': None})
+
+        self.assertEqual(self.search(q="o'rik").json()['results'], [{'id': self.rik.pk, 'text': "Oʻrik  QOQI"}])
+        self.assertEqual(self.search(2, q='un').json()['results'], [])
+        self.client.logout()
+        self.assertEqual(self.search(q='un').status_code, 401)
+
+    def test_keyset_pages_equal_names_without_offset(self):
+        tuz = [Category.objects.create(nomi=nomi, user=self.user).pk for nomi in ('Tuz', 'TUZ', 'tuz ', 'Tuz 2')]
+        seen, after = [], None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                page = autocomplete(1, self.user, 'tuz', after, page_size=2)
+                seen += [row['id'] for row in page['results']]
+                after = page['pagination']['after']
+                if not page['pagination']['more']:
+                    break
+        self.assertEqual(seen, tuz)
+        self.assertFalse([query['sql'] for query in queries if 'OFFSET' in query['sql']])
+
+    def test_receipt_form_does_not_render_categories(self):
+        response = self.client.get(reverse('product_create'))
+        self.assertNotContains(response, 'Un 00')
+        self.assertContains(response, reverse('category_autocomplete', args=[1]))
+
+        other = Category.objects.get(nomi='Un begona')
+        response = self.client.post(reverse('product_create'), {'nomi': other.pk, 'soni': 1, 'narxi': '100'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Product.objects.exists())
+        response = self.client.post(reverse('product_create'), {'nomi': self.rik.pk, 'soni': 0, 'narxi': '100'})
+        self.assertContains(response, f'<option value="{self.rik.pk}" selected>')
+
+    def test_admin_filter_and_search(self):
+        un = Category.objects.get(nomi='Un 03')
+        ProductHistory.objects.create(nomi=un, soni=1, narxi=100)
+        ProductHistory.objects.create(nomi=self.rik, soni=2, narxi=100)
+        url = reverse('custom_admin:apps_producthistory_changelist')
+
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Un 00')
+        response = self.client.get(url, {'nomi__id__exact': un.pk})
+        self.assertContains(response, f'<option value="{un.pk}" selected>Un 03</option>', html=True)
+        self.assertEqual(list(response.context['cl'].result_list), list(ProductHistory.objects.filter(nomi=un)))
+
+        response = self.client.get(url, {'q': 'oʻrik'})
+        self.assertEqual([row.nomi for row in response.context['cl'].result_list], [self.rik])
+
+
+class StockImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dokon')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.product = Product.objects.create(nomi=self.category, soni=5, narxi=1500)
+
+    def test_import_stock_merges_lots(self):
+        created, updated = import_stock([
+            {'sklad': '1', 'nomi': 'Un', 'soni': '3', 'narxi': '1500'},
+            {'sklad': '1', 'nomi': 'Un', 'soni': '2', 'narxi': '1500.00'},
+            {'sklad': '1', 'nomi': 'Guruch', 'soni': '4', 'narxi': '2000'},
+            {'sklad': 2, 'nomi': 'Non', 'soni': 7, 'narxi': 3000},
+        ], self.user)
+
+        self.assertEqual((created, updated), (2, 1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.soni, 10)
+        self.assertEqual(Product.objects.get(nomi__nomi='Guruch').soni, 4)
+        self.assertEqual(FinishProduct.objects.get(nomi__nomi='Non', nomi__user=self.user).soni, 7)
+        self.assertEqual(ProductHistory.objects.filter(status=ProductHistory.StatusType.QABUL).count(), 2)
+        self.assertEqual(HistoryRollup.objects.get(warehouse=1, category_id=self.category.pk).soni, 5)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_names_are_matched_by_normalized_name(self):
+        created, updated = import_stock([
+            {'sklad': '1', 'nomi': ' UN ', 'soni': '3', 'narxi': '1500'},
+            {'sklad': '1', 'nomi': 'Oʻrik', 'soni': '1', 'narxi': '900'},
+            {'sklad': '1', 'nomi': "o'rik", 'soni': '2', 'narxi': '900'},
+        ], self.user)
+
+        self.assertEqual((created, updated), (1, 1))
+        self.assertEqual(Category.objects.filter(user=self.user).count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.soni, 8)
+        self.assertEqual(Product.objects.get(nomi__nomi_norm="o'rik").soni, 3)
+
+    def test_import_history_keeps_dates(self):
+        import_history([{'sklad': '1', 'nomi': 'Un', 'soni': '2', 'narxi': '1500', 'status': 'chiqdi',
+                         'sana': '2024-03-01'}], self.user)
+
+        history = ProductHistory.objects.get()
+        self.assertEqual(str(history.created_at), '2024-03-01')
+        self.assertEqual(history.nomi, self.category)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.soni, 3)
+
+    def test_import_history_applies_to_lots(self):
+        import_history([
+            {'sklad': '1', 'nomi': 'Guruch', 'soni': '10', 'narxi': '2000', 'status': 'qabul', 'sana': '2024-01-05'},
+            {'sklad': '1', 'nomi': 'guruch', 'soni': '4', 'narxi': '2000', 'status': 'chiqdi', 'sana': '2024-02-01'},
+        ], self.user)
+
+        guruch = Product.objects.get(nomi__nomi='Guruch')
+        self.assertEqual(guruch.soni, 6)
+        self.assertFalse([row for row in reconcile(1) if row['category_id'] == guruch.nomi_id])
+
+        with self.assertRaises(StockImportError):
+            import_history([{'sklad': '1', 'nomi': 'Guruch', 'soni': '7', 'narxi': '2000', 'status': 'chiqdi'}],
+                           self.user)
+        guruch.refresh_from_db()
+        self.assertEqual((guruch.soni, ProductHistory.objects.count()), (6, 2))
+
+    def test_receive_lots_rejects_missing_category(self):
+        with self.assertRaises(Category.DoesNotExist), transaction.atomic():
+            receive_lots(Product, [(self.category.pk, 1500, 2), (self.category.pk + 100, 1500, 1)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.soni, 5)
+
+    def test_bad_row_imports_nothing(self):
+        with self.assertRaises(StockImportError):
+            import_stock([{'sklad': '1', 'nomi': 'Un', 'soni': '3'}, {'sklad': '3', 'nomi': 'X', 'soni': '1'}],
+                         self.user)
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class HistoryQueryPlanTest(TestCase):
+    """Admin tarix sahifalarining so'rovlari to'liq jadval skaniga tushmasligi kerak"""
+    FILTERS = [
+        {},
+        {'status__exact': 'chiqdi'},
+        {'created_at__range__gte': '2025-01-01', 'created_at__range__lte': '2025-01-31'},
+        {'created_at__range__gte': '2025-01-01', 'status__exact': 'qabul'},
+        {'q': 'un'},
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.finish_category = FinishCategory.objects.create(nomi='Non', user=self.user)
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assert_no_full_scan(self, queryset, table):
+        if connection.vendor == 'postgresql':
+            full_scan = rf'Seq Scan on {table}\b'
+        else:
+            full_scan = rf'\bSCAN {table}\b'
+        self.assertNotRegex(self.explain(queryset), re.compile(full_scan))
+
+    def test_changelist_queries_use_indexes(self):
+        for model, category in ((ProductHistory, self.category), (FinishProductHistory, self.finish_category)):
+            model_admin = custom_admin_site._registry[model]
+            for params in self.FILTERS + [{'nomi__id__exact': category.pk}]:
+                request = RequestFactory().get('/', params)
+                request.user = self.user
+                cl = model_admin.get_changelist_instance(request)
+                with self.subTest(model=model.__name__, params=params):
+                    self.assert_no_full_scan(cl.queryset, model._meta.db_table)
+                    self.assert_no_full_scan(cl.queryset[:cl.list_per_page], model._meta.db_table)
+
+    def test_category_search_uses_index(self):
+        for warehouse, table in ((1, 'apps_category'), (2, 'apps_finishcategory')):
+            queryset = search_categories(warehouse, self.user, 'un')[:21]
+            with self.subTest(table=table):
+                self.assert_no_full_scan(queryset, table)
+                if connection.vendor == 'sqlite':
+                    # SQLite'da opclasses e'tiborsiz: ikkala indeks ham (user, nomi_norm, rowid) tartibida
+                    plan = self.explain(queryset)
+                    self.assertRegex(plan, rf"INDEX {table[5:]}_(search|prefix)_idx")
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_date_filter_uses_composite_index(self):
+        queryset = ProductHistory.objects.filter(user=self.user, created_at__gte='2025-01-01', status='qabul')
+        if connection.vendor == 'sqlite':
+            plan = self.explain(queryset)
+            self.assertIn('producthistory_user_status_idx', plan)
+            self.assertNotIn('apps_category', plan)
+
+
+class KeysetChangeListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('admin')
+        category = Category.objects.create(nomi='Un', user=self.user)
+        today = date.today()
+        ProductHistory.objects.bulk_create([
+            ProductHistory(nomi=category, soni=1, narxi=1000, created_at=today - timedelta(days=i % 7))
+            for i in range(250)
+        ])
+        self.client.force_login(self.user)
+        self.url = reverse('custom_admin:apps_producthistory_changelist')
+
+    def get(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl'], [query['sql'] for query in queries]
+
+    def test_pages_walk_the_whole_ledger_without_offset(self):
+        seen, params, page_queries = [], {}, []
+        while True:
+            cl, queries = self.get(params)
+            seen.extend((row.created_at, row.pk) for row in cl.result_list)
+            page_queries.append(len(queries))
+            self.assertFalse([sql for sql in queries if 'OFFSET' in sql])
+            if not cl.next_cursor:
+                break
+            params = {'after': cl.next_cursor}
+
+        self.assertEqual(len(page_queries), 3)
+        self.assertEqual(seen, sorted(ProductHistory.objects.values_list('created_at', 'pk'), reverse=True))
+        # Chuqur sahifa birinchisidan qimmat emas (oxirgi sahifada "keyingi bormi" so'rovi yo'q)
+        self.assertLessEqual(page_queries[1], page_queries[0])
+        self.assertLessEqual(page_queries[2], page_queries[0])
+
+    def test_count_is_cached_and_exact_on_request(self):
+        cl, queries = self.get()
+        self.assertEqual((cl.result_count, cl.count_exact), (250, True))
+        self.assertEqual(sum('COUNT(' in sql for sql in queries), 1)
+
+        ProductHistory.objects.filter(pk=ProductHistory.objects.first().pk).delete()
+        cl, queries = self.get({'after': cl.next_cursor})
+        self.assertEqual((cl.result_count, cl.count_exact), (250, False))
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        self.assertIn('count=exact', cl.exact_count_url())
+
+        cl, _ = self.get({'after': cl.next_cursor, 'count': 'exact'})
+        self.assertEqual((cl.result_count, cl.count_exact), (249, True))
+
+    def test_category_names_are_joined_not_fetched_per_row(self):
+        Category.objects.bulk_create([Category(nomi=f'Kategoriya {i}', user=self.user) for i in range(20)])
+        ProductHistory.objects.bulk_create([ProductHistory(nomi=category, soni=1, narxi=1000)
+                                            for category in Category.objects.filter(nomi__startswith='Kategoriya')])
+        cl, queries = self.get()
+
+        # 21 xil kategoriya sahifada, lekin so'rovlar soni qatorlarga bog'liq emas:
+        # sessiya, foydalanuvchi, sahifa, "keyingi bormi", COUNT, arxiv chegarasi va jami summa
+        self.assertEqual(len({row.nomi_id for row in cl.result_list}), 21)
+        self.assertEqual(len(queries), 7)
+        self.assertFalse([sql for sql in queries if 'FROM "apps_category" WHERE' in sql])
+
+    def test_single_page_is_counted_without_count_query(self):
+        cl, queries = self.get({'created_at__range__gte': date.today().isoformat()})
+        self.assertEqual(cl.result_count, len(cl.result_list))
+        self.assertFalse(cl.multi_page)
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+
+
+class DatabaseSettingsTest(TestCase):
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("faqat SQLite uchun")
+        # WAL odatda yoqiq, SQLITE_WAL=0 bilan DELETE
+        pragmas = settings.SQLITE_PRAGMAS
+        synchronous = {'NORMAL': 1, 'FULL': 2}[pragmas['synchronous']]
+        with connection.cursor() as cursor:
+            for pragma, expected in (('journal_mode', pragmas['journal_mode'].lower()),
+                                     ('synchronous', synchronous),
+                                     ('busy_timeout', pragmas['busy_timeout'])):
+                cursor.execute(f"PRAGMA {pragma}")
+                self.assertEqual(cursor.fetchone()[0], expected)
+
+
+class ConcurrentSellTest(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user('kassir')
+        self.product = Product.objects.create(nomi=Category.objects.create(nomi='Un', user=user), soni=25)
+        self.finish_product = FinishProduct.objects.create(
+            nomi=FinishCategory.objects.create(nomi='Non', user=user), soni=25)
+
+    def sell_many(self, model, history_model, product_id, sells):
+        def sell(_):
+            try:
+                sell_lot(model, history_model, product_id, 2)
+                return True
+            except OutOfStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return sum(pool.map(sell, range(sells)))
+
+    def test_parallel_sells_never_oversell(self):
+        for model, history_model, product in (
+                (Product, ProductHistory, self.product),
+                (FinishProduct, FinishProductHistory, self.finish_product)):
+            sold = self.sell_many(model, history_model, product.pk, sells=40)
+
+            product.refresh_from_db()
+            self.assertEqual(sold, 12)
+            self.assertEqual(product.soni, 1)
+            self.assertEqual(history_model.objects.count(), 12)
+
+    def test_parallel_receipts_create_one_lot(self):
+        def receive(_):
+            try:
+                receive_lot(Product, self.product.nomi_id, 500, 3)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(receive, range(20)))
+
+        self.assertEqual(list(Product.objects.filter(narxi=500).values_list('soni', flat=True)), [60])
+
+
+@override_settings(PRODUCT_LIST_PAGE_SIZE=2)
+class ProductListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('kassir')
+        self.client.force_login(self.user)
+
+    def add_products(self, count):
+        for i in range(count):
+            Product.objects.create(nomi=Category.objects.create(nomi=f"Un {i}", user=self.user), soni=5)
+            FinishProduct.objects.create(nomi=FinishCategory.objects.create(nomi=f"Non {i}", user=self.user), soni=5)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('product_list'))
+        return len(captured)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_products(1)
+        few = self.count_queries()
+        self.add_products(5)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_keyset_pages_and_json(self):
+        self.add_products(3)
+        Product.objects.create(nomi=Category.objects.create(nomi='Tugagan', user=self.user), soni=0)
+
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual([p.nomi.nomi for p in response.context['products']], ['Un 0', 'Un 1'])
+        cursor = response.context['products_next']
+
+        data = self.client.get(reverse('product_list'), {'format': 'json', 'warehouse': 1, 'after': cursor}).json()
+        self.assertEqual([item['nomi'] for item in data['items']], ['Un 2'])
+        self.assertIsNone(data['next'])
+
+        data = self.client.get(reverse('product_list'), {'format': 'json'}).json()
+        self.assertEqual(len(data['finish_product']['items']), 2)
+        self.assertIsNotNone(data['finish_product']['next'])
+
+
+@override_settings(TELEGRAM_CHAT_ID='42')
+class ProductListCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('kassir')
+        self.category = Category.objects.create(nomi='Un', user=self.user)
+        self.product = Product.objects.create(nomi=self.category, soni=10)
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('product_list'), **headers)
+        return response, [q['sql'] for q in captured if 'apps_product' in q['sql']]
+
+    def test_unchanged_list_is_304_without_product_queries(self):
+        response, queries = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+        etag = response['ETag']
+
+        response, queries = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, [])
+
+        response, queries = self.get()
+        self.assertEqual((response.status_code, queries), (200, []))
+
+    def test_writes_bump_the_version(self):
+        etag = self.get()[0]['ETag']
+        self.client.post(reverse('sell_product'), data=json.dumps({'product_id': self.product.pk, 'decrease_amount': 3}),
+                         content_type='application/json')
+
+        response, _ = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products'][0].soni, 7)
+
+        etag = response['ETag']
+        self.client.post(reverse('product_create'), {'nomi': self.category.pk, 'soni': 2, 'narxi': '0'})
+        self.assertNotEqual(self.get()[0]['ETag'], etag)
+
+    def test_category_rename_bumps_the_version(self):
+        self.get()
+        self.category.nomi = 'Un (oliy nav)'
+        self.category.save()
+
+        self.assertEqual(self.get()[0].context['products'][0].nomi.nomi, 'Un (oliy nav)')
+
+
+@override_settings(TELEGRAM_CHAT_ID='42')
+class StockEventsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('kassir')
+        self.product = Product.objects.create(nomi=Category.objects.create(nomi='Un', user=self.user), soni=10)
+
+    def test_sell_is_published_after_commit(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post(reverse('sell_product'), content_type='application/json',
+                                 data=json.dumps({'product_id': self.product.pk, 'decrease_amount': 3}))
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        [(user_id, event)] = [c.args for c in publish.call_args_list]
+        self.assertEqual(user_id, self.user.pk)
+        self.assertEqual(event['version'], str(stock_version(self.user.pk)))
+        self.assertEqual(event['items'], [{'warehouse': 1, 'product_id': self.product.pk, 'soni': 7,
+                                           'nomi': 'Un', 'narxi': '0.00'}])
+
+    def test_anonymous_stream_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('stock_events')).status_code, 401)
+
+    def test_wsgi_does_not_open_stream(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('stock_events')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('product_list')), 'EventSource')
+
+    async def test_asgi_page_opens_stream(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('product_list'))
+        self.assertContains(response, "new EventSource('%s')" % reverse('stock_events'))
+
+    async def test_stream_delivers_events_from_other_threads(self):
+        version = await sync_to_async(stock_version)(self.user.pk)
+        events = stream(self.user.pk, version, keepalive=0.01)
+        self.assertIn('event: hello\ndata: {"version": "%s"}' % version, await events.__anext__())
+        self.assertEqual(await events.__anext__(), ": ping\n\n")
+
+        await sync_to_async(cache.incr)(VERSION_KEY.format(self.user.pk))
+        event = {'version': str(version + 1), 'items': []}
+        await asyncio.to_thread(broker.publish, self.user.pk, event)
+        self.assertEqual(await events.__anext__(), format_event(event, 'stock'))
+        self.assertEqual(await events.__anext__(), ": ping\n\n")
+
+        await events.aclose()
+        self.assertNotIn(self.user.pk, broker.subscribers)
+
+    async def test_change_in_other_worker_triggers_reload(self):
+        version = await sync_to_async(stock_version)(self.user.pk)
+        events = stream(self.user.pk, version, keepalive=0.01)
+        await events.__anext__()
+
+        # Boshqa jarayondagi sotuv: broker orqali hodisa kelmaydi, faqat umumiy keshdagi versiya oshadi
+        await sync_to_async(cache.incr)(VERSION_KEY.format(self.user.pk))
+        self.assertEqual(await events.__anext__(), 'event: reload\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await events.__anext__()
+        self.assertNotIn(self.user.pk, broker.subscribers)
+
+
+class QueryTimingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kassir')
+        for nomi in ('Un', 'Shakar', 'Tuz'):
+            Product.objects.create(nomi=Category.objects.create(nomi=nomi, user=self.user), soni=5)
+        self.client.force_login(self.user)
+
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('product_list')))
+
+    @override_settings(PERF_INSTRUMENTATION=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=[\d.]+$')
+
+    @override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=10 ** 6, PERF_N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_sql_is_logged_with_call_site(self):
+        def view(request):
+            for product in Product.objects.all():
+                product.nomi.nomi  # har mahsulot uchun alohida so'rov
+            return HttpResponse()
+
+        with self.assertLogs('apps.perf', 'WARNING') as logs:
+            QueryTimingMiddleware(view)(RequestFactory().get('/product_list'))
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['path'], entry['queries']), ('/product_list', 4))
+        [repeated] = entry['n_plus_one']
+        self.assertEqual(repeated['count'], 3)
+        self.assertIn('apps/tests.py', repeated['call_site'])
+        self.assertLessEqual(len(entry['slowest']), settings.PERF_SLOWEST_QUERIES)
+
+
+@override_settings(DATABASE_REPLICA='replica')
+class ReplicaRouterTest(SimpleTestCase):
+    def read_db(self, request=None):
+        return ProductHistory.objects.all().db
+
+    def test_reads_go_to_replica_only_inside_use_replica(self):
+        self.assertEqual(self.read_db(), 'default')
+        with use_replica():
+            self.assertEqual(self.read_db(), 'replica')
+            self.assertEqual(router.db_for_write(ProductHistory), 'default')
+        with pin_to_primary(), use_replica():
+            self.assertEqual(self.read_db(), 'default')
+
+    def test_replica_reads_keeps_writes_on_primary(self):
+        view = replica_reads(lambda request: HttpResponse(self.read_db()))
+        self.assertEqual(view(RequestFactory().get('/')).content, b'replica')
+        self.assertEqual(view(RequestFactory().post('/')).content, b'default')
+
+    def test_pin_middleware(self):
+        middleware = PrimaryPinMiddleware(replica_reads(lambda request: HttpResponse(self.read_db())))
+        factory = RequestFactory()
+
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies['pin_primary']['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(middleware(factory.get('/', HTTP_COOKIE='pin_primary=1')).content, b'default')
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+
+    def test_pin_middleware_async(self):
+        async def view(request):
+            with use_replica():
+                return HttpResponse(self.read_db())
+
+        middleware = PrimaryPinMiddleware(view)
+        self.assertEqual(asyncio.run(middleware(RequestFactory().post('/'))).content, b'default')
+        self.assertEqual(asyncio.run(middleware(RequestFactory().get('/'))).content, b'replica')
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_pin_middleware_is_off_without_replica(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            PrimaryPinMiddleware(lambda request: HttpResponse())
+
+
+@skipUnless(settings.DATABASE_REPLICA, "DB_REPLICA_NAME yoki DB_REPLICA_HOST berilmagan")
+@override_settings(TELEGRAM_CLIENT='apps.notifications.FakeTelegramClient', TELEGRAM_CHAT_ID='42')
+class ReplicaIntegrationTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin')
+        self.product = Product.objects.create(nomi=Category.objects.create(nomi='Un', user=self.user), soni=5)
+        self.client.force_login(self.user)
+
+    def replica_queries(self, call):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = call()
+        return response, len(queries)
+
+    def test_admin_history_reads_from_replica_and_sells_from_primary(self):
+        response, count = self.replica_queries(lambda: self.client.post(
+            reverse('sell_product'), {'product_id': self.product.pk, 'decrease_amount': 1},
+            content_type='application/json'))
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(count, 0)
+
+        self.client.cookies.pop('pin_primary')
+        url = reverse('custom_admin:apps_producthistory_changelist')
+        response, count = self.replica_queries(lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(count, 0)
+
+        content, count = self.replica_queries(lambda: b''.join(self.client.get(url + 'export/').streaming_content))
+        self.assertIn(b'Un', content)
+        self.assertGreater(count, 0)
+
+
+@override_settings(TELEGRAM_CHAT_ID='42')
+class BenchmarkTest(TransactionTestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(percentile([], 95), 0)
+
+    def test_every_endpoint_runs_without_errors(self):
+        data = seed(users=1, categories=2, lots=1, history=50)
+
+        results = [run(name, data, clients=2, requests=3) for name in ENDPOINTS]
+        for result in results:
+            self.assertEqual((result['requests'], result['errors']), (3, 0), result['endpoint'])
+            self.assertGreater(result['queries_avg'], 0)
+
+
+@override_settings(TELEGRAM_CHAT_ID='42', NOTIFICATION_MAX_ATTEMPTS=2)
+class NotificationWorkerTest(TestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(0)
+
+    def test_burst_is_sent_as_one_digest(self):
+        for i in range(3):
+            enqueue(f"xabar {i}")
+
+        client = FakeTelegramClient()
+        sent = process_batch(client=client, limiter=self.limiter)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(len(client.outbox), 1)
+        self.assertEqual(client.outbox[0]['text'], "xabar 0\n\nxabar 1\n\nxabar 2")
+        self.assertFalse(Notification.objects.exclude(status=Notification.StatusType.SENT).exists())
+
+    def test_rejected_digest_falls_back_to_single_messages(self):
+        enqueue("*Un* sotildi", parse_mode='Markdown')
+        broken = enqueue("Nomi: Un_oliy", parse_mode='Markdown')
+        enqueue("*Tuz* sotildi", parse_mode='Markdown')
+
+        client = FakeTelegramClient()
+        self.assertEqual(process_batch(client=client, limiter=self.limiter), 2)
+        self.assertEqual([message['text'] for message in client.outbox], ["*Un* sotildi", "*Tuz* sotildi"])
+        broken.refresh_from_db()
+        self.assertEqual((broken.status, broken.attempts), (Notification.StatusType.PENDING, 1))
+        self.assertIn("can't parse entities", broken.last_error)
+
+    def test_failure_is_retried_with_backoff(self):
+        notification = enqueue("xabar")
+
+        self.assertEqual(process_batch(client=FakeTelegramClient(fail=1), limiter=self.limiter), 0)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.StatusType.PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+        # kutish vaqti o'tmaguncha qayta yuborilmaydi
+        self.assertEqual(process_batch(client=FakeTelegramClient(), limiter=self.limiter), 0)
+
+        Notification.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        process_batch(client=FakeTelegramClient(fail=1), limiter=self.limiter)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.StatusType.FAILED)
+
+    def test_rate_limiter_spaces_sends(self):
+        sleeps = []
+        limiter = RateLimiter(2, sleep=sleeps.append, clock=lambda: sum(sleeps))
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(sleeps, [0.5, 0.5])
@@ -1,13 +1,17 @@
 from django.urls import path
 
 from apps.views import ProductListView, sell_product, ProductFormView, sell_finish_product, \
-    FinishProductFormView, AdminFormView
+    FinishProductFormView, AdminFormView, sell_batch, stock_events, category_autocomplete, transfer
 
 urlpatterns = [
     path('',AdminFormView.as_view(), name='login'),
     path('product_list', ProductListView.as_view(), name='product_list'),
+    path('stock-events/', stock_events, name='stock_events'),
     path('sell-product/', sell_product, name='sell_product'),
+    path('sell-batch/', sell_batch, name='sell_batch'),
+    path('transfer/', transfer, name='transfer'),
     path('product_create', ProductFormView.as_view(), name='product_create'),
     path('sell_finish_product/', sell_finish_product, name='sell_finish_product'),
     path('finish_product_create', FinishProductFormView.as_view(), name='finish_product_create'),
+    path('categories/<int:warehouse>/autocomplete/', category_autocomplete, name='category_autocomplete'),
 ]
@@ -0,0 +1,280 @@
+import heapq
+from collections import deque
+from decimal import Decimal
+
+from django.db import transaction
+
+from .alerts import update_alerts
+from .archive import unpack
+from .models import CategoryValuation, FifoLayer, HistoryArchive, ProductHistory
+from .services import WAREHOUSES
+
+CENT = Decimal('0.01')
+FIELDS = ('soni', 'average_value', 'average_cogs', 'fifo_value', 'fifo_cogs')
+
+
+def warehouse_of(history_model):
+    return next(w for w, (_, model) in WAREHOUSES.items() if model is history_model)
+
+
+def average_sell(soni, value, amount, narxi):
+    """
+    O'rtacha tortilgan usulda chiqim. Qoldiqdan ortiq qism (tarixda qabuli yo'q tovar)
+    sotuv narxida tannarxga yoziladi, qoldiq manfiy bo'lmaydi.
+    Qaytaradi: (yangi soni, yangi qiymat, tannarx)
+    """
+    covered = min(amount, max(soni, 0))
+    if covered == soni:
+        cost = value
+    else:
+        cost = (value * covered / soni).quantize(CENT)
+    return soni - covered, value - cost, cost + (amount - covered) * narxi
+
+
+class Position:
+    """
+    Bitta kategoriyaning holati. To'liq qayta hisoblashda ham, yangi qatorlarni qo'shishda ham
+    bir xil hisob ishlatiladi, shuning uchun ikkalasi bir xil natija beradi.
+    """
+
+    def __init__(self, soni=0, average_value=0, average_cogs=0, fifo_value=0, fifo_cogs=0, layers=()):
+        self.soni = soni
+        self.average_value = Decimal(average_value)
+        self.average_cogs = Decimal(average_cogs)
+        self.fifo_value = Decimal(fifo_value)
+        self.fifo_cogs = Decimal(fifo_cogs)
+        self.layers = deque([history_id, narxi, soni] for history_id, narxi, soni in layers)
+
+    def apply(self, history_id, status, soni, narxi):
+        if status == ProductHistory.StatusType.QABUL:
+            self.soni += soni
+            self.average_value += soni * narxi
+            self.fifo_value += soni * narxi
+            self.layers.append([history_id, narxi, soni])
+            return
+        self.soni, self.average_value, cost = average_sell(self.soni, self.average_value, soni, narxi)
+        self.average_cogs += cost
+        while soni and self.layers:
+            layer = self.layers[0]
+            take = min(soni, layer[2])
+            self.fifo_cogs += take * layer[1]
+            self.fifo_value -= take * layer[1]
+            layer[2] -= take
+            soni -= take
+            if not layer[2]:
+                self.layers.popleft()
+        # Qabuli tarixda yo'q qism sotuv narxida
+        self.fifo_cogs += soni * narxi
+
+    def values(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+def ledger(warehouse, user_id=None, category_ids=None):
+    """
+    Kategoriyalar tarixi yozilish (id) tartibida, arxivlangan qatorlar bilan birga:
+    ``(category_id, history_id, status, soni, narxi)`` — category_id, keyin id bo'yicha saralangan
+    """
+    _, history_model = WAREHOUSES[warehouse]
+    archives = HistoryArchive.objects.filter(warehouse=warehouse)
+    hot = history_model.objects.filter(nomi__isnull=False)
+    if user_id is not None:
+        archives, hot = archives.filter(user_id=user_id), hot.filter(user_id=user_id)
+    if category_ids is not None:
+        hot = hot.filter(nomi_id__in=category_ids)
+
+    archived = []
+    for archive in archives.iterator():
+        for record in unpack(archive.data):
+            if not record['nomi_id']:
+                continue
+            category_id = int(record['nomi_id'])
+            if category_ids is None or category_id in category_ids:
+                archived.append((category_id, int(record['id']), record['status'], record['soni'],
+                                 record['narxi']))
+    archived.sort()
+    rows = hot.order_by('nomi_id', 'id').values_list('nomi_id', 'id', 'status', 'soni', 'narxi')
+    return heapq.merge(archived, rows.iterator(chunk_size=2000))
+
+
+def replay(warehouse, user_id=None, category_ids=None):
+    """Butun tarixdan hisoblash: {category_id: Position}"""
+    positions = {}
+    for category_id, history_id, status, soni, narxi in ledger(warehouse, user_id, category_ids):
+        positions.setdefault(category_id, Position()).apply(history_id, status, soni, Decimal(narxi))
+    return positions
+
+
+def lock_valuations(warehouse, categories):
+    """
+    Kategoriyalar valuation qatorlarini qulflash, yo'qlarini avval yaratib: ``INSERT ... ON CONFLICT
+    DO NOTHING`` parallel birinchi yozuvlarda unique cheklovga urilmaydi — ikkinchi tranzaksiya
+    birinchisining commitini kutadi va o'sha qatorni qulflaydi.
+    categories: {category_id: (user_id, min_soni)}. Qaytaradi: {category_id: CategoryValuation}
+    """
+    CategoryValuation.objects.bulk_create([
+        CategoryValuation(warehouse=warehouse, category_id=category_id, user_id=user_id, threshold=min_soni)
+        for category_id, (user_id, min_soni) in categories.items()
+    ], batch_size=2000, ignore_conflicts=True)
+    return {valuation.category_id: valuation for valuation in CategoryValuation.objects
+            .select_for_update().filter(warehouse=warehouse, category_id__in=categories)}
+
+
+def save_positions(warehouse, positions, categories, valuations):
+    """
+    Hisoblangan holatni qulflangan valuation qatorlariga yozish, FIFO qatlamlari almashtiriladi.
+    categories: {category_id: (user_id, min_soni)}, valuations: ``lock_valuations`` natijasi
+    """
+    updated = []
+    for category_id, position in positions.items():
+        valuation = valuations[category_id]
+        valuation.user_id, valuation.threshold = categories[category_id]
+        valuation.stale = False
+        for field, value in position.values().items():
+            setattr(valuation, field, value)
+        updated.append(valuation)
+    update_alerts(warehouse, updated)
+    CategoryValuation.objects.bulk_update(updated, FIELDS + ('user_id', 'threshold', 'stale', 'alerted'),
+                                          batch_size=2000)
+    FifoLayer.objects.filter(warehouse=warehouse, category_id__in=positions).delete()
+    FifoLayer.objects.bulk_create([
+        FifoLayer(warehouse=warehouse, category_id=category_id, history_id=history_id, narxi=narxi, soni=soni)
+        for category_id, position in positions.items() for history_id, narxi, soni in position.layers
+    ], batch_size=2000)
+
+
+def categories_of(warehouse, category_ids):
+    _, history_model = WAREHOUSES[warehouse]
+    category_model = history_model._meta.get_field('nomi').related_model
+    return {category_id: (user_id, min_soni) for category_id, user_id, min_soni in
+            category_model.objects.filter(id__in=category_ids).values_list('id', 'user_id', 'min_soni')}
+
+
+def recompute(warehouse, category_ids):
+    """
+    Kategoriyalarni (yangi, tahrir yoki o'chirishdan keyin) tarixidan qayta hisoblash. Tarix
+    qatorlar qulflangandan keyin o'qiladi, shuning uchun parallel yozuv ham hisobga tushadi.
+    """
+    category_ids = set(category_ids)
+    categories = categories_of(warehouse, category_ids)
+    with transaction.atomic():
+        valuations = lock_valuations(warehouse, categories)
+        positions = replay(warehouse, category_ids=set(categories))
+        save_positions(warehouse, {category_id: positions.get(category_id, Position()) for category_id in categories},
+                       categories, valuations)
+        # O'chirilgan kategoriyalar
+        deleted = category_ids - set(categories)
+        CategoryValuation.objects.filter(warehouse=warehouse, category_id__in=deleted).delete()
+        FifoLayer.objects.filter(warehouse=warehouse, category_id__in=deleted).delete()
+
+
+def apply(history_model, rows):
+    """
+    Yangi tarix qatorlarini (yozilish tartibida) kategoriyalar holatiga qo'shish. Qatorlar soni
+    qancha bo'lmasin so'rovlar soni o'zgarmaydi: valuation qatorlari bitta SELECT ... FOR UPDATE
+    bilan qulflanadi, FIFO qatlamlari faqat chiqim bo'lgan kategoriyalar uchun o'qiladi.
+    """
+    warehouse = warehouse_of(history_model)
+    rows = sorted((row for row in rows if row.nomi_id), key=lambda row: row.pk)
+    if not rows:
+        return
+    with transaction.atomic(savepoint=False):
+        category_ids = {row.nomi_id for row in rows}
+        valuations = {valuation.category_id: valuation for valuation in CategoryValuation.objects
+                      .select_for_update().filter(warehouse=warehouse, category_id__in=category_ids)}
+        # Yangi (ehtimol oldingi tarixi bor) yoki eskirgan kategoriyalar tarixidan hisoblanadi,
+        # bu shu qatorlarni ham o'z ichiga oladi
+        fresh = {category_id for category_id in category_ids
+                 if category_id not in valuations or valuations[category_id].stale}
+        rows = [row for row in rows if row.nomi_id not in fresh]
+
+        selling = {row.nomi_id for row in rows if row.status != ProductHistory.StatusType.QABUL}
+        stored = {}  # (category_id, history_id) -> FifoLayer
+        for layer in (FifoLayer.objects.filter(warehouse=warehouse, category_id__in=selling)
+                      .order_by('category_id', 'history_id') if selling else ()):
+            stored[(layer.category_id, layer.history_id)] = layer
+
+        positions = {}
+        for category_id in category_ids - fresh:
+            valuation = valuations[category_id]
+            positions[category_id] = Position(
+                valuation.soni, valuation.average_value, valuation.average_cogs, valuation.fifo_value,
+                valuation.fifo_cogs, [(history_id, layer.narxi, layer.soni)
+                                      for (layer_category, history_id), layer in stored.items()
+                                      if layer_category == category_id])
+        for row in rows:
+            positions[row.nomi_id].apply(row.pk, row.status, row.soni, Decimal(row.narxi))
+
+        save_changes(warehouse, valuations, positions, stored)
+    if fresh:
+        recompute(warehouse, fresh)
+
+
+def save_changes(warehouse, valuations, positions, stored):
+    """Position'lardagi o'zgarishlarni yozish: har tur o'zgarish uchun bitta so'rov"""
+    for category_id, position in positions.items():
+        for field, value in position.values().items():
+            setattr(valuations[category_id], field, value)
+    if positions:
+        # Chegara qatorning o'zida, shuning uchun sotuvda qo'shimcha o'qish yo'q
+        updated = [valuations[category_id] for category_id in positions]
+        update_alerts(warehouse, updated)
+        CategoryValuation.objects.bulk_update(updated, FIELDS + ('alerted',))
+
+    remaining = {(category_id, layer[0]): layer[2]
+                 for category_id, position in positions.items() for layer in position.layers}
+    consumed = [layer.pk for key, layer in stored.items() if key not in remaining]
+    changed = []
+    for key, layer in stored.items():
+        if key in remaining and remaining[key] != layer.soni:
+            layer.soni = remaining[key]
+            changed.append(layer)
+    created = [
+        FifoLayer(warehouse=warehouse, category_id=category_id, history_id=history_id, narxi=narxi, soni=soni)
+        for category_id, position in positions.items() for history_id, narxi, soni in position.layers
+        if (category_id, history_id) not in stored
+    ]
+    if consumed:
+        FifoLayer.objects.filter(pk__in=consumed).delete()
+    if changed:
+        FifoLayer.objects.bulk_update(changed, ['soni'])
+    if created:
+        FifoLayer.objects.bulk_create(created)
+
+
+def mark_stale(history_model, rows):
+    """O'tgan qator tahrirlandi yoki o'chirildi: kategoriya keyingi yozuv yoki hisobotda qayta hisoblanadi"""
+    category_ids = {row.nomi_id for row in rows if row.nomi_id}
+    if category_ids:
+        CategoryValuation.objects.filter(warehouse=warehouse_of(history_model),
+                                         category_id__in=category_ids).update(stale=True)
+
+
+def refresh_stale(warehouse, user=None):
+    stale = CategoryValuation.objects.filter(warehouse=warehouse, stale=True)
+    if user is not None:
+        stale = stale.filter(user=user)
+    category_ids = list(stale.values_list('category_id', flat=True))
+    if category_ids:
+        recompute(warehouse, category_ids)
+
+
+def check(warehouse, fix=False):
+    """
+    Yig'ilgan holatni butun tarixdan qayta hisoblangani bilan solishtirish.
+    Qaytaradi: farq qilgan kategoriyalar ro'yxati [(category_id, saqlangan, hisoblangan), ...]
+    """
+    positions = replay(warehouse)
+    stored = {valuation.category_id: valuation
+              for valuation in CategoryValuation.objects.filter(warehouse=warehouse)}
+    mismatches = []
+    for category_id in set(positions) | set(stored):
+        expected = positions.get(category_id, Position()).values()
+        valuation = stored.get(category_id)
+        actual = {field: getattr(valuation, field) for field in FIELDS} if valuation else Position().values()
+        if actual != expected:
+            mismatches.append((category_id, actual, expected))
+    if fix and mismatches:
+        # O'chirilgan kategoriyalarning qolgan qatorlari ham tozalansin
+        recompute(warehouse, set(positions) | set(stored))
+    return mismatches
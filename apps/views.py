@@ -1,18 +1,27 @@
 import json
-import os
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.views.generic import ListView, FormView
-import telebot
-from .form import ProductForm, FinishProductModelForm, AdminLoginForm
+from .db import replica_reads
+from .events import lot_item, publish_stock, stream
+from .form import ProductForm, FinishProductForm, AdminLoginForm
 from .models import Product, Category, FinishProduct, FinishCategory, ProductHistory, FinishProductHistory
-from dotenv import load_dotenv
-
-load_dotenv()
+from .notifications import enqueue, escape_markdown
+from .pagination import keyset_page, parse_cursor
+from .search import autocomplete
+from .services import WAREHOUSES, OutOfStock, BatchError, sell_lot, sell_lines, receive_lot, transfer_lines
+from .stock_cache import bump_stock_version, cached_stock, stock_version
 
 
 class AdminFormView(FormView):
@@ -35,21 +44,138 @@ class AdminFormView(FormView):
             return self.form_invalid(form)
 
 
+def stock_etag(request, *args, **kwargs):
+    return f"{request.user.pk}-{stock_version(request.user.pk)}"
+
+
+@method_decorator([cache_control(private=True, no_cache=True), condition(etag_func=stock_etag)], name='get')
 class ProductListView(LoginRequiredMixin, ListView):
+    """
+    Ikkala skladdagi mavjud partiyalar, kategoriyasi bilan birga (sahifadagi so'rovlar
+    soni qatorlar soniga bog'liq emas). Har sklad ``?after=`` / ``?finish_after=``
+    kursori bilan sahifalanadi; ``?format=json`` sahifaning JS'i uchun JSON qaytaradi.
+
+    Ma'lumot foydalanuvchining qoldiq versiyasi ostida keshlanadi, ETag ham shu versiyadan:
+    qoldiq o'zgarmagan bo'lsa brauzer 304 oladi va mahsulotlar bazadan o'qilmaydi.
+    """
     login_url = reverse_lazy('login')
     template_name = 'product_list.html'
     context_object_name = 'products'
 
     def get_queryset(self):
-        return Product.objects.filter(soni__gt=0, nomi__user=self.request.user)
+        return Product.objects.filter(soni__gt=0, user=self.request.user).select_related('nomi')
+
+    def get_finish_queryset(self):
+        return FinishProduct.objects.filter(soni__gt=0, user=self.request.user).select_related('nomi')
+
+    def get_pages(self):
+        size = settings.PRODUCT_LIST_PAGE_SIZE
+        after = parse_cursor(self.request.GET.get('after'))
+        finish_after = parse_cursor(self.request.GET.get('finish_after'))
+        return cached_stock(self.request.user.pk, f"pages:{size}:{after}:{finish_after}", lambda: {
+            'products': keyset_page(self.get_queryset(), after, size),
+            'finish_product': keyset_page(self.get_finish_queryset(), finish_after, size),
+        })
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse(self.get_json())
+        return super().get(request, *args, **kwargs)
+
+    def get_json(self):
+        """``?warehouse=1`` yoki ``2`` bo'lsa faqat shu sklad, aks holda ikkalasi"""
+        warehouse = self.request.GET.get('warehouse')
+        if warehouse in ('1', '2'):
+            size = settings.PRODUCT_LIST_PAGE_SIZE
+            after = parse_cursor(self.request.GET.get('after'))
+            queryset = self.get_queryset() if warehouse == '1' else self.get_finish_queryset()
+            return cached_stock(self.request.user.pk, f"json:{warehouse}:{size}:{after}",
+                                lambda: serialize_page(*keyset_page(queryset, after, size)))
+        return {key: serialize_page(*page) for key, page in self.get_pages().items()}
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        context['finish_product'] = FinishProduct.objects.filter(soni__gt=0, nomi__user=self.request.user)
+        # Versiya ma'lumotdan oldin o'qiladi: oraliqda yozuv bo'lsa sahifa eskiroq versiyani ko'rsatadi
+        # va SSE ``hello`` uni yangilashga majbur qiladi
+        context['stock_version'] = stock_version(self.request.user.pk)
+        # Jonli yangilanishlar faqat ASGI ostida: WSGI'da har SSE ulanishi thread'ni butunlay band qiladi
+        context['live_updates'] = isinstance(self.request, ASGIRequest)
+        for key, (items, next_cursor) in self.get_pages().items():
+            context[key] = items
+            context[f'{key}_next'] = next_cursor
         return context
 
 
+def serialize_page(items, next_cursor):
+    return {
+        'items': [{'id': p.pk, 'nomi': p.nomi.nomi, 'narxi': str(p.narxi), 'soni': p.soni} for p in items],
+        'next': next_cursor,
+    }
+
+
+async def stock_events(request):
+    """
+    Server-sent events: foydalanuvchi qoldig'idagi o'zgarishlar (sotuv, qabul) commitdan
+    keyin ochiq mahsulotlar sahifalariga yuboriladi. ASGI ostida har ulanish faqat
+    korutina — thread band qilinmaydi. WSGI (runserver) ostida oqim ochilmaydi: 204 javobidan
+    keyin brauzer qayta ulanmaydi.
+    """
+    user_id = await sync_to_async(lambda: request.user.pk if request.user.is_authenticated else None)()
+    if user_id is None:
+        return JsonResponse({'success': False, 'error': 'Avval tizimga kiring!'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    version = await sync_to_async(stock_version)(user_id)
+    response = StreamingHttpResponse(stream(user_id, version), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx oqimni buferlamasin
+    return response
+
+
+@replica_reads
+def category_autocomplete(request, warehouse):
+    """
+    Kategoriyalar bo'yicha qidiruv (select2 formatida): ``?q=`` nomi boshlanishi,
+    ``?after=`` oldingi javobdagi ``pagination.after`` kursori.
+    Qabul formalari va admin filtrlari barcha kategoriyalarni sahifaga chiqarmasdan shundan foydalanadi.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Avval tizimga kiring!'}, status=401)
+    if warehouse not in WAREHOUSES:
+        return JsonResponse({'success': False, 'error': 'Sklad topilmadi!'}, status=404)
+    after = parse_cursor(request.GET.get('after'))
+    return JsonResponse(autocomplete(warehouse, request.user, request.GET.get('q', ''), after))
+
+
+def sell_text(warehouse, product, amount):
+    if warehouse == 1:
+        return (f"🛒 *1-Sklad Maxsulot Chiqdi* \n"
+                f"📦 Nomi: {escape_markdown(product.nomi.nomi)}\n"
+                f"💸 Narxi : {product.narxi}\n"
+                f"↗️ Chiqib ketdi: {amount}\n"
+                f"🔢 Qoldi: {product.soni}")
+    return (f"🛒 *2 - Skald Maxsulot Chiqdi \n"
+            f"🅿️Nomi : {product.nomi.nomi}\n"
+            f"💸Narxi : {product.narxi}\n"
+            f"↗️Chiqib ketdi : {amount}\n"
+            f"🔢Qoldi : {product.soni}\n")
+
+
+def sell_one(warehouse, product_id, amount):
+    """Sotuv, tarix, Telegram navbati va jonli yangilanish — bitta tranzaksiyada"""
+    model, history_model = WAREHOUSES[warehouse]
+    with transaction.atomic():
+        product = sell_lot(model, history_model, product_id, amount)
+
+        enqueue(sell_text(warehouse, product, amount), user_id=product.nomi.user_id,
+                parse_mode="Markdown" if warehouse == 1 else '')
+        bump_stock_version(product.nomi.user_id)
+        publish_stock(product.nomi.user_id, [lot_item(warehouse, product.pk, product.soni, product.nomi.nomi,
+                                                       product.narxi)])
+    return product
+
+
 @csrf_exempt
 def sell_product(request):
     if request.method == "POST":
@@ -58,35 +184,12 @@ def sell_product(request):
             product_id = data.get('product_id')  # Mahsulot ID
             decrease_amount = int(data.get('decrease_amount'))  # Kamaytirish miqdori
 
-            product = Product.objects.get(id=product_id)
-
-            if decrease_amount > product.soni:
-                return JsonResponse({'success': False, 'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'})
-
-            product.soni -= decrease_amount
-            product.save()
-
-            text = (f"🛒 *1-Sklad Maxsulot Chiqdi* \n"
-                    f"📦 Nomi: {product.nomi.nomi}\n"
-                    f"💸 Narxi : {product.narxi}\n"
-                    f"↗️ Chiqib ketdi: {decrease_amount}\n"
-                    f"🔢 Qoldi: {product.soni}")
-
-            bot = telebot.TeleBot(os.getenv('TOKEN'))
-            try:
-                bot.send_message(chat_id=os.getenv('ID'), text=text, parse_mode="Markdown")
-            except Exception as e:
-                return JsonResponse({'success': False, 'error': f"Telegramga ulanishda xatolik: {str(e)}"})
-
-            ProductHistory.objects.create(
-                nomi=product.nomi,
-                soni=decrease_amount,
-                status=ProductHistory.StatusType.CHIQDI,
-                narxi=product.narxi
-            )
+            product = sell_one(1, product_id, decrease_amount)
 
             return JsonResponse({'success': True, 'new_quantity': product.soni})
 
+        except OutOfStock:
+            return JsonResponse({'success': False, 'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'})
         except Product.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Mahsulot topilmadi!'})
         except json.JSONDecodeError:
@@ -97,6 +200,101 @@ def sell_product(request):
     return JsonResponse({'success': False, 'error': 'Faqat POST so‘rov qabul qilinadi!'})
 
 
+@csrf_exempt
+def sell_batch(request):
+    """
+    Foydalanuvchining bir nechta mahsulotini bitta so'rovda chiqarish:
+    {"items": [{"warehouse": 1, "product_id": 5, "amount": 2}, ...]}. Boshqa foydalanuvchi
+    partiyasi "topilmadi" deb qaytadi.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Avval tizimga kiring!'}, status=401)
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body)
+            with transaction.atomic():
+                sold = sell_lines(data.get('items'), request.user)
+
+                texts, items = {}, {}
+                for warehouse, product, amount in sold:
+                    items.setdefault(product.nomi.user_id, []).append(
+                        lot_item(warehouse, product.pk, product.soni, product.nomi.nomi, product.narxi))
+                    texts.setdefault(product.nomi.user_id, []).append(
+                        f"📦 {warehouse}-Sklad {product.nomi.nomi} ({product.narxi}): "
+                        f"↗️ {amount}, 🔢 Qoldi: {product.soni}")
+                for user_id, lines in texts.items():
+                    enqueue("🛒 Maxsulotlar chiqdi\n" + "\n".join(lines), user_id=user_id)
+                bump_stock_version(*texts)
+                for user_id, user_items in items.items():
+                    publish_stock(user_id, user_items)
+
+            return JsonResponse({'success': True, 'items': [
+                {'warehouse': warehouse, 'product_id': product.pk, 'new_quantity': product.soni}
+                for warehouse, product, amount in sold
+            ]})
+
+        except BatchError as e:
+            return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors})
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Yaroqsiz JSON maʼlumot!'})
+
+    return JsonResponse({'success': False, 'error': 'Faqat POST so‘rov qabul qilinadi!'})
+
+
+@csrf_exempt
+def transfer(request):
+    """
+    Partiyalarni skladdan skladga bitta so'rov va bitta tranzaksiyada o'tkazish:
+    {"from": 1, "to": 2, "items": [{"product_id": 5, "amount": 2}, ...]} (standart: 1 -> 2).
+    Faqat foydalanuvchining o'z partiyalari o'tkaziladi, unga bitta umumiy xabar yuboriladi.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Avval tizimga kiring!'}, status=401)
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body)
+            source, target = int(data.get('from', 1)), int(data.get('to', 2))
+            with transaction.atomic():
+                moved = transfer_lines(data.get('items'), request.user, source, target)
+
+                texts, items = {}, {}
+                for product, lot, amount in moved:
+                    user_id = product.nomi.user_id
+                    items.setdefault(user_id, {})[(source, product.pk)] = lot_item(
+                        source, product.pk, product.soni, product.nomi.nomi, product.narxi)
+                    items[user_id][(target, lot.pk)] = lot_item(target, lot.pk, lot.soni, lot.nomi.nomi, lot.narxi)
+                    texts.setdefault(user_id, []).append(
+                        f"📦 {product.nomi.nomi} ({product.narxi}): 🔁 {amount}, "
+                        f"🔢 {source}-Sklad: {product.soni}, {target}-Sklad: {lot.soni}")
+                for user_id, lines in texts.items():
+                    enqueue(f"🚚 {source}-Skladdan {target}-Skladga o'tkazildi\n" + "\n".join(lines), user_id=user_id)
+                bump_stock_version(*texts)
+                for user_id, user_items in items.items():
+                    publish_stock(user_id, list(user_items.values()))
+
+            return JsonResponse({'success': True, 'items': [
+                {'product_id': product.pk, 'new_quantity': product.soni, 'target_id': lot.pk,
+                 'target_quantity': lot.soni}
+                for product, lot, amount in moved
+            ]})
+
+        except BatchError as e:
+            return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors})
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Yaroqsiz JSON maʼlumot!'})
+
+    return JsonResponse({'success': False, 'error': 'Faqat POST so‘rov qabul qilinadi!'})
+
+
+def selected_category(form):
+    if not form.is_bound:
+        return None
+    try:
+        return form.fields['nomi'].queryset.filter(pk=int(form.data.get('nomi'))).first()
+    except (TypeError, ValueError):
+        return None
+
+
 class ProductFormView(LoginRequiredMixin, FormView):
     login_url = reverse_lazy('login')
     template_name = 'product_add.html'
@@ -106,48 +304,41 @@ class ProductFormView(LoginRequiredMixin, FormView):
     def get_queryset(self):
         return Category.objects.filter(user=self.request.user)
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['nomi'].queryset = self.get_queryset()
+        return form
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.filter(
-            user=self.request.user)
+        # Kategoriyalar autocomplete orqali yuklanadi, sahifada faqat xato bilan qaytgan tanlov
+        context['selected_category'] = selected_category(context['form'])
         return context
 
+    @transaction.atomic
     def form_valid(self, form):
-        nomi_id = form.cleaned_data['nomi']
+        category = form.cleaned_data['nomi']
         soni = form.cleaned_data['soni']
         narxi = form.cleaned_data['narxi']
 
-        product = Product.objects.filter(nomi_id=nomi_id, narxi=narxi).first()
-
-        if product:
-            product.soni += soni
-            product.save()
-            text = (f"🛒 *1 - Sklat Maxsulot qushildi \n"
-                    f"🅿️Nomi : {product.nomi.nomi}\n"
-                    f"💸Narxi : {product.narxi}\n"
-                    f"↘️Qushildi : {soni}\n"
-                    f"🔢Jami : {product.soni}")
-        else:
-            category = Category.objects.filter(id=nomi_id.pk).first()
-            if category:
-                text = (f"🛒 *1 - Sklad Maxsulot qushildi \n"
-                        f"🅿️Nomi : {category.nomi}\n"
-                        f"💸Narxi: {narxi}\n"
-                        f"↘️Qushildi : {soni}\n"
-                        f"🔢Jami : {soni}")
-            else:
-                text = "Kategoriya topilmadi."
-            form.save()
-        TOKEN = os.getenv('TOKEN')
-        bot = telebot.TeleBot(TOKEN)
-        ProductHistory.objects.create(nomi=nomi_id, soni=soni, status=ProductHistory.StatusType.QABUL, narxi=narxi)
-
         try:
-            bot.send_message(chat_id=(os.getenv('ID')), text=text)
-        except Exception as e:
-            pass
-
-        form.instance.user = self.request.user  # Foydalanuvchining ma'lumotlarini formaga qo'shish
+            lot_id, jami = receive_lot(Product, category.pk, narxi, soni)
+        except type(category).DoesNotExist:
+            # Kategoriya forma tekshirilgandan keyin o'chirilgan
+            form.add_error('nomi', 'Kategoriya topilmadi!')
+            response = self.form_invalid(form)
+            response.status_code = 400
+            return response
+        ProductHistory.objects.create(nomi=category, soni=soni, status=ProductHistory.StatusType.QABUL, narxi=narxi)
+
+        text = (f"🛒 *1 - Sklad Maxsulot qushildi \n"
+                f"🅿️Nomi : {category.nomi}\n"
+                f"💸Narxi : {narxi}\n"
+                f"↘️Qushildi : {soni}\n"
+                f"🔢Jami : {jami}")
+        enqueue(text, user_id=self.request.user.pk)
+        bump_stock_version(category.user_id)
+        publish_stock(category.user_id, [lot_item(1, lot_id, jami, category.nomi, narxi)])
 
         return super().form_valid(form)
 
@@ -160,30 +351,12 @@ def sell_finish_product(request):
             product_id = data.get('product_id')  # Mahsulot ID
             decrease_amount = int(data.get('decrease_amount'))  # Kamaytirish miqdori
 
-            product = FinishProduct.objects.get(id=product_id)
-
-            if decrease_amount > product.soni:
-                return JsonResponse({'success': False, 'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'})
-
-            product.soni -= decrease_amount
-            product.save()
-            text = (f"🛒 *2 - Skald Maxsulot Chiqdi \n"
-                    f"🅿️Nomi : {product.nomi.nomi}\n"
-                    f"💸Narxi : {product.narxi}\n"
-                    f"↗️Chiqib ketdi : {decrease_amount}\n"
-                    f"🔢Qoldi : {product.soni}\n")
-
-            bot = telebot.TeleBot(os.getenv('TOKEN'))
-            FinishProductHistory.objects.create(nomi=product.nomi, soni=decrease_amount,
-                                                status=FinishProductHistory.StatusType.CHIQDI, narxi=product.narxi)
-
-            try:
-                bot.send_message(chat_id=(os.getenv('ID')), text=text)
-            except Exception as e:
-                return e
+            product = sell_one(2, product_id, decrease_amount)
 
             return JsonResponse({'success': True, 'new_quantity': product.soni})  # Yangi miqdorni qaytarish
-        except Product.DoesNotExist:
+        except OutOfStock:
+            return JsonResponse({'success': False, 'error': 'Kiritilgan miqdor mavjuddan oshib ketdi!'})
+        except FinishProduct.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Mahsulot topilmadi!'})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -193,54 +366,52 @@ def sell_finish_product(request):
 class FinishProductFormView(LoginRequiredMixin, FormView):
     login_url = reverse_lazy('login')
     template_name = 'finish_product_add.html'
-    form_class = FinishProductModelForm
+    form_class = FinishProductForm
     success_url = reverse_lazy('product_list')
 
     def get_queryset(self):
         return FinishCategory.objects.filter(user=self.request.user)
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['nomi'].queryset = self.get_queryset()
+        return form
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = self.get_queryset()  # get_queryset metodidan foydalanish
+        # Kategoriyalar autocomplete orqali yuklanadi, sahifada faqat xato bilan qaytgan tanlov
+        context['selected_category'] = selected_category(context['form'])
         return context
 
+    @transaction.atomic
     def form_valid(self, form):
         # Formadan to'plangan ma'lumotlarni olish
-        nomi_id = form.cleaned_data['nomi']
+        category = form.cleaned_data['nomi']
         soni = form.cleaned_data['soni']
         narxi = form.cleaned_data['narxi']
 
-        product = FinishProduct.objects.filter(nomi_id=nomi_id, narxi=narxi).first()
-
-        if product:
-            product.soni += soni
-            product.save()
-            text = (f"🛒 *2 - Sklad Maxsulot qushildi \n"
-                    f"🅿️Nomi : {product.nomi.nomi}\n"
-                    f"💸Narxi : {narxi}\n"
-                    f"↘️Qushildi : {soni}\n"
-                    f"🔢Jami : {product.soni}\n"
-                    )
-        else:
-            finish_category = FinishCategory.objects.filter(id=nomi_id.id).first()  # .id ni to'g'riladik
-            text = (f"🛒 *2 - Sklad Maxsulot qushildi \n"
-                    f"🅿️Nomi : {finish_category.nomi}\n"
-                    f"💸Narxi : {narxi}\n"
-                    f"↘️Qushildi : {soni}\n"
-                    f"🔢Jami : {soni}\n")
-            form.save()
-
+        try:
+            lot_id, jami = receive_lot(FinishProduct, category.pk, narxi, soni)
+        except type(category).DoesNotExist:
+            # Kategoriya forma tekshirilgandan keyin o'chirilgan
+            form.add_error('nomi', 'Kategoriya topilmadi!')
+            response = self.form_invalid(form)
+            response.status_code = 400
+            return response
         FinishProductHistory.objects.create(
-            nomi=nomi_id,
+            nomi=category,
             soni=soni,
             status=FinishProductHistory.StatusType.QABUL,
             narxi=narxi
         )
 
-        bot = telebot.TeleBot(os.getenv('TOKEN'))
-        try:
-            bot.send_message(chat_id=os.getenv('ID'), text=text)
-        except Exception as e:
-            pass
+        text = (f"🛒 *2 - Sklad Maxsulot qushildi \n"
+                f"🅿️Nomi : {category.nomi}\n"
+                f"💸Narxi : {narxi}\n"
+                f"↘️Qushildi : {soni}\n"
+                f"🔢Jami : {jami}\n")
+        enqueue(text, user_id=self.request.user.pk)
+        bump_stock_version(category.user_id)
+        publish_stock(category.user_id, [lot_item(2, lot_id, jami, category.nomi, narxi)])
 
         return super().form_valid(form)